@@ -4,14 +4,17 @@
 # when a field is missing. This can all be improved.
 
 import json
-from os.path import join, normpath, dirname
+from os.path import join, normpath, dirname, relpath
 from collections import namedtuple
 
 ModelConfig = namedtuple('ModelConfig', [
 # Configuration values related to the composition of the model.
 
     'alphabet',
-    # A string containing the entire alphabet of the model.
+    # A string containing the entire alphabet of the model, or a list of
+    # tokens (e.g. ["A", "B", ..., "THE ", "ING", ...]). Each token is a single
+    # step of the model, so multi-character tokens cut the number of steps per
+    # message. A token can only contain the boundary as its last character.
 
     'nodes',
     # The number of nodes in the hidden layer of the the LSTM.
@@ -26,8 +29,33 @@ ModelConfig = namedtuple('ModelConfig', [
     'weights_file',
     # The path to the file containing the model's weights. When training, the
     # weights will be stored here.
+
+    'backend',
+    # Optional (default: "lstm")
+    # The kind of model. "lstm" is the recurrent neural network. "ngram" is a
+    # table of character n-gram counts, which is orders of magnitude faster to
+    # train and predict with, but models the domain far less convincingly.
+    # "trace" replays predictions recorded from another model (see
+    # `tracing.py`), and its weights_file is the trace.
+
+    'order',
+    # Optional (default: 5)
+    # The number of preceding characters an "ngram" model predicts from.
+
+    'smoothing',
+    # Optional (default: 1.0)
+    # How strongly an "ngram" model blends in the predictions of shorter
+    # contexts. Larger values favor shorter contexts.
 ])
 
+MODEL_DEFAULTS = {
+    'backend': 'lstm',
+    'order': 5,
+    'smoothing': 1.0,
+}
+
+BACKENDS = ('lstm', 'ngram', 'trace')
+
 EncodingConfig = namedtuple('EncodingConfig', [
 # Configuration values for encoding sequences.
 
@@ -51,8 +79,31 @@ EncodingConfig = namedtuple('EncodingConfig', [
     'novelty',
     # The novelty (a.k.a. temperature) to use when normalizing prediction
     # weights. A smaller number will make the predictions more conservative.
+
+    'weight_bits',
+    # Optional (default: 32)
+    # The width of each encoded weight in bits. One of 8, 16, 24 or 32. Smaller
+    # widths shrink the ciphertext, but quantize the model's predictions more
+    # coarsely. The alphabet can't be larger than 2^weight_bits.
+
+    'precision',
+    # Optional (default: "float64")
+    # How predictions are turned into weights. "float64" normalizes them in
+    # double precision and rounds them into integers one by one. "float32" is
+    # a faster, vectorized path that works in single precision and fixed-point
+    # integers. The two produce slightly different weights, so ciphertexts
+    # can only be decrypted with the precision they were encrypted with.
 ])
 
+ENCODING_DEFAULTS = {
+    'weight_bits': 32,
+    'precision': 'float64',
+}
+
+PRECISIONS = ('float64', 'float32')
+
+WEIGHT_BITS = (8, 16, 24, 32)
+
 TrainingConfig = namedtuple('TrainingConfig', [
 # Configuration values for training the model.
 
@@ -64,8 +115,57 @@ TrainingConfig = namedtuple('TrainingConfig', [
 
     'epochs',
     # The number of epochs (complete passes of data) to train on.
+
+    'mode',
+    # Optional (default: "windows")
+    # How the data is fed to the model. "windows" trains on every overlapping
+    # window of sequence_length characters. "streams" feeds the data as
+    # contiguous parallel streams to a stateful model that learns from every
+    # character, which needs far less compute per epoch.
+
+    'streams',
+    # Optional (default: batch_size)
+    # The number of parallel streams in "streams" mode.
+
+    'steps',
+    # Optional (default: sequence_length)
+    # The number of characters per stream in each batch in "streams" mode.
+    # Gradients are truncated at this length, but state carries over.
+
+    'workers',
+    # Optional (default: 1)
+    # The number of processes to train with in "windows" mode. Each worker
+    # trains its own copy of the model on a shard of the data, and the copies
+    # are averaged every `sync_steps` batches.
+
+    'sync_steps',
+    # Optional (default: 100)
+    # The number of batches each worker trains on between averaging weights.
+
+    'sample_length',
+    # Optional (default: 50)
+    # The length of the sample printed after each epoch. 0 disables sampling.
+
+    'keep_checkpoints',
+    # Optional (default: None)
+    # The number of per-epoch checkpoints (weights_file.N) to keep alongside
+    # the latest weights_file. If None, only the latest is written. Either
+    # way, the weights with the lowest validation loss are also kept in
+    # weights_file.best.
 ])
 
+TRAINING_DEFAULTS = {
+    'mode': 'windows',
+    'streams': None,
+    'steps': None,
+    'workers': 1,
+    'sync_steps': 100,
+    'sample_length': 50,
+    'keep_checkpoints': None,
+}
+
+TRAINING_MODES = ('windows', 'streams')
+
 TransformationsConfig = namedtuple('TransformationsConfig', [
 # Configuration values describing transformations for data input to the model.
 # Note: Translations are ran before substitutions.
@@ -100,7 +200,7 @@ class ValidationError(Exception):
     """ Exception thrown on validation issues. """
     pass
 
-def build_namedtuple(constructor, values, optional):
+def build_namedtuple(constructor, values, optional, defaults=None):
     """ Given a namedtuple constructor and a dictionary, this ensures that
     the dictionary has the fields required for the namedtuple and then
     constructs it.
@@ -109,7 +209,7 @@ def build_namedtuple(constructor, values, optional):
     keys.
 
     If a key is missing and `optional` is not True, then a validation error is
-    raised.
+    raised, unless the key has a value in `defaults`.
 
     Example:
         >> Foo = namedtuple('Foo', ['x', 'y'])
@@ -121,6 +221,9 @@ def build_namedtuple(constructor, values, optional):
         >> build_namedtuple(Foo, values, optional=True)
         Foo(x=1, y=None)
 
+        >> build_namedtuple(Foo, values, optional=False, defaults={'y': 2})
+        Foo(x=1, y=2)
+
     Args:
         constructor (namedtuple constructor): The namedtuple to build.
 
@@ -130,16 +233,19 @@ def build_namedtuple(constructor, values, optional):
         namedtuple to be present in `values`. If True, then missing fields
         default to None.
 
+        defaults (dict, optional): Values to use for missing fields.
+
     Returns:
         Instantiated tuple.
 
     Raises:
         ValidationError: On missing fields when `optional` is False.
     """
+    defaults = defaults or {}
     for field in constructor._fields:
-        if not optional and field not in values:
+        if not optional and field not in values and field not in defaults:
             raise ValidationError("Field '%s' is  missing from '%s'" % (field, constructor.__name__))
-    return constructor(**{k:values.get(k, None) for k in constructor._fields})
+    return constructor(**{k:values.get(k, defaults.get(k, None)) for k in constructor._fields})
 
 def Config(kv):
     """ Given a dictionary of key/values, creates a Config object from those
@@ -155,22 +261,88 @@ def Config(kv):
         ValidationError: If a required field is missing.
 
         ValidationError: If an invalid boundary character is provided.
+
+        ValidationError: If an invalid token is in the alphabet.
+
+        ValidationError: If an invalid backend or n-gram order is provided.
+
+        ValidationError: If an invalid weight width is provided.
+
+        ValidationError: If an invalid precision is provided.
+
+        ValidationError: If an invalid training mode is provided.
+
+        ValidationError: If an invalid number of checkpoints to keep is
+            provided.
     """
-    constructors = [('model'          , ModelConfig          , False),
-                    ('encoding'       , EncodingConfig       , False),
-                    ('training'       , TrainingConfig       , False),
-                    ('transformations', TransformationsConfig, True )]
+    constructors = [('model'          , ModelConfig          , False, MODEL_DEFAULTS   ),
+                    ('encoding'       , EncodingConfig       , False, ENCODING_DEFAULTS),
+                    ('training'       , TrainingConfig       , False, TRAINING_DEFAULTS),
+                    ('transformations', TransformationsConfig, True , None             )]
 
-    tuples = {key: build_namedtuple(constructor, kv[key], optional)
-              for (key, constructor, optional) in constructors if key in kv}
+    tuples = {key: build_namedtuple(constructor, kv[key], optional, defaults)
+              for (key, constructor, optional, defaults) in constructors if key in kv}
 
     config = build_namedtuple(ConfigConstructor, tuples, optional=False)
 
     if config.model.boundary not in config.model.alphabet:
         raise ValidationError("The boundary must be a character present in the alphabet.")
 
+    if not isinstance(config.model.alphabet, str):
+        _validate_tokens(config.model.alphabet, config.model.boundary)
+
+    if config.model.backend not in BACKENDS:
+        raise ValidationError("The backend must be one of %s." % (BACKENDS,))
+
+    if config.model.backend == 'ngram':
+        # N-gram contexts are numbered with 64-bit integers. See `ngram.py`.
+        max_order = 0
+        while (len(config.model.alphabet) + 1) ** (max_order + 1) < 2 ** 63:
+            max_order += 1
+
+        if not 0 <= config.model.order <= max_order:
+            raise ValidationError("The order must be between 0 and %s for this alphabet." % (max_order))
+
+    weight_bits = config.encoding.weight_bits
+    if weight_bits not in WEIGHT_BITS:
+        raise ValidationError("The weight_bits must be one of %s." % (WEIGHT_BITS,))
+
+    if len(config.model.alphabet) > 2 ** weight_bits:
+        raise ValidationError("The alphabet is too large for weights of %s bits." % (weight_bits))
+
+    if config.encoding.precision not in PRECISIONS:
+        raise ValidationError("The precision must be one of %s." % (PRECISIONS,))
+
+    if config.training.mode not in TRAINING_MODES:
+        raise ValidationError("The training mode must be one of %s." % (TRAINING_MODES,))
+
+    if config.training.workers > 1 and config.training.mode != 'windows':
+        raise ValidationError("Training with multiple workers requires the 'windows' mode.")
+
+    if config.training.keep_checkpoints != None and config.training.keep_checkpoints < 1:
+        raise ValidationError("The keep_checkpoints must be greater than 0.")
+
     return config
 
+def _validate_tokens(tokens, boundary):
+    """ Validates an alphabet of multi-character tokens. """
+    if len(boundary) != 1:
+        raise ValidationError("The boundary must be a single character.")
+
+    if any(not isinstance(token, str) or len(token) == 0 for token in tokens):
+        raise ValidationError("Every token in the alphabet must be a non-empty string.")
+
+    if len(set(tokens)) != len(tokens):
+        raise ValidationError("The tokens in the alphabet must be unique.")
+
+    if any(boundary in token[:-1] for token in tokens):
+        raise ValidationError("The boundary can only be the last character of a token.")
+
+    # `Tokenizer` falls back on single characters, since it doesn't backtrack.
+    missing = sorted(set(c for token in tokens for c in token) - set(tokens))
+    if len(missing) > 0:
+        raise ValidationError("Every character of a token must also be a token. Missing: %s" % (missing,))
+
 def load_config(config_file):
     """ Reads a json file and constructs a Config object from it.
 
@@ -198,3 +370,26 @@ def load_config(config_file):
         raw['model']['weights_file'] = normalized
 
     return Config(raw)
+
+def save_config(config, config_file):
+    """ Writes a Config object to a json file that `load_config` can read.
+
+    The weights file is written relative to the config file's directory.
+
+    Args:
+        config (Config): The config to write.
+
+        config_file (string): The path to write the json file to.
+    """
+    raw = config_values(config)
+    weights_file = raw['model']['weights_file']
+    raw['model']['weights_file'] = relpath(weights_file, dirname(config_file) or '.')
+
+    with open(config_file, 'w') as config_handle:
+        json.dump(raw, config_handle, indent=2)
+        config_handle.write('\n')
+
+def config_values(config):
+    """ Returns the values of a Config object as a dictionary of sections,
+    which `Config` can build the same config from. """
+    return {key: dict(section._asdict()) for (key, section) in config._asdict().items()}
@@ -0,0 +1,108 @@
+""" Trains a small, fast student model to mimic a larger teacher model. """
+import numpy as np
+from collections import namedtuple
+from util.math import cross_entropy, kl_divergence
+
+DistillationReport = namedtuple('DistillationReport', [
+# How closely a student's predictions match its teacher's, on held out data.
+# All values are in nats per token (i.e. per character for alphabets of single
+# characters).
+
+    'cross_entropy',
+    # The cross-entropy of the student's predictions relative to the
+    # teacher's.
+
+    'kl_divergence',
+    # The KL divergence of the student's predictions from the teacher's. This
+    # is 0 if the student predicts exactly what the teacher does.
+
+    'entropy',
+    # The entropy of the teacher's predictions. The lowest cross-entropy the
+    # student can reach.
+])
+
+def distill(teacher, student, data, batch_size=1024):
+    """Trains the student on the teacher's predictions for each character of
+    the data (i.e. its soft targets) instead of the characters themselves.
+
+    Soft targets carry far more information per character than the one-hot
+    characters do, which lets a much smaller model (e.g. an LSTM with fewer
+    nodes, or an n-gram table) recover most of the teacher's predictive
+    quality. The student's training config decides the epochs, batch size and
+    the share of the data held out to compare the two models on.
+
+    Example:
+        >> report = distill(load_model("big.json"), load_model("small.json"), data)
+        >> report.kl_divergence
+        0.043
+
+    Args:
+        teacher (Model): The trained model to learn from.
+
+        student (Model): The model to train. It must have the same alphabet as
+            the teacher.
+
+        data (string): The data to train on. It's tokenized with the
+            teacher's transformations.
+
+        batch_size (int, optional): The number of predictions to make at a
+            time with each model.
+
+    Returns (DistillationReport):
+        How closely the student matches the teacher on the held out data, or
+        on all of the data if none is held out.
+
+    Raises:
+        ValueError: If the models' alphabets differ.
+
+        ValueError: If the data is too short to predict any characters.
+    """
+    if teacher.config.model.alphabet != student.config.model.alphabet:
+        raise ValueError("The student's alphabet must match the teacher's.")
+
+    tokens = teacher.tokenize(data)
+    start = max(teacher.config.model.sequence_length, student.config.model.sequence_length)
+    if len(tokens) <= start:
+        raise ValueError("The data must be longer than the models' sequence length.")
+
+    targets = predictions(teacher, tokens, start, len(tokens), batch_size)
+    count = len(tokens) - start
+    split = start + count - int(count * student.config.training.validation_split)
+    student.train_targets(tokens[:split], targets[:split - start], start)
+
+    evaluated = split if split < len(tokens) else start
+    expected = targets[evaluated - start:]
+    actual = predictions(student, tokens, evaluated, len(tokens), batch_size)
+    return DistillationReport(cross_entropy(expected, actual),
+                              kl_divergence(expected, actual),
+                              cross_entropy(expected, expected))
+
+def predictions(model, tokens, start, end, batch_size=1024):
+    """Returns the model's (novelty-free) predictions for each token of the
+    data from `start` to `end`, given the sequence_length tokens that precede
+    it.
+
+    Args:
+        model (Model): The model to predict with.
+
+        tokens (list): The data, already tokenized.
+
+        start (int): The index of the first token to predict. It must be at
+            least the model's sequence_length.
+
+        end (int): The index after the last token to predict.
+
+        batch_size (int, optional): The number of predictions to make at a
+            time.
+
+    Returns (numpy.array):
+        A row of probabilities for each predicted token.
+    """
+    sequence_length = model.config.model.sequence_length
+    alphabet_size = len(model.config.model.alphabet)
+
+    rows = [np.zeros((0, alphabet_size))]
+    for first in range(start, end, batch_size):
+        sequences = [tokens[i - sequence_length : i] for i in range(first, min(end, first + batch_size))]
+        rows.append(np.array(model.predict_batch(sequences, 1.0)))
+    return np.concatenate(rows)
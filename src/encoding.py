@@ -1,10 +1,15 @@
-from util.packing import unpack_ints, pack_ints
+from util.packing import unpack_ints, unpack_ints_stream, pack_ints
+from math import gcd
+from time import perf_counter
 from util.randoms import random_ints
-from util.lists import take, to_generator
-from util.modeling import tabulate, recite
-from util.padding import pad, unpad
-
-def encode(model, text, block_size=16):
+from util.lists import take, to_generator, split_after
+from util.modeling import recite, recite_many, weight_size, max_weight
+from util.padding import tabulate_padded_with_report, unpad
+from util.tokenization import ends_token
+from parallel import map_with_model
+from telemetry import EncodingStats, PredictionCounter
+
+def encode(model, text, block_size=16, pool=None):
     """Encodes a list of values into a list of approximately uniformly random
     weights as determined by the model's predictions for each value in
     `values`.
@@ -12,7 +17,9 @@ def encode(model, text, block_size=16):
     The higher the model's prediction accuracy, the more uniformly random the
     output weights will be.
 
-    The length of the encoded bytes will be a multiple of `block_size`.
+    The length of the encoded bytes will be a multiple of `block_size`. If the
+    model's weight size doesn't divide `block_size` (e.g. 24-bit weights), the
+    output is padded to the least common multiple of the two instead.
 
     Example:
         >> decode(model, encode(model, "foobar", 16))
@@ -27,6 +34,10 @@ def encode(model, text, block_size=16):
         block_size (int, optional): The output will be padded to be a multiple
             of `block_size`.
 
+        pool (InitializationPool, optional): A pool of precomputed initial
+            sequences. If provided, one is taken from the pool instead of
+            being generated inline.
+
     Returns (bytes):
         A byte array containing the weights used to encode the text.
 
@@ -34,19 +45,92 @@ def encode(model, text, block_size=16):
         ValueError: If `text` contains an item that isn't in the `model`'s
             alphabet.
 
+        ValueError: If `pool` belongs to a different model.
+
         Exception: If padding the encoded plaintext fails. This is a
             non-deterministic process. The probability of this happening is
             highly unlikely, but not impossible. If your model has a boundary
             that occurs with a low-probability and you're getting this
             exception, increase your model's max_padding_trials attribute.
     """
-    randoms = random_ints() # Infinite stream of random ints
-    (initial_weights, initial_sequence) = _initialize(model, randoms)
+    (encoded, _) = encode_with_stats(model, text, block_size, pool)
+    return encoded
+
+def encode_with_stats(model, text, block_size=16, pool=None):
+    """Same as `encode`, but also reports what encoding the text took.
+
+    Example:
+        >> (encoded, stats) = encode_with_stats(model, "foobar")
+        >> (stats.padding_trials, stats.expansion_ratio)
+        (2, 42.67)
+
+    Returns (tuple(bytes, EncodingStats)):
+        The encoded weights, and the stats of encoding them.
+
+    Raises:
+        See `encode`.
+    """
+    if pool != None and pool.model is not model:
+        raise ValueError("The initialization pool belongs to a different model.")
+
+    start = perf_counter()
+    tokens = model.tokenize(text)
+    (encoded, stats) = _encode_values_with_stats(model, (tokens, block_size, pool))
+
+    plaintext_bytes = len(text.encode('utf-8'))
+    stats = stats._replace(plaintext_bytes=plaintext_bytes,
+                           expansion_ratio=_ratio(len(encoded), plaintext_bytes),
+                           seconds=perf_counter() - start)
+    return (encoded, stats)
+
+def encode_segments(model, text, segment_size, block_size=16, processes=None):
+    """Splits the text into segments and encodes each of them independently,
+    optionally in parallel across a pool of processes.
+
+    The tokenized text is split after boundaries into segments of at least
+    `segment_size` tokens (characters, for alphabets of single characters).
+    Each segment gets its own freshly generated initial sequence, so segments
+    can be encoded (and decoded) in any order.
+
+    Note: The number and lengths of the encoded segments are visible to
+    anyone holding the ciphertext, which reveals more about the structure of
+    the text than a single encoding does.
+
+    Example:
+        >> segments = encode_segments(model, "foo bar baz", 4)
+        >> len(segments)
+        3
+        >> decode_segments(model, segments)
+        "FOO BAR BAZ "
+
+    Args:
+        model (Model): The model to use for encoding.
+
+        text (string): The text to encode.
 
-    transformed = list(model.transform(text))
-    padded = pad(model, initial_sequence, transformed, block_size)
-    encoded = tabulate(model, initial_sequence, padded)
-    return pack_ints(initial_weights + list(encoded))
+        segment_size (int): The minimum number of tokens in a segment.
+
+        block_size (int, optional): Each segment will be padded to be a
+            multiple of `block_size`.
+
+        processes (int, optional): The number of processes to encode with.
+
+    Returns (list(bytes)):
+        The encoded segments, in order.
+
+    Raises:
+        ValueError: If `segment_size` is less than 1.
+
+        See `encode`.
+    """
+    if segment_size < 1:
+        raise ValueError("Segment size must be greater than 0.")
+
+    boundary = model.config.model.boundary
+    tokens = model.tokenize(text)
+    segments = split_after(True, tokens, segment_size, key=lambda t: ends_token(t, boundary)) or [[]]
+    items = [(segment, block_size, None) for segment in segments]
+    return map_with_model(model, _encode_values, items, processes)
 
 def decode(model, data):
     """Decodes a byte array of weights into a string that is generated by
@@ -66,13 +150,132 @@ def decode(model, data):
     Returns (string):
         The decoded string.
     """
-    randoms = to_generator(unpack_ints(data))
+    return _decode_weights(model, to_generator(unpack_ints(data, weight_size(model))))
+
+def decode_stream(model, chunks):
+    """Same as `decode`, but consumes the encoded weights incrementally from a
+    sequence of byte strings instead of a single byte array.
+
+    Example:
+        >> decode_stream(model, chunked(encode(model, "foobar", 16), 5))
+        "FOOBAR "
+
+    Args:
+        model (Model): The model that was used when encoding the provided data.
+
+        chunks (sequence(bytes)): The encoded weights, split into chunks of any
+            size.
+
+    Returns (string):
+        The decoded string.
+    """
+    return _decode_weights(model, unpack_ints_stream(chunks, weight_size(model)))
+
+def decode_segments(model, datas, processes=None):
+    """Decodes segments produced by `encode_segments`, optionally in parallel
+    across a pool of processes, and joins them back together.
+
+    Args:
+        model (Model): The model that was used when encoding the segments.
+
+        datas (list(bytes)): The encoded segments, in order.
+
+        processes (int, optional): The number of processes to decode with.
+
+    Returns (string):
+        The decoded string.
+    """
+    return ''.join(map_with_model(model, decode, datas, processes))
+
+def decode_many(model, datas):
+    """Same as `decode`, but decodes several byte arrays at once, making a
+    single batched model prediction per step for all of them.
+
+    This is useful when trying many candidate keys for the same ciphertext,
+    since every candidate (right or wrong) has to be fully decoded.
+
+    Example:
+        >> decode_many(model, [encode(model, "foo"), encode(model, "bar")])
+        ["FOO ", "BAR "]
+
+    Args:
+        model (Model): The model that was used when encoding the provided data.
+
+        datas (list(bytes)): The encoded weights for each message.
+
+    Returns (list(string)):
+        The decoded strings, in the same order as `datas`.
+    """
+    size = weight_size(model)
+    randoms = [to_generator(unpack_ints(data, size)) for data in datas]
+    initials = _initialize_many(model, randoms)
+
+    decoded = recite_many(model, initials, randoms)
+    return [''.join(unpad(model, values)) for values in decoded]
+
+def _encode_values(model, item):
+    """ Encodes a (values, block_size, pool) tuple. See `encode`. """
+    (encoded, _) = _encode_values_with_stats(model, item)
+    return encoded
+
+def _encode_values_with_stats(model, item):
+    """ Same as `_encode_values`, but also returns the encoding's stats. The
+    plaintext's size and the time taken are left for the caller to fill. """
+    (values, block_size, pool) = item
+    size = weight_size(model)
+    counter = PredictionCounter(model)
+    if pool == None:
+        (initial_weights, initial_sequence) = initialize(counter)
+    else:
+        (initial_weights, initial_sequence) = pool.get()
+    initialization = counter.predictions
+
+    block_size = block_size * size // gcd(block_size, size)
+    (weights, padding) = tabulate_padded_with_report(counter, initial_sequence, values, block_size,
+                                                     model.padding_statistics)
+    encoded = pack_ints(initial_weights + weights, size)
+
+    stats = EncodingStats(tokens=len(weights) - padding.length,
+                          plaintext_bytes=None,
+                          output_bytes=len(encoded),
+                          expansion_ratio=None,
+                          padding_tokens=padding.length,
+                          padding_trials=padding.trials,
+                          padding_novelty=padding.novelty,
+                          padding_candidates=padding.candidates,
+                          initialization_predictions=initialization,
+                          encoding_predictions=counter.predictions - initialization - padding.predictions,
+                          padding_predictions=padding.predictions,
+                          seconds=None)
+    return (encoded, stats)
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator > 0 else float('nan')
+
+def _decode_weights(model, randoms):
+    """ Decodes a generator of weights into a string. See `decode`. """
     (_, initial_sequence) = _initialize(model, randoms)
 
     decoded = recite(model, initial_sequence, randoms)
     unpadded = unpad(model, list(decoded))
     return ''.join(unpadded)
 
+def initialize(model):
+    """Generates a fresh, random initial sequence for encoding along with the
+    weights that produced it. See `_initialize`.
+
+    Note: Each result must only ever be used to encode a single message.
+
+    Args:
+        model (Model): The model to use for generating the initial sequence.
+
+    Returns ((list(ints), list(char))):
+        A tuple containing the list of weights used to generate the sequence,
+        and the sequence itself.
+    """
+    randoms = random_ints(max_weight(model)) # Infinite stream of random ints
+    return _initialize(model, randoms)
+
 def _initialize(model, randoms):
     """Given a model, returns the initial sequence to use for encoding, along
     with the weights that were used to generate that sequence.
@@ -127,7 +330,7 @@ def _initialize(model, randoms):
         model (Model): The model to use for generating the initial sequence.
 
         randoms (generator<int>): A generator that returns a sequence of
-            32-bit integers.
+            integers that fit in the model's weight size.
 
     Returns ((list(ints), list(char))):
         A tuple containing the list of weights used to generate the sequence,
@@ -146,6 +349,30 @@ def _initialize(model, randoms):
     unpadded = unpad(model, primed) # Removes any partial tokens at end
     return (seed + normals + priming, start + unpadded[-sequence_length:])
 
+def _initialize_many(model, randoms):
+    """Same as `_initialize`, but generates the initial sequences for several
+    streams of weights at once with batched predictions.
+
+    Args:
+        model (Model): The model to use for generating the initial sequences.
+
+        randoms (list(generator<int>)): A stream of weights for each sequence.
+
+    Returns (list(list(char))):
+        The initial sequence for each stream of weights.
+    """
+    sequence_length = model.config.model.sequence_length
+    normalizing_length = model.config.encoding.normalizing_length
+    priming_length = model.config.encoding.priming_length
+
+    seeds = [take(sequence_length, r) for r in randoms]
+    weights = [take(normalizing_length + priming_length, r) for r in randoms]
+
+    starts = [_seed_sequence(model, seed) for seed in seeds]
+    primed = recite_many(model, starts, weights)
+    unpadded = [unpad(model, p) for p in primed] # Removes any partial tokens at end
+    return [start + u[-sequence_length:] for (start, u) in zip(starts, unpadded)]
+
 def _seed_sequence(model, seed):
     """Generates a uniformly random sequence drawn from the model's alphabet.
 
@@ -154,10 +381,10 @@ def _seed_sequence(model, seed):
     the alphabet.
 
     This skew is bounded by:
-        1 + (1 / floor(2^32 / alphabet_length))
+        1 + (1 / floor(2^weight_bits / alphabet_length))
 
-    That results in a maximum skew of 1.0000002 for a model with an alphabet
-    of 1,000 or fewer characters.
+    That results in a maximum skew of 1.0000002 for a model with 32-bit
+    weights and an alphabet of 1,000 or fewer characters.
 
     The randomness of this seed is not critical for security. That is, this
     function could return a fixed seed without impacting the security of the
@@ -171,7 +398,7 @@ def _seed_sequence(model, seed):
     Args:
         model (Model): The model that you're generating a seed for.
 
-        seed (list(int)): The random 32-bit integers to use to generate the
+        seed (list(int)): The random integers to use to generate the
             sequence.
 
     """
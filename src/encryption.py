@@ -1,7 +1,12 @@
 from Crypto.Cipher import AES
 from hashlib import sha256
 from os import urandom
-from encoding import encode, decode
+from io import BytesIO
+from encoding import encode_with_stats, encode_segments, decode_stream, decode_segments, decode_many
+from util.container import Header, pack_container, write_container, read_header, read_chunks, chunked, is_container, SEGMENTED
+from util.lists import take
+from util.kdf import KeyCache, DEFAULT_PARAMS, pack_kdf, unpack_kdf
+from util.metrics import REGISTRY, Counter, timed
 
 ###############################################################################
 # WARNING WARNING WARNING WARNING WARNING WARNING WARNING WARNING WARNING WARN#
@@ -11,7 +16,22 @@ from encoding import encode, decode
 # WARNING WARNING WARNING WARNING WARNING WARNING WARNING WARNING WARNING WARN#
 ###############################################################################
 
-def encrypt(model, key, plaintext):
+# The scrypt parameters used when encrypting. Decryption reads the parameters
+# from the ciphertext's header.
+KDF_PARAMS = DEFAULT_PARAMS
+
+# Derived keys are cached in-process, so reusing a key across many messages
+# only pays for a single key derivation. Replace this to change the cache's
+# size or TTL.
+KEY_CACHE = KeyCache(max_size=128, ttl=600)
+
+def _key_cache_lookups():
+    return {('hit',): KEY_CACHE.keys.hits, ('miss',): KEY_CACHE.keys.misses}
+
+REGISTRY.register(Counter('menc_key_cache_lookups_total', "Lookups of derived keys, by result (hit or miss).",
+                          ['result'], fn=_key_cache_lookups))
+
+def encrypt(model, key, plaintext, pool=None):
     """Encrypts the plaintext using AES with a model-based transformation.
 
     Note: If the plaintext does not end with a boundary (e.g. space), it will
@@ -32,8 +52,11 @@ def encrypt(model, key, plaintext):
             should only contain values that are present in the `model`'s
             alpahbet.
 
+        pool (InitializationPool, optional): A pool of precomputed initial
+            sequences to draw from. See `encoding.encode`.
+
     Returns (bytes):
-        The encrypted ciphertext.
+        The encrypted ciphertext, framed in a container (see `util.container`).
 
     Raises:
         ValueError: If `plaintext` contains an item that isn't in the `model`'s
@@ -45,14 +68,98 @@ def encrypt(model, key, plaintext):
             that occurs with a low-probability and you're getting this
             exception, increase your model's max_padding_trials attribute.
     """
-    iv = urandom(AES.block_size)
+    (ciphertext, _) = encrypt_with_stats(model, key, plaintext, pool)
+    return ciphertext
+
+def encrypt_with_stats(model, key, plaintext, pool=None):
+    """Same as `encrypt`, but also reports what encoding the plaintext took.
+    The stats' output is the whole container. See
+    `encoding.encode_with_stats`.
+
+    Example:
+        >> (ciphertext, stats) = encrypt_with_stats(model, "foo", "bar")
+        >> telemetry.observe(stats)
+
+    Returns (tuple(bytes, EncodingStats)):
+        The ciphertext, and the stats of encoding it.
+
+    Raises:
+        See `encrypt`.
+    """
+    (iv, kdf, encrypted, stats) = _encrypt(model, key, plaintext, pool)
+    ciphertext = pack_container(model.fingerprint, iv, chunked(encrypted), kdf=kdf)
+    return (ciphertext, _with_output(stats, len(ciphertext)))
+
+def encrypt_stream(model, key, plaintext, stream, pool=None):
+    """Same as `encrypt`, but writes the container directly to a binary stream
+    instead of building it in memory.
+
+    Args:
+        model (Model): A model that has been trained on a domain related to
+            the plaintext being encrypted.
+
+        key (string): A key to use to encrypt the plaintext.
+
+        plaintext (string): The plaintext to be encrypted.
+
+        stream (file): The binary stream to write the ciphertext to.
+
+        pool (InitializationPool, optional): A pool of precomputed initial
+            sequences to draw from.
+
+    Returns (EncodingStats):
+        The stats of encoding the plaintext. See `encrypt_with_stats`.
+
+    Raises:
+        See `encrypt`.
+    """
+    (iv, kdf, encrypted, stats) = _encrypt(model, key, plaintext, pool)
+    written = write_container(stream, model.fingerprint, iv, chunked(encrypted), kdf=kdf)
+    return _with_output(stats, written)
+
+def encrypt_segments(model, key, plaintext, segment_size, processes=None):
+    """Same as `encrypt`, but splits large plaintexts into independently
+    encoded segments that are encoded in parallel across `processes` worker
+    processes. See `encoding.encode_segments`.
+
+    Note: The number and lengths of the segments are visible in the
+    ciphertext.
+
+    Example:
+        >> ciphertext = encrypt_segments(model, "foo", report, 64 * 1024, 8)
+        >> decrypt(model, "foo", ciphertext, processes=8) == model.transform(report) + " "
+        True
+
+    Args:
+        model (Model): A model that has been trained on a domain related to
+            the plaintext being encrypted.
+
+        key (string): A key to use to encrypt the plaintext.
+
+        plaintext (string): The plaintext to be encrypted.
+
+        segment_size (int): The minimum number of characters in a segment.
+
+        processes (int, optional): The number of processes to encode with.
+
+    Returns (bytes):
+        The encrypted ciphertext, framed in a segmented container.
+
+    Raises:
+        See `encrypt` and `encoding.encode_segments`.
+    """
+    with timed('encrypt'):
+        iv = urandom(AES.block_size)
+        (salt, derived) = KEY_CACHE.encryption_key(key, KDF_PARAMS)
 
-    encoded = encode(model, plaintext, AES.block_size)
-    encrypted = _get_cipher(key, iv).encrypt(encoded)
+        segments = encode_segments(model, plaintext, segment_size, AES.block_size, processes)
+        cipher = AES.new(derived, AES.MODE_CFB, iv)
+        encrypted = [cipher.encrypt(segment) for segment in segments]
 
-    return iv + encrypted
+        kdf = pack_kdf(salt, KDF_PARAMS)
+        return pack_container(model.fingerprint, iv, encrypted, flags=SEGMENTED, kdf=kdf)
 
-def decrypt(model, key, ciphertext):
+def decrypt(model, key, ciphertext, processes=None):
     """Decrypts the ciphertext using AES with a model-based transformation.
 
     Example:
@@ -68,21 +175,154 @@ def decrypt(model, key, ciphertext):
 
         ciphertext (bytes): The ciphertext to be decrypted.
 
+        processes (int, optional): The number of processes to decode a
+            segmented ciphertext with.
+
     Returns (string):
         The decrypted plaintext.
+
+    Raises:
+        ValueError: If the ciphertext is malformed or was encrypted with a
+            different model.
+
+    Note: Ciphertexts from before the container format (the iv followed by
+    the encrypted payload) are still decrypted. They don't name the model
+    that encrypted them, so it can't be checked, and the wrong model decrypts
+    them to garbage. Decrypt and encrypt them again to upgrade them.
     """
-    iv = ciphertext[:AES.block_size]
-    ciphertext = ciphertext[AES.block_size:]
+    if not is_container(ciphertext):
+        with timed('decrypt'):
+            (header, chunks) = _legacy_chunks(key, ciphertext)
+            return decode_stream(model, chunks)
+
+    return decrypt_stream(model, key, BytesIO(ciphertext), processes)
+
+def decrypt_stream(model, key, stream, processes=None):
+    """Same as `decrypt`, but reads the ciphertext from a binary stream and
+    decrypts it chunk by chunk.
+
+    Example:
+        >> with open("ciphertext.menc", "rb") as stream:
+        >>     decrypt_stream(model, "foo", stream)
+        "BAR "
+
+    Args:
+        model (Keras Model): The model that was used when encrypting the
+            provided ciphertext.
+
+        key (string): A key to use to decrypt the ciphertext.
+
+        stream (file): A binary stream containing the ciphertext.
+
+        processes (int, optional): The number of processes to decode a
+            segmented ciphertext with.
 
-    decrypted = _get_cipher(key, iv).decrypt(ciphertext)
-    decoded = decode(model, decrypted)
+    Returns (string):
+        The decrypted plaintext.
 
-    return decoded
+    Raises:
+        ValueError: If the ciphertext is malformed or was encrypted with a
+            different model.
+    """
+    with timed('decrypt'):
+        (header, chunks) = _decrypt_chunks(model, key, stream)
+        if header.flags & SEGMENTED:
+            return decode_segments(model, list(chunks), processes)
+        return decode_stream(model, chunks)
+
+def decrypt_candidates(model, candidates):
+    """Decrypts several (key, ciphertext) pairs at once. All of the
+    candidates are decoded together, with a single batched model prediction
+    per step, which is much faster than decrypting them one at a time.
+
+    This is useful for trying many candidate keys against a ciphertext, as a
+    wrong key costs just as much to decode as the right one.
+
+    Example:
+        >> ciphertext = encrypt(model, "foo", "bar")
+        >> decrypt_candidates(model, [(key, ciphertext) for key in ["baz", "foo"]])
+        ["THE UNIT ", "BAR "]
+
+    Args:
+        model (Keras Model): The model that was used when encrypting the
+            provided ciphertexts.
+
+        candidates (list((string, bytes))): The key and ciphertext pairs to
+            decrypt.
+
+    Returns (list(string)):
+        The decrypted plaintext for each candidate, in order.
+
+    Raises:
+        ValueError: If a ciphertext is malformed or was encrypted with a
+            different model.
+    """
+    with timed('decrypt_candidates'):
+        # Segmented ciphertexts contribute one payload per segment.
+        payloads = []
+        for (key, ciphertext) in candidates:
+            if is_container(ciphertext):
+                (header, chunks) = _decrypt_chunks(model, key, BytesIO(ciphertext))
+            else:
+                (header, chunks) = _legacy_chunks(key, ciphertext)
+            if header.flags & SEGMENTED:
+                payloads.append(list(chunks))
+            else:
+                payloads.append([b''.join(chunks)])
+
+        decoded = iter(decode_many(model, [p for segments in payloads for p in segments]))
+        return [''.join(take(len(segments), decoded)) for segments in payloads]
+
+def _encrypt(model, key, plaintext, pool):
+    """ Encodes and encrypts the plaintext. Returns the iv, the serialized key
+    derivation parameters, the ciphertext and the encoding's stats. """
+    with timed('encrypt'):
+        iv = urandom(AES.block_size)
+        (salt, derived) = KEY_CACHE.encryption_key(key, KDF_PARAMS)
+
+        (encoded, stats) = encode_with_stats(model, plaintext, AES.block_size, pool)
+        encrypted = AES.new(derived, AES.MODE_CFB, iv).encrypt(encoded)
+
+        return (iv, pack_kdf(salt, KDF_PARAMS), encrypted, stats)
+
+def _with_output(stats, output_bytes):
+    """ Replaces the size of the encoded weights in the stats with the size
+    of the container they were encrypted into. """
+    expansion_ratio = output_bytes / stats.plaintext_bytes if stats.plaintext_bytes > 0 else float('nan')
+    return stats._replace(output_bytes=output_bytes, expansion_ratio=expansion_ratio)
+
+def _decrypt_chunks(model, key, stream):
+    """ Reads a container's header and returns it, along with a generator of
+    the container's decrypted chunks. """
+    header = read_header(stream)
+    if header.fingerprint != model.fingerprint:
+        raise ValueError("Ciphertext was encrypted with a different model.")
+
+    cipher = AES.new(_derive_key(key, header.kdf), AES.MODE_CFB, header.iv)
+    return (header, (cipher.decrypt(chunk) for chunk in read_chunks(stream)))
+
+def _legacy_chunks(key, ciphertext):
+    """ Same as `_decrypt_chunks`, but for a ciphertext from before the
+    container format: the iv, then the payload, encrypted with a key from
+    `_transform_key`. Its header has a version of 0 and no fingerprint. """
+    if len(ciphertext) < AES.block_size:
+        raise ValueError("Data is not a menc container, or a ciphertext from before containers.")
+
+    iv = ciphertext[:AES.block_size]
+    cipher = AES.new(_transform_key(key), AES.MODE_CFB, iv)
+    return (Header(0, 0, None, iv, b''), [cipher.decrypt(ciphertext[AES.block_size:])])
+
+def _derive_key(key, kdf):
+    """ Derives the AES key from a key and the container's key derivation
+    parameters. Containers without parameters (version 1) use `_transform_key`.
+    """
+    if len(kdf) == 0:
+        return _transform_key(key)
 
-def _get_cipher(key, iv):
-    """ Returns an AES cipher in CFB mode. """
-    return AES.new(_transform_key(key), AES.MODE_CFB, iv)
+    (salt, params) = unpack_kdf(kdf)
+    return KEY_CACHE.decryption_key(key, salt, params)
 
 def _transform_key(key):
-    """ Securely hashes a key to a 32 byte block. """
+    """ Securely hashes a key to a 32 byte block. Only used for decrypting
+    version 1 containers. """
     return sha256(bytes(key, 'utf-8')).digest()
@@ -0,0 +1,287 @@
+""" Measures how well a model fits a corpus, and what that costs encoding. """
+import numpy as np
+from collections import namedtuple
+from util.modeling import weight_size
+from util.tokenization import ends_token
+
+EvaluationReport = namedtuple('EvaluationReport', [
+# How well a model predicts a held out corpus. The better it does, the more
+# uniform the weights that `tabulate` draws are.
+
+    'tokens',
+    # The number of tokens that were predicted.
+
+    'cross_entropy',
+    # The mean cross-entropy of the model's predictions, in nats per token.
+
+    'bits_per_character',
+    # The cross-entropy in bits per character of the transformed corpus. For
+    # alphabets of single characters, this is the cross-entropy in bits.
+
+    'accuracy',
+    # The share of tokens that the model predicted as most likely.
+
+    'top_k_accuracy',
+    # The share of tokens that were among the model's `k` most likely
+    # predictions.
+
+    'boundary_accuracy',
+    # The share of the tokens that end with the boundary (i.e. end a word)
+    # that the model predicted as most likely. Padding relies on the model
+    # predicting boundaries.
+
+    'expected_padding_trials',
+    # An estimate of the number of tokens `pad` generates before one is long
+    # enough, given the config's novelty, padding_novelty_growth_rate and
+    # max_padding_trials. See `expected_padding_trials`.
+])
+
+class Evaluator(object):
+    """Scores a model's predictions for a corpus that's fed in as a stream
+    of blocks, so that a corpus of any size can be evaluated in constant
+    memory.
+
+    Predictions are made for batches of windows of alphabet indices (see
+    `Model.predict_windows`) and reduced to a handful of sums as they're
+    made. Each block picks up where the last one left off, so splitting a
+    corpus into blocks (e.g. at line breaks) predicts the same tokens as
+    evaluating it whole. The first sequence_length tokens of the corpus are
+    only used as context.
+
+    Example:
+        >> evaluator = Evaluator(model)
+        >> for block in read_blocks("held_out.txt"):
+        >>     evaluator.update(block)
+        >> evaluator.report().bits_per_character
+        1.93
+
+    Attrs:
+        model (Model): The model being evaluated.
+
+        k (int): The number of most likely predictions that count towards
+            `top_k_accuracy`.
+    """
+
+    def __init__(self, model, k=5, batch_size=4096, block_size=16, samples=4096):
+        """ Instantiates an evaluator.
+
+        Args:
+            model (Model): The model to evaluate.
+
+            k (int, optional): See `EvaluationReport.top_k_accuracy`.
+
+            batch_size (int, optional): The number of windows to predict at a
+                time.
+
+            block_size (int, optional): The cipher's block size in bytes,
+                which decides how much padding is needed. See `pad`.
+
+            samples (int, optional): The number of windows that end in a
+                boundary to keep, to estimate padding from.
+        """
+        alphabet = model.config.model.alphabet
+        boundary = model.config.model.boundary
+
+        self.model = model
+        self.k = k
+        self._batch_size = batch_size
+        self._capacity = max(1, block_size // weight_size(model))
+        self._samples = samples
+        self._lookup = {x: i for (i, x) in enumerate(alphabet)}
+        self._ends = np.array([ends_token(x, boundary) for x in alphabet])
+        self._lengths = np.array([len(x) for x in alphabet])
+        # The last sequence_length tokens, and the number of tokens since the
+        # last one that ended with a boundary before each of them.
+        self._context = np.zeros(0, dtype=np.int64)
+        self._context_steps = np.zeros(0, dtype=np.int64)
+        self._step = 0
+
+        self._tokens = 0
+        self._characters = 0
+        self._loss = 0.0
+        self._correct = 0
+        self._top_k = 0
+        self._boundaries = 0
+        self._boundaries_correct = 0
+        # Windows that padding could follow, i.e. that end in a boundary.
+        self._starts = []
+
+    def update(self, data):
+        """Scores the model's predictions for the tokens of a block of data.
+
+        Args:
+            data (string): The next block of the corpus. It's tokenized with
+                the model's transformations.
+
+        Raises:
+            Exception: See `Model.tokenize`.
+        """
+        sequence_length = self.model.config.model.sequence_length
+
+        indices = np.array([self._lookup[x] for x in self.model.tokenize(data)], dtype=np.int64)
+        after = _steps(self._ends[indices], self._step)
+        before = np.concatenate([[self._step], after[:-1]]).astype(np.int64)[:len(indices)]
+
+        joined = np.concatenate([self._context, indices])
+        steps = np.concatenate([self._context_steps, before])
+        keep = max(0, len(joined) - sequence_length)
+        (self._context, self._context_steps) = (joined[keep:], steps[keep:])
+        self._step = int(after[-1]) if len(after) > 0 else self._step
+        if len(joined) <= sequence_length:
+            return
+
+        windows = _windows(joined, sequence_length)
+        for start in range(sequence_length, len(joined), self._batch_size):
+            end = min(len(joined), start + self._batch_size)
+            batch = np.ascontiguousarray(windows[start - sequence_length : end - sequence_length])
+            probabilities = np.asarray(self.model.predict_windows(batch), dtype=np.float64)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            self._score(probabilities, joined[start:end], steps[start:end])
+            if len(self._starts) < self._samples:
+                self._starts.extend(batch[steps[start:end] == 0][:self._samples - len(self._starts)])
+
+    def report(self):
+        """ Summarizes the predictions scored so far.
+
+        Returns (EvaluationReport):
+            The scores. They're NaN if no tokens have been scored.
+        """
+        sequence_length = self.model.config.model.sequence_length
+
+        tokens = self._tokens if self._tokens > 0 else np.nan
+        starts = np.array(self._starts, dtype=np.int64).reshape((len(self._starts), sequence_length))
+        trials = expected_padding_trials(self.model, starts, self._capacity)
+        return EvaluationReport(self._tokens,
+                                self._loss / tokens,
+                                self._loss / np.log(2) / self._characters if self._characters > 0 else np.nan,
+                                self._correct / tokens,
+                                self._top_k / tokens,
+                                self._boundaries_correct / self._boundaries if self._boundaries > 0 else np.nan,
+                                trials)
+
+    def _score(self, probabilities, targets, steps):
+        """ Accumulates the scores of a batch of predictions. `steps` holds
+        the number of tokens since a boundary before each target. """
+        rows = np.arange(len(targets))
+        expected = probabilities[rows, targets]
+        ranks = np.sum(probabilities > expected[:, np.newaxis], axis=1)
+        predicted = np.argmax(probabilities, axis=1)
+        ends = self._ends[targets]
+
+        self._tokens += len(targets)
+        self._characters += int(np.sum(self._lengths[targets]))
+        self._loss -= float(np.sum(np.log(np.maximum(expected, np.finfo(np.float64).tiny))))
+        self._correct += int(np.sum(predicted == targets))
+        self._top_k += int(np.sum(ranks < self.k))
+        self._boundaries += int(np.sum(ends))
+        self._boundaries_correct += int(np.sum(ends & self._ends[predicted]))
+
+def evaluate(model, data, k=5, batch_size=4096):
+    """Scores a model's predictions for every token of a corpus, after the
+    first sequence_length tokens. See `Evaluator`.
+
+    Example:
+        >> report = evaluate(model, held_out)
+        >> report.bits_per_character
+        1.93
+
+    Args:
+        model (Model): The model to evaluate.
+
+        data (string): The corpus. It's tokenized with the model's
+            transformations.
+
+        k (int, optional): See `EvaluationReport.top_k_accuracy`.
+
+        batch_size (int, optional): The number of windows to predict at a
+            time.
+
+    Returns (EvaluationReport):
+        The scores.
+    """
+    evaluator = Evaluator(model, k, batch_size)
+    evaluator.update(data)
+    return evaluator.report()
+
+def expected_padding_trials(model, windows, capacity):
+    """Estimates the number of tokens that padding generates before one is
+    long enough to fill out the last block, averaged over every length that
+    the block could need (1 to `capacity` tokens). See `pad`.
+
+    Padding generates a token at a time, with the novelty growing by the
+    config's padding_novelty_growth_rate each trial, until a token is long
+    enough or max_padding_trials is reached. This simulates that: each trial,
+    a token is sampled from the model after each of the windows, in a batch,
+    to estimate the chance that a token is long enough.
+
+    Args:
+        model (Model): The model that pads.
+
+        windows (numpy.array): The alphabet indices of sequences that end in
+            a boundary (e.g. from a held out corpus), one row per sequence.
+
+        capacity (int): The number of tokens in a block.
+
+    Returns (float):
+        The expected number of trials, at most max_padding_trials. NaN if
+        there are no windows.
+    """
+    novelty = model.config.encoding.novelty
+    growth_rate = model.config.encoding.padding_novelty_growth_rate
+    max_trials = model.config.encoding.max_padding_trials
+
+    if len(windows) == 0:
+        return np.nan
+
+    expected = np.ones(capacity)
+    failing = np.ones(capacity)
+    for trial in range(1, max_trials):
+        lengths = _sample_lengths(model, windows, capacity, novelty * growth_rate ** (trial - 1))
+        long_enough = np.array([np.mean(lengths >= length) for length in range(1, capacity + 1)])
+        failing *= 1 - long_enough
+        if np.all(failing < 1e-9):
+            break
+        expected += failing
+
+    return float(np.mean(expected))
+
+def _sample_lengths(model, windows, capacity, novelty):
+    """ Samples a token after each window, like `_first_long_token`, and
+    returns the number of steps each one took, up to `capacity`. """
+    alphabet = model.config.model.alphabet
+    boundary = model.config.model.boundary
+    ends = np.array([ends_token(x, boundary) for x in alphabet])
+
+    windows = windows.copy()
+    lengths = np.full(len(windows), capacity)
+    active = np.arange(len(windows))
+    for step in range(capacity - 1):
+        probabilities = np.asarray(model.predict_windows(windows[active]), dtype=np.float64)
+        logs = np.log(np.maximum(probabilities, np.finfo(np.float64).tiny)) / novelty
+        weights = np.exp(logs - logs.max(axis=1, keepdims=True))
+        cumulative = np.cumsum(weights, axis=1)
+        draws = np.random.random_sample(len(active)) * cumulative[:, -1]
+        chosen = np.minimum(np.sum(cumulative <= draws[:, np.newaxis], axis=1), len(alphabet) - 1)
+
+        if windows.shape[1] > 0:
+            windows[active] = np.concatenate([windows[active, 1:], chosen[:, np.newaxis]], axis=1)
+        lengths[active[ends[chosen]]] = step + 1
+        active = active[~ends[chosen]]
+        if len(active) == 0:
+            break
+
+    return lengths
+
+def _steps(ends, step):
+    """ The number of tokens since the last one that ended with a boundary,
+    after each token, carrying on from `step`. """
+    positions = np.arange(len(ends))
+    last = np.maximum.accumulate(np.where(ends, positions, -1 - step))
+    return positions - last
+
+def _windows(indices, length):
+    """ Every window of `length` indices, as a view. The window ending before
+    position i is row i - length. """
+    if length == 0:
+        return np.zeros((len(indices) + 1, 0), dtype=indices.dtype)
+    return np.lib.stride_tricks.sliding_window_view(indices, length)
@@ -0,0 +1,139 @@
+""" Swaps the model a long-running process serves with, without downtime. """
+import numpy as np
+from threading import Condition
+from contextlib import contextmanager
+from encoding import encode
+from util.metrics import MODEL_BYTES
+
+class ModelHost(object):
+    """Holds the model that a long-running process serves requests with, and
+    swaps it for another without dropping requests.
+
+    Requests `acquire` a model for as long as they use it. `swap` switches
+    new requests over to another model atomically, and retires the old one:
+    requests that are already using it finish on it, and it's released once
+    the last of them is done (i.e. it's drained). Until then, requests for
+    its fingerprint (e.g. to decrypt a ciphertext it encrypted) are still
+    routed to it.
+
+    Example:
+        >> host = ModelHost(load_model("models/military/config.json"))
+        >> with host.acquire() as model:
+        >>     ciphertext = encrypt(model, "foo", "bar")
+        >> host.swap(warm_up(load_model("models/military/config.json")))
+        >> with host.acquire(read_header(BytesIO(ciphertext)).fingerprint) as model:
+        >>     decrypt(model, "foo", ciphertext) # The old model, if still live
+        "BAR "
+    """
+
+    def __init__(self, model):
+        """ Instantiates a host that serves with the given model.
+
+        Args:
+            model (Model): The model to serve with.
+        """
+        self._condition = Condition()
+        self._current = _Version(model)
+        self._retired = []
+        _report(model)
+
+    @property
+    def current(self):
+        """ (Model): The model that new requests are served with. """
+        return self._current.model
+
+    def fingerprints(self):
+        """ Returns (list(bytes)): The fingerprints of the live models: the
+        current one first, then the retired ones that are still draining. """
+        with self._condition:
+            return [v.model.fingerprint for v in [self._current] + self._retired]
+
+    @contextmanager
+    def acquire(self, fingerprint=None):
+        """Uses a live model for the duration of a request. A retired model
+        isn't released while it's in use.
+
+        Args:
+            fingerprint (bytes, optional): The fingerprint of the model to
+                use, e.g. from a ciphertext's container header. The current
+                model is used if it's None, or if no live model has it.
+
+        Yields (Model):
+            The model.
+        """
+        with self._condition:
+            version = self._current
+            if fingerprint != None and fingerprint != version.model.fingerprint:
+                version = next((v for v in reversed(self._retired) if v.model.fingerprint == fingerprint), version)
+            version.users += 1
+
+        try:
+            yield version.model
+        finally:
+            with self._condition:
+                version.users -= 1
+                self._release_drained()
+
+    def swap(self, model):
+        """Switches new requests over to a model, and retires the current one.
+        The model should already be warm (see `warm_up`), since requests are
+        served with it as soon as this returns.
+
+        Args:
+            model (Model): The model to serve with.
+        """
+        _report(model)
+        with self._condition:
+            self._retired.append(self._current)
+            self._current = _Version(model)
+            self._release_drained()
+
+    def drain(self, timeout=None):
+        """Waits for every retired model to finish its requests and be
+        released.
+
+        Args:
+            timeout (float, optional): The maximum number of seconds to wait,
+                or None to wait for as long as it takes.
+
+        Returns (bool):
+            True if every retired model was released.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._retired) == 0, timeout)
+
+    def _release_drained(self):
+        """ Drops the retired models that are no longer in use, so that their
+        weights can be freed. Called with the lock held. """
+        drained = [v for v in self._retired if v.users == 0]
+        if len(drained) == 0:
+            return
+
+        self._retired = [v for v in self._retired if v.users > 0]
+        live = set(v.model.fingerprint for v in [self._current] + self._retired)
+        for version in drained:
+            if version.model.fingerprint not in live:
+                MODEL_BYTES.remove(version.model.fingerprint.hex())
+        self._condition.notify_all()
+
+class _Version(object):
+    """ A model, and the number of requests that are using it. """
+
+    def __init__(self, model):
+        self.model = model
+        self.users = 0
+
+def warm_up(model):
+    """Runs a model through a throwaway encoding, so that the first request
+    that uses it doesn't pay for lazy initialization (e.g. paging in memory
+    mapped weights).
+
+    Returns (Model):
+        The model.
+    """
+    encode(model, model.config.model.boundary)
+    return model
+
+def _report(model):
+    weights = sum(np.asarray(w).nbytes for w in model.get_weights())
+    MODEL_BYTES.set(weights, model.fingerprint.hex())
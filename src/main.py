@@ -1,12 +1,28 @@
+import json
+import signal
 import argparse
-from sys import argv, exit
+from threading import Thread
+from sys import argv, exit, stdout, stderr
 from getpass import getpass
 from base64 import b64encode, b64decode
-from model import load_model
-from encryption import encrypt, decrypt
-from util.io import confirmed_get_pass, read_file
+from os.path import join, dirname, splitext, basename
+from model import load_model, save_bundle
+from config import save_config
+from distillation import distill
+from evaluation import Evaluator
+from tracing import TraceRecorder
+from util.padding import PaddingStatistics
+from service import Service
+from encryption import encrypt_with_stats, encrypt_stream, encrypt_segments, decrypt, decrypt_stream
+from util.container import MAGIC, is_container
+from util.io import confirmed_get_pass, read_file, read_blocks, open_binary
+from util.tokenization import learn_tokens
 
 def encrypt_command(args):
+    if args.processes != None and args.segment_size == None:
+        print("Only segmented encryption is spread across processes. Pass --segment-size too.", file=stderr)
+        exit(2)
+
     key = args.key
     if key == None:
         key = confirmed_get_pass("Encryption Key: ", "Confirm Encryption Key: ")
@@ -14,35 +30,195 @@ def encrypt_command(args):
             print("Keys didn't match. Exiting.")
             exit(2)
 
-    model = load_model(args.config)
+    model = _load_recording(args)
+    if args.padding_statistics != None:
+        model.padding_statistics = PaddingStatistics(args.padding_statistics, model.fingerprint)
     # NOTE We rstrip() the plaintext. Input tends to end in newlines and it can
     # be a signal to an attacker (e.g. by checking if the decoy output has a newline).
     plaintext = read_file(args.file).rstrip()
-    encrypted = encrypt(model, key, plaintext)
-    encoded = str(b64encode(encrypted), 'utf-8')
-    print(encoded)
+    stats = None
+    if args.segment_size != None:
+        if args.stats:
+            print("Stats aren't reported for segmented encryption.", file=stderr)
+            exit(2)
+        segment_size = int(args.segment_size)
+        processes = None if args.processes == None else int(args.processes)
+        encrypted = encrypt_segments(model, key, plaintext, segment_size, processes)
+    elif args.binary:
+        stats = encrypt_stream(model, key, plaintext, stdout.buffer)
+        stdout.buffer.flush()
+        _save_recording(args, model)
+        _save_padding_statistics(model)
+        _print_stats(args, stats)
+        return
+    else:
+        (encrypted, stats) = encrypt_with_stats(model, key, plaintext)
+    _save_recording(args, model)
+    _save_padding_statistics(model)
+    _print_stats(args, stats)
+
+    if args.binary:
+        stdout.buffer.write(encrypted)
+        stdout.buffer.flush()
+    else:
+        encoded = str(b64encode(encrypted), 'utf-8')
+        print(encoded)
 
 def decrypt_command(args):
     key = args.key
     if key == None:
         key = getpass("Decryption Key: ")
 
-    model = load_model(args.config)
-    encoded = read_file(args.file)
-    ciphertext = b64decode(encoded)
-    decrypted = decrypt(model, key, ciphertext)
+    model = _load_recording(args)
+    processes = None if args.processes == None else int(args.processes)
+    with open_binary(args.file) as stream:
+        # Binary containers are decrypted as they're read, anything else is
+        # assumed to be base64 encoded.
+        if is_container(stream.peek(len(MAGIC))):
+            decrypted = decrypt_stream(model, key, stream, processes)
+        else:
+            ciphertext = b64decode(stream.read())
+            decrypted = decrypt(model, key, ciphertext, processes)
+    _save_recording(args, model)
     print(decrypted)
 
+def _load_recording(args):
+    """ Loads the model, wrapped in a recorder if a trace was asked for. """
+    model = load_model(args.config)
+    if args.record_trace == None:
+        return model
+
+    if args.processes != None and int(args.processes) > 1:
+        print("Traces can only be recorded in a single process.", file=stderr)
+        exit(2)
+    return TraceRecorder(model)
+
+def _save_recording(args, model):
+    if args.record_trace != None:
+        model.save(args.record_trace)
+        print("Recorded %s predictions (%.3fs of inference) to '%s'" % (len(model), model.seconds, args.record_trace), file=stderr)
+
+def _print_stats(args, stats):
+    if args.stats:
+        print(json.dumps(stats._asdict()), file=stderr)
+
+def _save_padding_statistics(model):
+    """ Keeps what padding needed for the next run, if --padding-statistics
+    was passed. Encrypting shouldn't fail because the file can't be written. """
+    try:
+        model.padding_statistics.save()
+    except OSError as e:
+        print("Couldn't save padding statistics: %s" % (e), file=stderr)
+
 def train_command(args):
     model = load_model(args.config)
     data = read_file(args.data)
-    model.train(data)
+    model.train(data, resume=args.resume, incremental=args.incremental)
+
+def distill_command(args):
+    teacher = load_model(args.config)
+    data = read_file(args.data)
+
+    weights_file = args.weights_file
+    if weights_file == None:
+        name = splitext(basename(args.output))[0]
+        weights_file = join(dirname(args.output), name + ".weights")
+
+    student_model = teacher.config.model._replace(weights_file=weights_file)
+    if args.backend != None:
+        student_model = student_model._replace(backend=args.backend)
+    if args.nodes != None:
+        student_model = student_model._replace(nodes=int(args.nodes))
+    if args.order != None:
+        student_model = student_model._replace(order=int(args.order))
+
+    # Writing the config first means the student is validated and built just
+    # like any other model.
+    save_config(teacher.config._replace(model=student_model), args.output)
+    student = load_model(args.output)
+
+    report = distill(teacher, student, data)
+    print("Teacher entropy: %.4f nats/char" % (report.entropy))
+    print("Cross-entropy:   %.4f nats/char" % (report.cross_entropy))
+    print("KL divergence:   %.4f nats/char" % (report.kl_divergence))
+    print("Wrote student config to '%s'" % (args.output))
+
+def evaluate_command(args):
+    model = load_model(args.config)
+    evaluator = Evaluator(model, int(args.top_k), int(args.batch_size))
+    for block in read_blocks(args.data):
+        evaluator.update(block)
+
+    report = evaluator.report()
+    print("Tokens:                  %s" % (report.tokens))
+    print("Cross-entropy:           %.4f nats/token" % (report.cross_entropy))
+    print("Bits per character:      %.4f" % (report.bits_per_character))
+    print("Accuracy:                %.4f" % (report.accuracy))
+    print("Top-%s accuracy:          %.4f" % (evaluator.k, report.top_k_accuracy))
+    print("Boundary accuracy:       %.4f" % (report.boundary_accuracy))
+    print("Expected padding trials: %.2f" % (report.expected_padding_trials))
+
+def tokens_command(args):
+    model = load_model(args.config)
+    alphabet = list(model.config.model.alphabet)
+    transformed = model.transform(read_file(args.data))
+
+    count = int(args.count)
+    max_length = int(args.max_length)
+    learned = learn_tokens(transformed, count + len(alphabet), max_length, model.config.model.boundary)
+    tokens = [t for t in learned if t not in alphabet][:count]
+    print(json.dumps(alphabet + tokens))
+
+def bundle_command(args):
+    model = load_model(args.config)
+    content_hash = save_bundle(model, args.output)
+    print("Wrote bundle to '%s'" % (args.output))
+    print("Fingerprint: %s" % (content_hash.hex()))
 
 def sample_command(args):
     model = load_model(args.config)
     size = int(args.size)
     novelty = None if args.novelty == None else float(args.novelty)
-    print(model.sample(size, novelty))
+    if args.count == None:
+        print(model.sample(size, novelty))
+        return
+
+    count = int(args.count)
+    batch_size = int(args.batch_size)
+    processes = None if args.processes == None else int(args.processes)
+    output = stdout if args.output == None else open(args.output, 'w')
+    try:
+        samples = model.sample_many(count, size, novelty, batch_size, processes)
+        for (i, sample) in enumerate(samples):
+            output.write(sample + "\n")
+            # Flush each completed batch, so that samples stream out.
+            if (i + 1) % batch_size == 0:
+                output.flush()
+    finally:
+        if output != stdout:
+            output.close()
+
+def serve_command(args):
+    service = Service(lambda: load_model(args.config))
+    server = service.server(int(args.port), args.host)
+    print("Serving on %s:%s" % server.server_address[:2], file=stderr)
+    # Requests are answered with 503 until the model is warm.
+    Thread(target=service.warm_up, daemon=True).start()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda number, frame: Thread(target=_reload, args=(service,), daemon=True).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def _reload(service):
+    """ Reloads the service's model, and reports how it went. """
+    try:
+        print("Reloaded model %s" % (service.reload()['fingerprint']), file=stderr)
+    except Exception as e:
+        print("Failed to reload the model, still serving the old one: %s" % (e), file=stderr)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -68,6 +244,12 @@ Example Usage:
   - Store encrypted result into a file:
     $ echo 'Hello World!' | menc encrypt -c models/military/config.json > encrypted_file
 
+  - Store encrypted result into a file as raw bytes instead of base64:
+    $ echo 'Hello World!' | menc encrypt -c models/military/config.json --binary > encrypted_file
+
+  - Encrypt a large file in segments of at least 65536 characters, using 8 processes:
+    $ menc encrypt -c models/military/config.json -f filename --segment-size 65536 -p 8
+
   - Decrypt a file:
     $ menc decrypt -c models/military/config.json -f filename
 
@@ -80,6 +262,18 @@ Example Usage:
   - Store decrypted result into a file:
     $ cat encrypted | menc -c models/military/config.json > decrypted_file
 
+  - Record the model's predictions while encrypting, and replay them without
+    the model (e.g. to benchmark everything but inference):
+    $ menc encrypt -c models/military/config.json -f filename -k foo --record-trace military.trace > encrypted
+    $ menc decrypt -c military.trace -f encrypted -k foo
+
+  - Report what encrypting took (padding trials, predictions, expansion):
+    $ echo 'Hello World!' | menc encrypt -c models/military/config.json -k foo --stats > encrypted
+
+  - Keep statistics of what padding took across runs, to pad faster (they
+    reveal the lengths of the messages, so keep the file private):
+    $ echo 'Hello World!' | menc encrypt -c models/military/config.json -k foo --padding-statistics ~/.menc/military.padding > encrypted
+
   - Round-trip (encrypt and then decrypt):
     $ echo 'Hello world!' | menc encrypt -c models/military/config.json -k foo | menc decrypt -c models/military/config.json -k foo
 
@@ -92,36 +286,130 @@ Example Usage:
   - Train from stdin:
     $ cat models/military/data.txt | menc train -c models/military/config.json
 
+  - Resume an interrupted training run from its last checkpoint:
+    $ menc train -c models/military/config.json -d models/military/data.txt --resume
+
+  - Fine-tune on data appended to the file since the last run:
+    $ menc train -c models/military/config.json -d models/military/data.txt --incremental
+
+  - Distill a trained model into a smaller LSTM:
+    $ menc distill -c models/military/config.json -d models/military/data.txt -o models/military/small.json --nodes 128
+
+  - Distill a trained model into an n-gram table:
+    $ menc distill -c models/military/config.json -d models/military/data.txt -o models/military/ngram.json --backend ngram --order 6
+
+  - Score a trained model on held out data (cross-entropy, bits per character,
+    top-k accuracy, boundary accuracy and the padding it would need):
+    $ menc evaluate -c models/military/config.json -d held_out.txt
+
+  - Learn an alphabet of 200 extra multi-character tokens from the data, for
+    the config's "alphabet" (the model must then be trained from scratch):
+    $ menc tokens -c models/military/config.json -d models/military/data.txt -n 200
+
+  Deployment
+  =============================================================================
+
+  - Pack a trained model into a single memory-mappable file, which can be
+    passed to -c in place of its config:
+    $ menc bundle -c models/military/config.json -o military.bundle
+    $ echo 'Hello World!' | menc encrypt -c military.bundle -k foo
+
   Sampling
   =============================================================================
 
   - Generate a random sequence of length 100:
-    $ menc sample -c models/military/config.json -s 100""")
+    $ menc sample -c models/military/config.json -s 100
+
+  - Generate 100000 sequences of length 100, one per line, in batches of 512
+    spread across 8 processes:
+    $ menc sample -c models/military/config.json -s 100 --count 100000 --batch-size 512 -p 8 -o decoys.txt
+
+  Serving
+  =============================================================================
+
+  - Keep a model loaded and serve encryption, Prometheus metrics (/metrics) and
+    a readiness check (/ready) over local HTTP:
+    $ menc serve -c models/military/config.json --port 8750
+    $ curl -d '{"key": "foo", "plaintext": "ATTACK AT DAWN"}' localhost:8750/encrypt
+
+  - Reload the model after retraining it, without dropping requests. Either
+    send the process SIGHUP, or:
+    $ curl -X POST localhost:8750/reload""")
     subparsers = parser.add_subparsers()
 
     encrypt_parser = subparsers.add_parser('encrypt', help="Encrypt a plaintext.")
     encrypt_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
     encrypt_parser.add_argument('-k', '--key', help="The string to use as the encryption key. If ommitted, a password prompt will securely ask for one. Note: Providing a key on the command-line may store the key in your shell history.")
     encrypt_parser.add_argument('-f', '--file', help="File to encrypt. Reads stdin if not provided.")
+    encrypt_parser.add_argument('-b', '--binary', action='store_true', help="Write the ciphertext as raw bytes instead of base64. Decrypt detects either format.")
+    encrypt_parser.add_argument('--segment-size', help="Split the plaintext into independently encoded segments of at least this many characters. The number and size of segments is visible in the ciphertext.")
+    encrypt_parser.add_argument('-p', '--processes', help="Number of processes to encode segments with. Requires --segment-size.")
+    encrypt_parser.add_argument('--record-trace', metavar="TRACE_PATH", help="Record the model's predictions to a trace file, which can be passed to -c in place of the config to replay them.")
+    encrypt_parser.add_argument('--padding-statistics', metavar="STATISTICS_PATH", help="Load and update statistics of how many trials padding took, so that later runs can try several candidates at once. Off by default: the statistics reveal the lengths of the messages encrypted with them (modulo the block size), so keep the file as private as the plaintexts.")
+    encrypt_parser.add_argument('--stats', action='store_true', help="Print what encoding the plaintext took (padding trials, predictions per phase, expansion ratio) to stderr as JSON.")
     encrypt_parser.set_defaults(func=encrypt_command)
 
     decrypt_parser = subparsers.add_parser('decrypt', help="Decrypt a ciphertext.")
     decrypt_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
     decrypt_parser.add_argument('-k', '--key', help="The string to use as the decryption key. If ommitted, a password prompt will securely ask for one. Note: Providing a key on the command-line may store the key in your shell history.")
     decrypt_parser.add_argument('-f', '--file', help="File to decrypt. Reads stdin if not provided.")
+    decrypt_parser.add_argument('-p', '--processes', help="Number of processes to decode a segmented ciphertext with.")
+    decrypt_parser.add_argument('--record-trace', metavar="TRACE_PATH", help="Record the model's predictions to a trace file, which can be passed to -c in place of the config to replay them.")
     decrypt_parser.set_defaults(func=decrypt_command)
 
     train_parser = subparsers.add_parser('train', help="Train a model on a given set of data.")
     train_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
     train_parser.add_argument('-d', '--data', help="Path to data to train on.")
+    train_mode = train_parser.add_mutually_exclusive_group()
+    train_mode.add_argument('--resume', action='store_true', help="Carry on from the last checkpoint of an interrupted run on the same data.")
+    train_mode.add_argument('--incremental', action='store_true', help="Train only on the data appended since the last run, starting from its checkpoint.")
     train_parser.set_defaults(func=train_command)
 
+    distill_parser = subparsers.add_parser('distill', help="Train a smaller model to mimic a trained model.")
+    distill_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the trained (teacher) model's config.", required=True)
+    distill_parser.add_argument('-d', '--data', help="Path to data to train on.")
+    distill_parser.add_argument('-o', '--output', metavar="CONFIG_PATH", help="Path to write the student model's config to.", required=True)
+    distill_parser.add_argument('-w', '--weights-file', help="Path to write the student model's weights to. Defaults to the config's name with a '.weights' extension.")
+    distill_parser.add_argument('--backend', choices=['lstm', 'ngram'], help="The student model's backend. Defaults to the teacher's.")
+    distill_parser.add_argument('--nodes', help="The number of nodes in the student LSTM's hidden layer.")
+    distill_parser.add_argument('--order', help="The order of the student n-gram table.")
+    distill_parser.set_defaults(func=distill_command)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help="Score a model's predictions on held out data.")
+    evaluate_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
+    evaluate_parser.add_argument('-d', '--data', help="Path to data to evaluate on. Reads stdin if not provided.")
+    evaluate_parser.add_argument('--top-k', default="5", help="Count predictions among the model's k most likely as correct for top-k accuracy.")
+    evaluate_parser.add_argument('--batch-size', default="4096", help="The number of predictions to make at a time.")
+    evaluate_parser.set_defaults(func=evaluate_command)
+
+    tokens_parser = subparsers.add_parser('tokens', help="Learn multi-character tokens for a model's alphabet.")
+    tokens_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
+    tokens_parser.add_argument('-d', '--data', help="Path to data to learn tokens from.")
+    tokens_parser.add_argument('-n', '--count', help="The number of tokens to add to the alphabet.", required=True)
+    tokens_parser.add_argument('--max-length', default="6", help="The length of the longest token.")
+    tokens_parser.set_defaults(func=tokens_command)
+
+    bundle_parser = subparsers.add_parser('bundle', help="Pack a model's config and weights into a single file.")
+    bundle_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
+    bundle_parser.add_argument('-o', '--output', metavar="BUNDLE_PATH", help="Path to write the bundle to. Ciphertexts made with the bundle are tagged with its content hash, so decrypt them with the bundle too.", required=True)
+    bundle_parser.set_defaults(func=bundle_command)
+
     sample_parser = subparsers.add_parser('sample', help="Sample a random sequence from a model.")
     sample_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
-    sample_parser.add_argument('-s', '--size', help="Length of the sequence to generate.", required=True)
+    sample_parser.add_argument('-s', '--size', help="Number of characters to generate in each sequence.", required=True)
     sample_parser.add_argument('-n', '--novelty', help="A float that determines how conservative the predictions are. Lower is more conservative. Typical ranges are 0.1 to 2.0.")
+    sample_parser.add_argument('--count', help="The number of sequences to generate, one per line. Sequences are generated in batches, with one batched prediction per step.")
+    sample_parser.add_argument('--batch-size', default="256", help="The number of sequences to generate together. Requires --count.")
+    sample_parser.add_argument('-p', '--processes', help="Number of processes to generate batches with. Requires --count.")
+    sample_parser.add_argument('-o', '--output', help="File to write the sequences to. Writes to stdout if not provided.")
     sample_parser.set_defaults(func=sample_command)
 
+    serve_parser = subparsers.add_parser('serve', help="Keep a model loaded and serve encryption over local HTTP.")
+    serve_parser.add_argument('-c', '--config', metavar="CONFIG_PATH", help="Path to the model config.", required=True)
+    serve_parser.add_argument('--host', default="127.0.0.1", help="The address to listen on. Keys are sent in the clear, so keep this local.")
+    serve_parser.add_argument('--port', default="8750", help="The port to listen on.")
+    serve_parser.set_defaults(func=serve_command)
+
     args = parser.parse_args()
 
     if 'func' not in args:
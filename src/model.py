@@ -1,33 +1,101 @@
 import re
+import json
 import numpy as np
+from hashlib import sha256
 from os.path import isfile
 from functools import partial
-from random import choice
-from config import load_config
-from util.keras import Sequential, LSTM, Dense, Activation
+from threading import Lock
+from collections import namedtuple
+from copy import copy
+from itertools import islice
+from config import Config, load_config, config_values
+from util.keras import Sequential, LSTM, Dense, Activation, TimeDistributed
 from util.one_hot_encoding import one_hot_encoding
-from util.math import log_normalize
-from util.modeling import recite
-from util.randoms import random_ints
+from util.batching import windows, streams
+from util.math import log_normalize, average_arrays
+from util.modeling import recite, recite_many, max_weight
+from util.randoms import RAND, random_ints
+from util.checkpoints import Checkpointer, load_state, matches_weights
+from util.padding import PaddingStatistics
+from util.metrics import timed, timed_predictions
+from util.tokenization import Tokenizer
+from util.context import Context
+from util.bundle import is_bundle, read_bundle, write_bundle
+from parallel import imap_with_model, model_pool, with_model, worker_state
+
+TrainingPlan = namedtuple('TrainingPlan', [
+# What a call to `Model.train` will train on.
+
+    'epochs',
+    # The range of (global) epoch numbers to train for.
+
+    'offset',
+    # The index of the first token of the tokenized data to train on.
+
+    'length',
+    # The number of tokens of the tokenized data that are trained on, counting
+    # from the start of the data.
+
+    'corpus',
+    # The fingerprint of those characters. See `_corpus_fingerprint`.
+
+    'best_loss',
+    # The lowest validation loss of an earlier run on the same data, or None.
+
+    'optimizer_weights',
+    # The optimizer's weights from the earlier run, if any.
+])
 
 class Model(object):
     """ A model that can learn and predict sequences.
 
     Attrs:
         config (Config): The model's config.
+
+        fingerprint (bytes): A 32 byte digest identifying the model's config
+            and weights. Ciphertexts are tagged with it.
+
+        padding_statistics (PaddingStatistics): What padding has needed so
+            far. They're kept in memory only, unless the caller replaces them
+            with persisted statistics.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, weights=None, fingerprint=None):
         """ Instantiates a model instance given a config object.
 
         Args:
             config (Config): The model's config object.
 
+            weights (list(numpy.array), optional): The weights to use instead
+                of loading the config's weights file, e.g. views of weights
+                that are shared between processes. See `set_weights`.
+
+            fingerprint (bytes, optional): The model's fingerprint, if it's
+                already known. Otherwise it's computed from the config and
+                the weights file.
+
         Raises:
             Exception: If model fails to build.
         """
         self.config = config
-        self.model = self._create_model()
+        self._predicting = Lock()
+        self.tokenizer = Tokenizer(config.model.alphabet)
+        self._transformations = _compile_transformations(config)
+        self.model = self._create_model(load=weights == None)
+        if weights != None:
+            self.set_weights(weights)
+        self.fingerprint = fingerprint if fingerprint != None else _fingerprint(config)
+        self.padding_statistics = PaddingStatistics(fingerprint=self.fingerprint)
+
+    def get_weights(self):
+        """ Returns the model's weights as a list of numpy arrays. """
+        return self.model.get_weights()
+
+    def set_weights(self, weights):
+        """ Replaces the model's weights with arrays like those returned by
+        `get_weights`. They're copied into the underlying keras model, so they
+        can be read-only. """
+        self.model.set_weights(weights)
 
     def predict(self, sequence, novelty=None):
         """ Given a sequence, returns the probabilities of each character in
@@ -67,22 +135,138 @@ class Model(object):
         if novelty == None:
             novelty = self.config.encoding.novelty
 
+        return log_normalize(self.predict_raw(sequence), novelty)
+
+    @timed_predictions
+    def predict_raw(self, sequence):
+        """ Same as `predict`, but returns the model's output before any
+        novelty is applied. `predict(sequence, novelty)` is equivalent to
+        `log_normalize(predict_raw(sequence), novelty)`.
+
+        Args:
+            sequence (string|Context): The sequence of characters to predict
+                the next character for. A `Context` is read in place, without
+                encoding the sequence again.
+
+        Returns:
+            The model's raw probabilities for each letter in the alphabet.
+
+        Raises:
+            ValueError: If `sequence` contains an item that is not present in
+            the model's alphabet.
+        """
+        if isinstance(sequence, Context):
+            return self._predict(sequence.one_hot()[np.newaxis])[0]
+
         alphabet = self.config.model.alphabet
         encoded = one_hot_encoding(sequence, alphabet)
         nested = np.array([encoded], dtype=np.bool)
-        probabilities = self.model.predict(nested, verbose=0)[0]
-        return log_normalize(probabilities, novelty)
+        return self._predict(nested)[0]
+
+    def predict_batch(self, sequences, novelty=None):
+        """ Same as `predict`, but predicts the next character for several
+        sequences of equal length with a single call to the underlying model.
+
+        Example:
+            >> probs = model.predict_batch(['HELLO THERE ', 'GOODBYE NOW '])
+            >> len(probs)
+            2
+
+        Args:
+            sequences (list(string)): The sequences to predict the next
+                character for. They must all have the same length.
+
+            novelty (float): The conservativeness of the predictions.
+
+        Returns:
+            A list containing a list of probabilities for each sequence.
+
+        Raises:
+            ValueError: If a sequence contains an item that is not present in
+            the model's alphabet.
+        """
+        if novelty == None:
+            novelty = self.config.encoding.novelty
+
+        return [log_normalize(p, novelty) for p in self.predict_batch_raw(sequences)]
+
+    @timed_predictions
+    def predict_batch_raw(self, sequences):
+        """ Same as `predict_batch`, but returns the model's output before any
+        novelty is applied. See `predict_raw`. """
+        if len(sequences) == 0:
+            return []
+
+        alphabet = self.config.model.alphabet
+        encoded = [one_hot_encoding(sequence, alphabet) for sequence in sequences]
+        nested = np.array(encoded, dtype=np.bool)
+        return self._predict(nested)
+
+    @timed_predictions
+    def predict_windows(self, windows):
+        """ Same as `predict_batch_raw`, but for sequences that are already
+        mapped to alphabet indices, which skips encoding each sequence.
+
+        Example:
+            >> windows = np.lib.stride_tricks.sliding_window_view(indices, 40)
+            >> probs = model.predict_windows(windows[:1024])
+
+        Args:
+            windows (numpy.array): The alphabet indices of the sequences, one
+                row per sequence.
 
-    def train(self, data):
+        Returns (numpy.array):
+            A row of raw probabilities for each sequence.
+        """
+        alphabet_size = len(self.config.model.alphabet)
+        encoded = np.eye(alphabet_size, dtype=np.bool_)[np.asarray(windows)]
+        return np.asarray(self._predict(encoded))
+
+    def _predict(self, inputs):
+        """ Runs the keras model on one-hot encoded inputs. A keras model
+        can't be predicted from several threads at once (e.g. while an
+        `InitializationPool` refills in the background), so its predictions
+        are run one at a time. """
+        with self._predicting:
+            return self.model.predict(inputs, verbose=0)
+
+    def train(self, data, resume=False, incremental=False):
         """ Trains the model on the provided data.
 
         This will print out a summary of the model structure, followed by
         metrics and progress on training. After each epoch, the weights will
         be saved to the model's directory, if one is provided.
 
+        Checkpoints are written (and samples generated) on a background
+        thread from a snapshot of the weights, so training carries on while
+        they're written. All of them have been written by the time this
+        returns. See `Checkpointer`.
+
+        The config's training mode decides how the data is fed to the model.
+        See `TrainingConfig.mode`.
+
+        Along with each checkpoint, the training state (the epoch, the
+        optimizer's weights, the random number generator's state, and
+        fingerprints of the data and the weights) is written to
+        '<weights_file>.state'. That's
+        what lets a later run resume, or train on newly appended data.
+
+        Example:
+            >> model.train(data)                    # Preempted after epoch 3
+            >> model.train(data, resume=True)       # Trains epochs 4 onwards
+            >> model.train(data + more, incremental=True)
+
         Args:
             data (string): The data to train the model on.
 
+            resume (bool, optional): Whether to carry on from the last
+                checkpoint of an unfinished run on the same data. If there is
+                no training state, training starts from scratch.
+
+            incremental (bool, optional): Whether to fine-tune on the data
+                that was appended to the data of the last run, for another
+                `epochs` epochs.
+
             batch_size (int): The batch size for training.
 
             epochs (int): The number of times to train on the entire data set.
@@ -91,28 +275,286 @@ class Model(object):
 
         Returns:
             Nothing. Updates the internal state of the model.
+
+        Raises:
+            ValueError: If `resume` or `incremental` is set and the data
+                doesn't start with the data of the last run.
+
+            ValueError: If `incremental` is set and there is no training state
+                or no new data.
+
+            ValueError: If `resume` or `incremental` is set and the training
+                state doesn't go with the weights in weights_file.
+
+            ValueError: If the model was loaded from a bundle.
         """
+        self._check_writable()
         alphabet = self.config.model.alphabet
         sequence_length = self.config.model.sequence_length
+
+        self.model.summary()
+        tokens = self.tokenize(data)
+        self._plan = self._plan_training(tokens, resume, incremental)
+
+        # Windows that end in the new data start up to sequence_length before it.
+        start = max(0, self._plan.offset - sequence_length)
+        encoded = one_hot_encoding(tokens[start : self._plan.length], alphabet)
+        epochs = self._plan.epochs
+
+        self._checkpointer = self._create_checkpointer(self._plan.best_loss)
+        try:
+            if self.config.training.mode == 'streams':
+                self._train_streams(encoded, epochs)
+            elif self.config.training.workers > 1:
+                self._train_parallel(encoded, epochs)
+            else:
+                self._train_windows(encoded, epochs)
+        finally:
+            self._checkpointer.close()
+
+    def _plan_training(self, tokens, resume, incremental):
+        """ Works out which epochs and data to train on, and restores the
+        random number generator if an earlier run is being continued. """
+        epochs = self.config.training.epochs
+        state_file = self.config.model.weights_file + ".state"
+
+        state = load_state(state_file) if resume or incremental else None
+        if state == None:
+            if incremental:
+                raise ValueError("Incremental training needs the training state of an earlier run.")
+            if resume:
+                print("No training state found in '%s'. Starting from scratch." % (state_file))
+            return TrainingPlan(range(epochs), 0, len(tokens), _corpus_fingerprint(tokens), None, [])
+
+        if not matches_weights(state, self.config.model.weights_file):
+            raise ValueError("The training state in '%s' doesn't go with the weights, which can happen if "
+                             "training was interrupted while checkpointing. Train without resuming." % (state_file))
+
+        length = int(state['length'])
+        if len(tokens) < length or _corpus_fingerprint(tokens[:length]) != str(state['corpus']):
+            raise ValueError("The training data doesn't start with the data of the last run.")
+
+        epoch = int(state['epoch']) + 1
+        optimizer_weights = [state['optimizer_%s' % i] for i in range(int(state['optimizer_count']))]
+        if incremental:
+            if len(tokens) == length:
+                raise ValueError("There's no new training data.")
+            # Validation losses on different data aren't comparable.
+            plan = TrainingPlan(range(epoch, epoch + epochs), length, len(tokens),
+                                _corpus_fingerprint(tokens), None, optimizer_weights)
+        else:
+            best_loss = float(state['best_loss'])
+            plan = TrainingPlan(range(epoch, int(state['end'])), int(state['offset']), length, str(state['corpus']),
+                                None if np.isnan(best_loss) else best_loss, optimizer_weights)
+
+        np.random.set_state(('MT19937', state['rng_keys'], int(state['rng_position']),
+                             int(state['rng_has_gauss']), float(state['rng_cached_gaussian'])))
+        return plan
+
+    def _train_windows(self, encoded, epochs):
+        """ Trains on every overlapping window of the encoded data. """
+        sequence_length = self.config.model.sequence_length
+
+        (X, y) = windows(encoded, sequence_length)
+        self._fit(X, y, epochs)
+
+    def _fit(self, X, y, epochs, validation_split=None):
+        """ Fits the model to the inputs and targets for each epoch, holding
+        out the config's validation_split unless another is given. """
         batch_size = self.config.training.batch_size
+        if validation_split == None:
+            validation_split = self.config.training.validation_split
+
+        self._restore_optimizer(self.model)
+        for i in epochs:
+            self._start_epoch(i)
+            history = self.model.fit(X, y, validation_split=validation_split, batch_size=batch_size, nb_epoch=1, shuffle=True)
+            validation_losses = history.history.get('val_loss') if history != None else None
+            self._end_epoch(i, validation_losses[-1] if validation_losses else None, self.model)
+
+    def train_targets(self, tokens, targets, start):
+        """Trains the model to predict a given distribution for each token of
+        the data, instead of the token itself. This is how a student model
+        learns from a teacher's predictions. See `distillation.py`.
+
+        Checkpoints are written just like in `train`. All of the data is
+        trained on: the caller holds out the validation data (see `distill`).
+
+        Args:
+            tokens (list): The data to train on, already tokenized.
+
+            targets (numpy.array): A distribution over the alphabet for each
+                token from `start` onwards.
+
+            start (int): The index of the first token with a target. It must
+                be at least the model's sequence_length.
+
+        Returns:
+            Nothing. Updates the internal state of the model.
+
+        Raises:
+            ValueError: If the model was loaded from a bundle.
+        """
+        self._check_writable()
+        alphabet = self.config.model.alphabet
+        sequence_length = self.config.model.sequence_length
         epochs = self.config.training.epochs
+
+        self.model.summary()
+        encoded = one_hot_encoding(tokens, alphabet)
+        X = np.array([encoded[i - sequence_length : i] for i in range(start, len(tokens))])
+
+        self._plan = TrainingPlan(range(epochs), 0, len(tokens), _corpus_fingerprint(tokens), None, [])
+        self._checkpointer = self._create_checkpointer()
+        try:
+            self._fit(X, np.asarray(targets), self._plan.epochs, validation_split=0.0)
+        finally:
+            self._checkpointer.close()
+
+    def _train_parallel(self, encoded, epochs):
+        """ Trains on every overlapping window of the encoded data, split
+        across several worker processes.
+
+        Each epoch, the shuffled windows are sharded between the workers. Every
+        worker trains its own copy of the model on `sync_steps` batches of its
+        shard, and then the copies' weights are averaged and sent back out for
+        the next round. Each worker keeps its own optimizer state, which isn't
+        checkpointed, so resumed runs start the workers' optimizers afresh.
+        """
+        sequence_length = self.config.model.sequence_length
+        batch_size = self.config.training.batch_size
         validation_split = self.config.training.validation_split
+        workers = self.config.training.workers
+        round_size = self.config.training.sync_steps * batch_size
+
+        # Like `fit`, the validation windows are the last ones in the data.
+        count = len(encoded) - sequence_length
+        split = count - int(count * validation_split)
+        (X_validation, y_validation) = windows(encoded[split:], sequence_length)
+
+        with model_pool(self, workers, state=encoded) as pool:
+            for i in epochs:
+                self._start_epoch(i)
+                shards = np.array_split(np.random.permutation(split), workers)
+                losses = []
+                for start in range(0, max(len(s) for s in shards), round_size):
+                    weights = self.model.get_weights()
+                    items = [(weights, s[start : start + round_size]) for s in shards]
+                    results = pool.map(with_model(_train_shard), [t for t in items if len(t[1]) > 0])
+                    self.model.set_weights(average_arrays([w for (w, _) in results]))
+                    losses.extend(loss for (_, loss) in results)
+
+                if len(losses) > 0:
+                    print("loss: %s - acc: %s" % tuple(np.mean(losses, axis=0)))
+                validation_loss = None
+                if len(X_validation) > 0:
+                    (validation_loss, validation_acc) = self.model.evaluate(X_validation, y_validation, verbose=0)
+                    print("val_loss: %s - val_acc: %s" % (validation_loss, validation_acc))
+                self._end_epoch(i, validation_loss)
+
+    def _train_streams(self, encoded, epochs):
+        """ Trains a stateful copy of the model on contiguous streams of the
+        encoded data with truncated backpropagation through time, then copies
+        the learned weights back into the window-based model.
+
+        The stateful model makes a prediction (and takes a loss) at every
+        character, so each character is processed once per epoch instead of
+        once per window that contains it.
+        """
+        sequence_length = self.config.model.sequence_length
+        count = self.config.training.streams or self.config.training.batch_size
+        steps = self.config.training.steps or sequence_length
+        validation_split = self.config.training.validation_split
+
+        # The validation data is held out from the end of the corpus and is
+        # scored by the window-based model, just like in "windows" mode.
+        split = len(encoded) - int(len(encoded) * validation_split)
+        (training, validation) = (encoded[:split], encoded[split - sequence_length:])
+        (X_validation, y_validation) = windows(validation, sequence_length)
+
+        stream_model = self._create_stream_model(count, steps)
+        stream_model.set_weights(self.model.get_weights())
+        self._restore_optimizer(stream_model)
+        for i in epochs:
+            self._start_epoch(i)
+            stream_model.reset_states()
+            losses = [stream_model.train_on_batch(X, y) for (X, y) in streams(training, count, steps)]
+            self.model.set_weights(stream_model.get_weights())
+
+            if len(losses) > 0:
+                print("loss: %s - acc: %s" % tuple(np.mean(losses, axis=0)))
+            validation_loss = None
+            if len(X_validation) > 0:
+                (validation_loss, validation_acc) = self.model.evaluate(X_validation, y_validation, verbose=0)
+                print("val_loss: %s - val_acc: %s" % (validation_loss, validation_acc))
+            self._end_epoch(i, validation_loss, stream_model)
+
+    def _check_writable(self):
+        """ Raises ValueError if the weights file is a bundle. Its fingerprint
+        is its content hash, so the weights in it must never change. """
+        weights_file = self.config.model.weights_file
+        if weights_file != None and isfile(weights_file) and is_bundle(weights_file):
+            raise ValueError("'%s' is a bundle, which is read-only. Train from the model's config and bundle the result."
+                             % (weights_file))
+
+    def _start_epoch(self, epoch):
+        print()
+        print("-" * 79)
+        print("Epoch %s" % (epoch))
+
+    def _end_epoch(self, epoch, validation_loss=None, trainer=None):
+        """ Checkpoints the weights along with the training state. `trainer`
+        is the keras model whose optimizer is doing the training, if any. """
+        (_, keys, position, has_gauss, cached_gaussian) = np.random.get_state()
+        optimizer_weights = [] if trainer == None else trainer.optimizer.get_weights()
+        state = {
+            'epoch': epoch,
+            'end': self._plan.epochs.stop,
+            'offset': self._plan.offset,
+            'length': self._plan.length,
+            'corpus': self._plan.corpus,
+            'rng_keys': keys,
+            'rng_position': position,
+            'rng_has_gauss': has_gauss,
+            'rng_cached_gaussian': cached_gaussian,
+            'optimizer_count': len(optimizer_weights),
+        }
+        state.update(('optimizer_%s' % j, w) for (j, w) in enumerate(optimizer_weights))
+        self._checkpointer.checkpoint(epoch, self.model.get_weights(), validation_loss, state)
+
+    def _restore_optimizer(self, trainer):
+        """ Restores the optimizer weights of an earlier run into `trainer`. """
+        if len(self._plan.optimizer_weights) == 0:
+            return
+
+        # Like keras' `load_model`, the optimizer's weights only exist once the
+        # training function has been built.
+        trainer.model._make_train_function()
+        trainer.optimizer.set_weights(self._plan.optimizer_weights)
+
+    def _create_checkpointer(self, best_loss=None):
+        """ Creates a checkpointer that saves (and samples) snapshots of the
+        weights with a shadow copy of the model, so that the training model is
+        never touched from the background thread. """
         weights_file = self.config.model.weights_file
+        keep = self.config.training.keep_checkpoints
+        sample_length = self.config.training.sample_length
 
-        self.model.summary()
-        transformed = self.transform(data)
-        encoded = one_hot_encoding(transformed, alphabet)
-        X = np.array([encoded[i : i + sequence_length] for i in range(len(encoded) - sequence_length)])
-        y = np.array(encoded[sequence_length:])
-        for i in range(epochs):
-            print()
-            print("-" * 79)
-            print("Epoch %s" % (i))
-            self.model.fit(X, y, validation_split=validation_split, batch_size=batch_size, nb_epoch=1, shuffle=True)
-            self.model.save(weights_file)
+        shadow = copy(self)
+        shadow.model = self._create_model(load=False)
+        shadow._predicting = Lock()
+
+        def save(weights, path):
+            shadow.model.set_weights(weights)
+            shadow.model.save(path)
             print("Saved weights to '%s'" % (weights_file))
+
+        def sample(weights):
+            shadow.model.set_weights(weights)
             print("Sampling model: ")
-            print(self.sample(50))
+            print(shadow.sample(sample_length))
+
+        return Checkpointer(save, weights_file, keep, sample if sample_length > 0 else None, best_loss=best_loss)
 
     def sample(self, size, novelty=None):
         """ Generates sample output from the model.
@@ -122,19 +564,94 @@ class Model(object):
             'OPERATE IN THE AREAS'
 
         Args:
-            size (int): The length of output to generate.
+            size (int): The number of characters to generate. With an
+                alphabet of multi-character tokens, the last token may be cut
+                short.
 
             novelty (optional: float): The novelty to use when generating the sequence.
 
         Returns:
             A sequence of characters generated by the model.
         """
+        with timed('sample'):
+            sequence = recite(self, self._sample_initial(), random_ints(max_weight(self)), novelty)
+            # Every token is at least a character long.
+            return "".join(c for (c, _) in zip(sequence, range(size)))[:size]
+
+    def sample_many(self, count, size, novelty=None, batch_size=256, processes=None):
+        """Generates several samples from the model. Each batch of samples is
+        advanced in lockstep, with a single batched prediction per step (see
+        `recite_many`), and batches can be spread across worker processes.
+
+        Samples are yielded as their batch completes, in order, so a large
+        number of them can be streamed without holding them all in memory.
+
+        Example:
+            >> list(model.sample_many(2, 10))
+            ['OPERATE IN', 'THE ENEMY ']
+
+        Args:
+            count (int): The number of samples to generate.
+
+            size (int): The number of characters in each sample. See
+                `sample`.
+
+            novelty (optional: float): The novelty to use when generating the
+                sequences.
+
+            batch_size (int, optional): The number of samples to generate
+                together.
+
+            processes (int, optional): The number of worker processes to
+                generate batches with. If this is None or 1, everything runs
+                in the current process.
+
+        Returns (generator(string)):
+            The samples.
+        """
+        batches = [(min(batch_size, count - i), size, novelty) for i in range(0, count, batch_size)]
+        for samples in imap_with_model(self, _sample_batch, batches, processes):
+            for sample in samples:
+                yield sample
+
+    def _sample_initial(self):
+        """ A random initial sequence for sampling, which ends in the
+        boundary so that samples start at the beginning of a token. """
         alphabet = self.config.model.alphabet
         sequence_length = self.config.model.sequence_length
 
-        initial = [choice(alphabet) for _ in range(sequence_length - 1)] + [self.config.model.boundary]
-        sequence = recite(self, initial, random_ints(), novelty)
-        return "".join(c for (c, _) in zip(sequence, range(size)))
+        return [RAND.choice(alphabet) for _ in range(sequence_length - 1)] + [self.config.model.boundary]
+
+    def tokenize(self, data):
+        """Transforms the data and splits it into the tokens of the model's
+        alphabet. Each token is a single step of the model.
+
+        For an alphabet of single characters, this is just the list of
+        transformed characters. Otherwise, the longest token that matches is
+        taken at each position (see `Tokenizer`).
+
+        Example:
+            >> model.config.model.alphabet
+            [' ', 'A', ..., 'Z', 'THE ', 'ING ', 'TH', 'ER', ...]
+            >> model.tokenize("The other thing.")
+            ['THE ', 'O', 'TH', 'ER', ' ', 'TH', 'ING ']
+
+        Args:
+            data (string): The data to tokenize.
+
+        Returns (list(string)):
+            The tokens of the transformed data.
+
+        Raises:
+            ValueError: See `transform`.
+
+            ValueError: If some part of the data doesn't match any token.
+        """
+        transformed = self.transform(data)
+        if isinstance(self.config.model.alphabet, str):
+            return list(transformed)
+
+        return self.tokenizer.tokenize(transformed)
 
     def transform(self, data):
         """Applies the model's transformations to the supplied data.
@@ -150,32 +667,25 @@ class Model(object):
             The transformed data.
 
         Raises:
-            Exception: If data contains characters that aren't specified in the
-            alphabet, after all of the transformations are performed.
+            ValueError: If data contains characters that aren't specified in
+            the alphabet, after all of the transformations are performed.
         """
-        alphabet = self.config.model.alphabet
-        transformations = self.config.transformations
-        translate = transformations.translate
-        substitutions = transformations.substitutions
-
-        if translate != None:
-            translate = transformations.translate
-            original = translate[0]
-            translated = translate[1]
-            data = data.translate(str.maketrans(original, translated))
-
-        if substitutions != None:
-            for (pattern, sub) in substitutions:
-                regex = re.compile(pattern)
-                data = regex.sub(sub, data)
-
-        chars = set(alphabet)
+        (table, substitutions, chars) = self._transformations
+
+        if table != None:
+            data = data.translate(table)
+
+        for (regex, sub) in substitutions:
+            data = regex.sub(sub, data)
+
         if any(c not in chars for c in data):
-            raise Exception("Data contains non-alphabet characters post-transformation. Can't continue.")
+            raise ValueError("Data contains non-alphabet characters post-transformation. Can't continue.")
 
         return data
 
-    def _create_model(self):
+    def _create_model(self, load=True):
+        """ Builds the keras model, loading the weights file if `load` is set
+        and it exists. """
         alphabet = self.config.model.alphabet
         sequence_length = self.config.model.sequence_length
         nodes = self.config.model.nodes
@@ -199,24 +709,174 @@ class Model(object):
         model.add(activation)
         model.compile(loss=loss, optimizer=optimizer, metrics=metrics)
 
-        if isfile(weights_file):
+        if load and isfile(weights_file):
             model.load_weights(weights_file)
 
         return model
 
-def load_model(config_file):
-    """Loads a model from a given config file.
+    def _create_stream_model(self, count, steps):
+        """ Creates a stateful model that predicts the next character at every
+        step of `count` parallel streams. Its weights have the same shapes as
+        the model from `_create_model`, so they can be copied between them.
+        """
+        alphabet = self.config.model.alphabet
+        nodes = self.config.model.nodes
+
+        alphabet_size = len(alphabet)
+        batch_input_shape = (count, steps, alphabet_size)
+        loss = 'categorical_crossentropy'
+        optimizer = 'adadelta'
+        metrics = ['accuracy']
+
+        hidden_layer = LSTM(nodes,
+                            batch_input_shape=batch_input_shape,
+                            stateful=True,
+                            return_sequences=True,
+                            consume_less="cpu")
+        output_layer = TimeDistributed(Dense(alphabet_size))
+        activation = Activation('softmax')
+
+        model = Sequential()
+        model.add(hidden_layer)
+        model.add(output_layer)
+        model.add(activation)
+        model.compile(loss=loss, optimizer=optimizer, metrics=metrics)
+
+        return model
+
+def _train_shard(model, item):
+    """ Trains a worker's model on the windows starting at the given indices
+    of the worker's encoded data. Returns the new weights and the mean loss
+    and accuracy. See `Model._train_parallel`. """
+    (weights, indices) = item
+    encoded = worker_state()
+    sequence_length = model.config.model.sequence_length
+    batch_size = model.config.training.batch_size
+
+    X = np.array([encoded[i : i + sequence_length] for i in indices])
+    y = np.array([encoded[i + sequence_length] for i in indices])
+
+    model.model.set_weights(weights)
+    losses = [model.model.train_on_batch(X[j : j + batch_size], y[j : j + batch_size])
+              for j in range(0, len(indices), batch_size)]
+    return (model.model.get_weights(), np.mean(losses, axis=0))
+
+def _compile_transformations(config):
+    """ Prepares the config's transformations once, for `Model.transform`.
+    Returns the translation table (or None), the compiled substitutions and
+    the set of characters in the alphabet. """
+    translate = config.transformations.translate
+    substitutions = config.transformations.substitutions
+
+    table = None if translate == None else str.maketrans(translate[0], translate[1])
+    compiled = [(re.compile(pattern), sub) for (pattern, sub) in substitutions or []]
+    return (table, compiled, set(''.join(config.model.alphabet)))
+
+def _sample_batch(model, item):
+    """ Generates a batch of samples. See `Model.sample_many`. """
+    (count, size, novelty) = item
+    with timed('sample_batch'):
+        initials = [model._sample_initial() for _ in range(count)]
+        weights = [list(islice(random_ints(max_weight(model)), size)) for _ in range(count)]
+        return ["".join(sample)[:size] for sample in recite_many(model, initials, weights, novelty)]
+
+def _corpus_fingerprint(tokens):
+    """ Hashes tokenized training data, to recognize it when resuming. """
+    return sha256(''.join(tokens).encode('utf-8')).hexdigest()
+
+def _fingerprint(config):
+    """ Hashes the config (ignoring where the weights live) and the weights. """
+    digest = sha256()
+    anonymized = config._replace(model=config.model._replace(weights_file=None))
+    digest.update(json.dumps(anonymized, sort_keys=True).encode('utf-8'))
+
+    weights_file = config.model.weights_file
+    if isfile(weights_file):
+        with open(weights_file, 'rb') as weights:
+            for block in iter(lambda: weights.read(1024 * 1024), b''):
+                digest.update(block)
+
+    return digest.digest()
+
+def load_model(config_file, verify=True):
+    """Loads a model from a given config file, or from a bundle written by
+    `save_bundle`.
+
+    A bundle's weights are memory-mapped and used without being parsed, and
+    its fingerprint is the bundle's content hash. Bundles are read-only:
+    train from the config file and bundle the result.
 
     Args:
-        config_file (string): The filename of the config file to load the model from.
+        config_file (string): The filename of the config file (or bundle) to
+            load the model from.
+
+        verify (bool, optional): Whether to check a bundle's contents against
+            its content hash. This reads the whole bundle once.
 
     Returns:
-        The loaded model.
+        The loaded model. Its class depends on the config's backend.
 
     Raises:
         Exception: If the model config fails to validate.
 
         Exception: If the keras model fails to build.
+
+        ValueError: If the bundle is invalid, or `verify` is set and it was
+            modified after it was written.
+    """
+    if not is_bundle(config_file):
+        return build_model(load_config(config_file))
+
+    bundle = read_bundle(config_file, verify)
+    bundle.config['model']['weights_file'] = config_file
+    return build_model(Config(bundle.config), bundle.arrays, bundle.content_hash)
+
+def build_model(config, weights=None, fingerprint=None):
+    """Builds a model from a config object.
+
+    Args:
+        config (Config): The model's config.
+
+        weights (list(numpy.array), optional): See `Model`.
+
+        fingerprint (bytes, optional): See `Model`.
+
+    Returns:
+        The model. Its class depends on the config's backend.
+
+    Raises:
+        Exception: If the keras model fails to build.
+    """
+    # These modules import this one.
+    if config.model.backend == 'ngram':
+        from ngram import NGramModel
+        return NGramModel(config, weights, fingerprint)
+
+    if config.model.backend == 'trace':
+        from tracing import TraceModel
+        return TraceModel(config, weights, fingerprint)
+
+    return Model(config, weights, fingerprint)
+
+def save_bundle(model, bundle_file):
+    """Packs a model's config and weights into a single file that
+    `load_model` can load. See `util/bundle.py`.
+
+    Example:
+        >> save_bundle(load_model("models/military/config.json"), "military.bundle")
+        >> load_model("military.bundle").fingerprint.hex()
+        '3f0c...'
+
+    Args:
+        model (Model): The model to bundle.
+
+        bundle_file (string): The path to write the bundle to.
+
+    Returns (bytes):
+        The bundle's content hash, which is the fingerprint of models loaded
+        from it.
     """
-    config = load_config(config_file)
-    return Model(config)
+    values = config_values(model.config)
+    # The weights live in the bundle itself.
+    values['model']['weights_file'] = None
+    return write_bundle(bundle_file, values, model.get_weights())
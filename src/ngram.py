@@ -0,0 +1,256 @@
+""" A character n-gram table that can stand in for the LSTM model. """
+import numpy as np
+from os import replace
+from os.path import isfile
+from model import Model
+from util.context import Context
+from util.metrics import timed_predictions
+
+class NGramModel(Model):
+    """A model that predicts the next character from counts of the characters
+    that followed the last `order` characters in the training data.
+
+    It keeps the same `predict(sequence, novelty)` contract as `Model`, but a
+    prediction is a handful of table lookups instead of a pass through the
+    LSTM, and training is a single counting pass over the data. The trade off
+    is a weaker model, so ciphertexts decode to less convincing text.
+
+    Predictions interpolate every order from 0 to `order`, which smooths over
+    contexts that are rare (or missing) in the training data:
+
+        P_j(c | h_j) = (count(h_j, c) + smoothing * P_j-1(c | h_j-1))
+                       / (count(h_j) + smoothing)
+
+    where h_j is the last j characters and P_-1 is uniform. Every character
+    always has a non-zero probability.
+
+    The table is stored in `weights_file` as a single numpy array of records,
+    sorted by context, and is memory-mapped when the model is loaded. See
+    `_context_keys` for how contexts are numbered.
+
+    Attrs:
+        config (Config): The model's config.
+
+        fingerprint (bytes): See `Model`.
+    """
+
+    @timed_predictions
+    def predict_raw(self, sequence):
+        """ See `Model.predict_raw`. """
+        if isinstance(sequence, Context):
+            return self._predict_indices(sequence.indices()[np.newaxis])[0]
+
+        return self._predict_raw([sequence])[0]
+
+    @timed_predictions
+    def predict_batch_raw(self, sequences):
+        """ See `Model.predict_batch_raw`. """
+        if len(sequences) == 0:
+            return []
+
+        return self._predict_raw(sequences)
+
+    @timed_predictions
+    def predict_windows(self, windows):
+        """ See `Model.predict_windows`. """
+        return self._predict_indices(np.asarray(windows, dtype=np.int64))
+
+    def train(self, data, resume=False, incremental=False):
+        """Counts the n-grams in the data and writes the table to the model's
+        weights file. The held out validation data is scored afterwards.
+
+        Training is a single pass over all of the data, so there is nothing
+        to resume and `resume` and `incremental` are accepted for
+        compatibility with `Model.train` but have no effect.
+
+        Args:
+            data (string): The data to train the model on.
+
+            resume (bool, optional): Ignored.
+
+            incremental (bool, optional): Ignored.
+
+        Returns:
+            Nothing. Updates the model's table.
+
+        Raises:
+            ValueError: If the model was loaded from a bundle.
+        """
+        self._check_writable()
+        alphabet = self.config.model.alphabet
+        order = self.config.model.order
+        validation_split = self.config.training.validation_split
+
+        tokens = self.tokenize(data)
+        split = len(tokens) - int(len(tokens) * validation_split)
+        (training, validation) = (tokens[:split], tokens[split:])
+
+        self.model = _count(_indices(training, self._lookup), len(alphabet), order)
+        self._save_table()
+
+        if len(validation) > 0:
+            context = tokens[max(0, split - order) : split]
+            print("val_loss: %s" % (self._loss(context, validation)))
+
+    def train_targets(self, tokens, targets, start):
+        """ Counts a given distribution for each token of the data in place
+        of the token itself. See `Model.train_targets`. """
+        self._check_writable()
+        alphabet = self.config.model.alphabet
+        order = self.config.model.order
+
+        indices = _indices(tokens, self._lookup)
+        self.model = _count(indices, len(alphabet), order, targets, start)
+        self._save_table()
+
+    def _save_table(self):
+        """ Atomically writes the table to the model's weights file. """
+        order = self.config.model.order
+        weights_file = self.config.model.weights_file
+
+        print("Counted %s contexts of up to %s characters" % (len(self.model), order))
+        temporary = weights_file + ".tmp"
+        with open(temporary, 'wb') as f:
+            np.save(f, self.model)
+        replace(temporary, weights_file)
+        print("Saved table to '%s'" % (weights_file))
+
+    def _loss(self, context, text):
+        """ Returns the mean cross-entropy (in nats) of the model's predictions
+        for each token of `text`, given the tokens before it. """
+        full = context + text
+
+        total = 0.0
+        for start in range(0, len(text), 4096):
+            end = min(len(text), start + 4096)
+            sequences = [full[max(0, i + len(context) - self.config.model.order) : i + len(context)]
+                         for i in range(start, end)]
+            # Sequences at the very start of the data may be shorter.
+            for length in set(len(s) for s in sequences):
+                rows = [i for (i, s) in enumerate(sequences) if len(s) == length]
+                probabilities = self._predict_raw([sequences[i] for i in rows])
+                targets = [self._lookup[text[start + i]] for i in rows]
+                total -= np.sum(np.log(probabilities[np.arange(len(rows)), targets]))
+
+        return total / len(text)
+
+    def _predict_raw(self, sequences):
+        """ Predicts the next character for several sequences of equal
+        length. Returns an array with a row of probabilities per sequence. """
+        indices = np.array([_indices(sequence, self._lookup) for sequence in sequences], dtype=np.int64)
+        return self._predict_indices(indices.reshape((len(sequences), -1)))
+
+    def _predict_indices(self, indices):
+        """ Same as `_predict_raw`, but for sequences that are already mapped
+        to alphabet indices, one row per sequence. """
+        alphabet = self.config.model.alphabet
+        order = self.config.model.order
+        smoothing = self.config.model.smoothing
+        table = self.model
+
+        keys = np.zeros(len(indices), dtype=np.int64)
+        probabilities = np.full((len(indices), len(alphabet)), 1.0 / len(alphabet))
+        for j in range(min(order, indices.shape[1]) + 1):
+            if j > 0:
+                keys += (indices[:, -j] + 1) * (len(alphabet) + 1) ** (j - 1)
+
+            rows = np.searchsorted(table['key'], keys)
+            found = rows < len(table)
+            found[found] = table['key'][rows[found]] == keys[found]
+            if not np.any(found):
+                break # Longer contexts can't be present either.
+
+            counts = table['counts'][rows[found]].astype(np.float64)
+            totals = counts.sum(axis=1, keepdims=True)
+            probabilities[found] = (counts + smoothing * probabilities[found]) / (totals + smoothing)
+
+        return probabilities
+
+    def get_weights(self):
+        """ See `Model.get_weights`. The table is the only weight. """
+        return [self.model]
+
+    def set_weights(self, weights):
+        """ Uses the given table in place, without copying it. See
+        `Model.set_weights`. """
+        alphabet = self.config.model.alphabet
+        weights_file = self.config.model.weights_file
+
+        self.model = _checked_table(weights[0], len(alphabet), weights_file)
+
+    def _create_model(self, load=True):
+        alphabet = self.config.model.alphabet
+        weights_file = self.config.model.weights_file
+
+        self._lookup = {c: i for (i, c) in enumerate(alphabet)}
+        if load and isfile(weights_file):
+            return _checked_table(np.load(weights_file, mmap_mode='r'), len(alphabet), weights_file)
+
+        return np.zeros(0, dtype=_table_dtype(len(alphabet)))
+
+def _table_dtype(alphabet_size):
+    """ A row of the table: a context's key and the counts of each character
+    that followed it. Counts are floats so that they can be fractional. """
+    return np.dtype([('key', '<i8'), ('counts', '<f4', (alphabet_size,))])
+
+def _checked_table(table, alphabet_size, source):
+    """ Returns the table, after checking that its rows are laid out like
+    `_table_dtype`. Tables written with integer counts (before counts could be
+    fractional) would otherwise be misread. """
+    expected = _table_dtype(alphabet_size)
+    if table.dtype != expected:
+        raise ValueError("The n-gram table in '%s' has rows of %s, but %s was expected. Train the model again."
+                         % (source, table.dtype, expected))
+    return table
+
+def _indices(text, lookup):
+    """ Maps each token (or character) of the text to its index in the
+    alphabet. """
+    if any(c not in lookup for c in text):
+        raise ValueError("Sequence contains tokens that aren't in the alphabet.")
+    return np.array([lookup[c] for c in text], dtype=np.int64)
+
+def _context_keys(indices, alphabet_size, length):
+    """Numbers the context of `length` characters that precedes each position
+    of `indices`, from position `length` onwards.
+
+    A context c_1 ... c_j (where c_j is the most recent character) is
+    numbered sum((index(c_t) + 1) * (alphabet_size + 1)^(j - t)). Indices are
+    shifted by one so that contexts of different lengths never share a key,
+    and the empty context is 0.
+    """
+    keys = np.zeros(len(indices) - length, dtype=np.int64)
+    for j in range(1, length + 1):
+        keys += (indices[length - j : len(indices) - j] + 1) * (alphabet_size + 1) ** (j - 1)
+    return keys
+
+def _count(indices, alphabet_size, order, targets=None, start=0):
+    """Builds the table of counts for every context of up to `order`
+    characters in the data.
+
+    If `targets` is provided, it holds a distribution over the alphabet for
+    each character from `start` onwards (e.g. a teacher model's predictions),
+    which is counted in place of the character itself. Characters before
+    `start` are only used as context.
+    """
+    keys = []
+    positions = []
+    for length in range(min(order, len(indices) - 1) + 1):
+        first = max(length, start)
+        keys.append(_context_keys(indices, alphabet_size, length)[first - length:])
+        positions.append(np.arange(first, len(indices)))
+
+    keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+    positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+
+    (unique, rows) = np.unique(keys, return_inverse=True)
+    counts = np.zeros((len(unique), alphabet_size))
+    if targets is None:
+        np.add.at(counts, (rows, indices[positions]), 1)
+    else:
+        np.add.at(counts, rows, np.asarray(targets)[positions - start])
+
+    table = np.zeros(len(unique), dtype=_table_dtype(alphabet_size))
+    table['key'] = unique
+    table['counts'] = counts
+    return table
@@ -0,0 +1,112 @@
+""" Runs model-bound work across a pool of worker processes. """
+from functools import partial
+from contextlib import contextmanager
+from multiprocessing import Pool
+from util.shared import SharedArrays, attach_arrays
+
+# The model (and any extra state) owned by the current worker process.
+_MODEL = None
+_STATE = None
+
+# The shared memory that the worker's model's weights live in. It must stay
+# referenced for as long as the model is used.
+_SHARED = None
+
+def map_with_model(model, fn, items, processes=None):
+    """Calls `fn(model, item)` for every item, optionally spreading the calls
+    across a pool of worker processes.
+
+    Models can't be sent between processes, so each worker builds its own
+    copy of the model when it starts. See `model_pool`.
+
+    Example:
+        >> map_with_model(model, encode, ["FOO", "BAR"], processes=2)
+        [b'...', b'...']
+
+    Args:
+        model (Model): The model to pass to `fn`.
+
+        fn (function): A module-level (i.e. picklable) function that takes a
+            model and an item.
+
+        items (list): The items to call `fn` with.
+
+        processes (int, optional): The number of worker processes to use. If
+            this is None or 1, everything runs in the current process.
+
+    Returns (list):
+        The results of each call, in the same order as `items`.
+    """
+    return list(imap_with_model(model, fn, items, processes))
+
+def imap_with_model(model, fn, items, processes=None):
+    """Same as `map_with_model`, but yields each result as soon as it (and
+    every result before it) is ready, instead of waiting for all of them.
+
+    Returns (generator):
+        The results of each call, in the same order as `items`.
+    """
+    if processes == None or processes <= 1 or len(items) <= 1:
+        for item in items:
+            yield fn(model, item)
+        return
+
+    with model_pool(model, min(processes, len(items))) as pool:
+        for result in pool.imap(with_model(fn), items):
+            yield result
+
+@contextmanager
+def model_pool(model, processes, state=None):
+    """Creates a pool of worker processes that each own a copy of the model.
+    Use `with_model` to call functions in the pool with the worker's model.
+
+    The model's weights are published into shared memory once, and each
+    worker builds its model around them from `type(model)` and `model.config`
+    instead of loading the weights file itself. Weights that a model can use
+    in place (e.g. an n-gram table) are never copied, so the memory used by
+    the pool doesn't grow with the number of workers. The shared memory is
+    released when the pool is.
+
+    Example:
+        >> with model_pool(model, 4, state=corpus) as pool:
+        >>     pool.map(with_model(fn), items)
+
+    Args:
+        model (Model): The model to copy into each worker.
+
+        processes (int): The number of worker processes.
+
+        state (obj, optional): A picklable value that is sent to each worker
+            once when it starts, instead of with every call. Workers can read
+            it with `worker_state`.
+
+    Yields (multiprocessing.Pool):
+        The pool of workers.
+    """
+    shared = SharedArrays(model.get_weights())
+    try:
+        initargs = (type(model), model.config, model.fingerprint, shared.handle, state)
+        with Pool(processes, initializer=_initialize_worker, initargs=initargs) as pool:
+            yield pool
+    finally:
+        shared.close()
+
+def with_model(fn):
+    """ Wraps `fn(model, item)` into a function of `item` that can be called
+    in a `model_pool`. """
+    return partial(_apply, fn)
+
+def worker_state():
+    """ Returns the `state` that the current worker's pool was created with. """
+    return _STATE
+
+def _initialize_worker(constructor, config, fingerprint, handle, state):
+    """ Builds the worker's model around the shared weights. """
+    global _MODEL, _STATE, _SHARED
+    (_SHARED, weights) = attach_arrays(handle)
+    _MODEL = constructor(config, weights, fingerprint)
+    _STATE = state
+
+def _apply(fn, item):
+    """ Calls `fn` with the worker's model. """
+    return fn(_MODEL, item)
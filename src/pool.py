@@ -0,0 +1,115 @@
+""" Precomputes initial sequences ahead of time so that encoding doesn't have
+to generate one on the request path. """
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from encoding import initialize
+
+class InitializationPool(object):
+    """A pool of freshly generated (weights, initial_sequence) pairs for a
+    model, as returned by `encoding.initialize`.
+
+    Generating an initial sequence takes sequence_length + normalizing_length
+    + priming_length model predictions, which dominates the cost of encoding
+    short messages. The pool generates these ahead of time, either on a
+    background thread or explicitly via `fill` during idle time.
+
+    Every pair is handed out at most once. Reusing a pair would leak the
+    relationship between two ciphertexts, so pairs are removed from the pool
+    when taken and never put back.
+
+    Example:
+        >> pool = InitializationPool(model, size=32)
+        >> pool.start()
+        >> ciphertext = encrypt(model, "foo", "bar", pool=pool)
+        >> pool.stop()
+
+    Attrs:
+        model (Model): The model that the pool generates sequences for.
+
+        size (int): The maximum number of pairs to hold.
+    """
+
+    def __init__(self, model, size=16):
+        """ Instantiates an empty pool. Call `start` or `fill` to populate it.
+
+        Args:
+            model (Model): The model to generate initial sequences for.
+
+            size (int, optional): The maximum number of pairs to hold.
+
+        Raises:
+            ValueError: If `size` is less than 1.
+        """
+        if size < 1:
+            raise ValueError("Pool size must be greater than 0.")
+
+        self.model = model
+        self.size = size
+        self._queue = Queue(maxsize=size)
+        self._stopped = Event()
+        self._thread = None
+
+    def __len__(self):
+        """ The (approximate) number of pairs currently in the pool. """
+        return self._queue.qsize()
+
+    def get(self):
+        """Takes a pair out of the pool. If the pool is empty, a pair is
+        generated inline instead.
+
+        Returns ((list(ints), list(char))):
+            A tuple containing the weights used to generate the sequence, and
+            the sequence itself.
+        """
+        try:
+            return self._queue.get_nowait()
+        except Empty:
+            return initialize(self.model)
+
+    def fill(self, count=None):
+        """Synchronously generates pairs until the pool is full or `count`
+        pairs have been added.
+
+        Args:
+            count (int, optional): The maximum number of pairs to generate.
+
+        Returns (int):
+            The number of pairs that were added.
+        """
+        added = 0
+        while (count == None or added < count) and not self._queue.full():
+            try:
+                self._queue.put_nowait(initialize(self.model))
+            except Full:
+                break # Raced with another producer.
+            added += 1
+        return added
+
+    def start(self):
+        """ Starts a background thread that keeps the pool full. """
+        if self._thread != None:
+            return
+
+        self._stopped.clear()
+        self._thread = Thread(target=self._refill, name="InitializationPool", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """ Stops the background thread, if one is running. """
+        if self._thread == None:
+            return
+
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _refill(self):
+        """ Generates pairs until stopped, blocking while the pool is full. """
+        while not self._stopped.is_set():
+            pair = initialize(self.model)
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put(pair, timeout=0.1)
+                    break
+                except Full:
+                    continue
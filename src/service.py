@@ -0,0 +1,157 @@
+""" A resident menc process that serves encryption over local HTTP. """
+import json
+from io import BytesIO
+from threading import Lock
+from base64 import b64encode, b64decode
+from http.server import ThreadingHTTPServer
+from hosting import ModelHost, warm_up
+from telemetry import TELEMETRY
+from encryption import encrypt_with_stats, decrypt
+from util.container import is_container, read_header
+from util.metrics import REGISTRY, metrics_handler, timed
+
+class Service(object):
+    """Keeps a model loaded and warm between requests, so that a stream of
+    messages doesn't pay to load the model for each of them.
+
+    Requests are JSON, POSTed to:
+
+        /encrypt  {"key": ..., "plaintext": ...}
+                  -> {"ciphertext": <base64>, "fingerprint": <hex>,
+                      "stats": <EncodingStats>}
+        /decrypt  {"key": ..., "ciphertext": <base64>} -> {"plaintext": ...}
+        /sample   {"size": ..., "count": 1} -> {"samples": [...]}
+        /reload   {} -> {"fingerprint": <hex>}
+
+    Metrics are served at /metrics, and /ready answers 200 once the model is
+    warm (see `util.metrics.serve_metrics`). The stats of each message that's
+    encrypted are aggregated by `telemetry.TELEMETRY`, and served with them.
+
+    The model can be reloaded (e.g. after it's retrained) without downtime:
+    the new one is loaded and warmed up while the old one keeps serving, and
+    is then swapped in. See `hosting.ModelHost`. Ciphertexts are decrypted
+    with the model whose fingerprint is in their header, for as long as it's
+    live.
+
+    Note: Keys are sent in the clear. Only listen on the loopback interface,
+    or behind something that adds TLS.
+
+    Example:
+        >> service = Service(lambda: load_model("models/military/config.json"))
+        >> server = service.server(8750)
+        >> service.warm_up()
+        >> server.serve_forever()
+
+    Attrs:
+        host (ModelHost): Holds the models that requests are served with.
+
+        telemetry (Telemetry): Aggregates the stats of encrypted messages.
+
+        ready (bool): Whether the model has been warmed up.
+    """
+
+    def __init__(self, load, model=None, telemetry=TELEMETRY):
+        """ Instantiates a service. It isn't ready until it's warmed up.
+
+        Args:
+            load (function): Loads the model, e.g. from its config file. It's
+                called again for each reload.
+
+            model (Model, optional): The model to start with. It's loaded with
+                `load` if not provided.
+
+            telemetry (Telemetry, optional): See `telemetry`.
+        """
+        self.host = ModelHost(model if model != None else load())
+        self.telemetry = telemetry
+        self.ready = False
+        self._load = load
+        self._reloading = Lock()
+
+    @property
+    def model(self):
+        """ (Model): The model that new requests are served with. """
+        return self.host.current
+
+    def warm_up(self):
+        """ Warms up the model (see `hosting.warm_up`), and marks the service
+        as ready. """
+        warm_up(self.model)
+        self.ready = True
+
+    def reload(self, request=None):
+        """Loads the model again, warms it up and swaps it in. Requests are
+        served by the old model in the meantime, and the ones that are using
+        it when it's swapped out finish on it. Reloads are run one at a time.
+
+        Returns (dict):
+            The new model's fingerprint, as hex.
+
+        Raises:
+            Exception: If the model fails to load. The old model keeps
+                serving.
+        """
+        with self._reloading, timed('reload'):
+            model = warm_up(self._load())
+            self.host.swap(model)
+        return {'fingerprint': model.fingerprint.hex()}
+
+    def encrypt(self, request):
+        with self.host.acquire() as model:
+            (ciphertext, stats) = encrypt_with_stats(model, request['key'], request['plaintext'])
+        self.telemetry.observe(stats)
+        return {'ciphertext': str(b64encode(ciphertext), 'utf-8'),
+                'fingerprint': model.fingerprint.hex(),
+                'stats': stats._asdict()}
+
+    def decrypt(self, request):
+        ciphertext = b64decode(request['ciphertext'])
+        # Containers name the model they were encrypted with.
+        fingerprint = read_header(BytesIO(ciphertext)).fingerprint if is_container(ciphertext) else None
+        with self.host.acquire(fingerprint) as model:
+            return {'plaintext': decrypt(model, request['key'], ciphertext)}
+
+    def sample(self, request):
+        size = int(request['size'])
+        count = int(request.get('count', 1))
+        with self.host.acquire() as model, timed('sample'):
+            return {'samples': list(model.sample_many(count, size))}
+
+    def server(self, port, host='127.0.0.1'):
+        """Creates an HTTP server for the service. It isn't started.
+
+        Args:
+            port (int): The port to listen on. 0 picks a free port.
+
+            host (string, optional): The address to listen on.
+
+        Returns (ThreadingHTTPServer):
+            The server. Call `serve_forever` to start it.
+        """
+        return ThreadingHTTPServer((host, port), _handler(self))
+
+def _handler(service):
+    """ A request handler class that dispatches to the service. """
+    routes = {'/encrypt': service.encrypt, '/decrypt': service.decrypt, '/sample': service.sample,
+              '/reload': service.reload}
+
+    class ServiceHandler(metrics_handler(REGISTRY, lambda: service.ready)):
+        def do_POST(self):
+            if self.path not in routes:
+                return self.respond(404, "not found\n")
+            if not service.ready:
+                return self.respond_json(503, {'error': "The model isn't ready."})
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                response = routes[self.path](json.loads(self.rfile.read(length) or b'{}'))
+            except (ValueError, KeyError, TypeError) as e:
+                return self.respond_json(400, {'error': str(e) or type(e).__name__})
+            except Exception as e: # e.g. a reloaded model failed to build
+                return self.respond_json(500, {'error': str(e) or type(e).__name__})
+            self.respond_json(200, response)
+
+        def respond_json(self, status, body):
+            self.respond(status, json.dumps(body), 'application/json')
+
+    return ServiceHandler
@@ -0,0 +1,167 @@
+""" Per-message encoding statistics, and histograms that aggregate them. """
+from threading import Lock
+from collections import namedtuple
+from util.metrics import REGISTRY, HistogramMetric, exponential_buckets
+from util.modeling import ModelWrapper
+
+EncodingStats = namedtuple('EncodingStats', [
+# What encoding (or encrypting) a single message did. See
+# `encoding.encode_with_stats` and `encryption.encrypt_with_stats`.
+
+    'tokens',
+    # The number of tokens of plaintext that were encoded, including a
+    # boundary added to terminate it.
+
+    'plaintext_bytes',
+    # The size of the plaintext, encoded as UTF-8.
+
+    'output_bytes',
+    # The size of the output: the encoded weights, or the whole container
+    # when encrypting.
+
+    'expansion_ratio',
+    # output_bytes / plaintext_bytes. NaN for an empty plaintext.
+
+    'padding_tokens',
+    # The number of values of padding that were added.
+
+    'padding_trials',
+    # The number of padding trials up to and including the one that was
+    # used. See `util.padding.PaddingReport`.
+
+    'padding_novelty',
+    # The novelty of the padding trial that was used.
+
+    'padding_candidates',
+    # The number of candidate padding tokens that were started.
+
+    'initialization_predictions',
+    # The number of sequences predicted while generating the initial
+    # sequence. 0 if it was taken from an initialization pool.
+
+    'encoding_predictions',
+    # The number of sequences predicted while encoding the plaintext.
+
+    'padding_predictions',
+    # The number of sequences predicted while generating padding.
+
+    'seconds',
+    # The time the message took to encode.
+])
+
+# The bucket bounds that each field of `EncodingStats` is aggregated into.
+DEFAULT_BUCKETS = {
+    'tokens': exponential_buckets(1, 4, 10),
+    'plaintext_bytes': exponential_buckets(16, 4, 10),
+    'output_bytes': exponential_buckets(16, 4, 10),
+    'expansion_ratio': exponential_buckets(0.5, 2, 12),
+    'padding_tokens': exponential_buckets(1, 2, 8),
+    'padding_trials': exponential_buckets(1, 2, 12),
+    'padding_novelty': exponential_buckets(0.125, 2, 10),
+    'padding_candidates': exponential_buckets(1, 2, 12),
+    'initialization_predictions': exponential_buckets(1, 4, 10),
+    'encoding_predictions': exponential_buckets(1, 4, 10),
+    'padding_predictions': exponential_buckets(1, 4, 10),
+    'seconds': exponential_buckets(0.001, 2, 16),
+}
+
+# The description of each field of `EncodingStats`, for its metric.
+_HELP = {
+    'tokens': "Tokens of plaintext encoded, per message.",
+    'plaintext_bytes': "The size of the plaintext in UTF-8, per message.",
+    'output_bytes': "The size of the output (the whole container, when encrypting), per message.",
+    'expansion_ratio': "Bytes of output per byte of plaintext, per message.",
+    'padding_tokens': "Values of padding added, per message.",
+    'padding_trials': "Padding trials up to and including the one that was used, per message.",
+    'padding_novelty': "The novelty of the padding trial that was used, per message.",
+    'padding_candidates': "Candidate padding tokens started, per message.",
+    'initialization_predictions': "Sequences predicted to generate the initial sequence (0 if it came from a pool), per message.",
+    'encoding_predictions': "Sequences predicted to encode the plaintext, per message.",
+    'padding_predictions': "Sequences predicted to generate padding, per message.",
+    'seconds': "How long the message took to encode.",
+}
+
+class Telemetry(object):
+    """Aggregates the stats of every message a long-running process encodes
+    into a histogram per field. It's safe to observe from several threads.
+
+    Each field's histogram is a metric named 'menc_message_<field>', which can
+    be registered to be served with the process' other metrics. `TELEMETRY`
+    is registered with `util.metrics.REGISTRY`, and `menc serve` reports every
+    message it encrypts to it.
+
+    Example:
+        >> telemetry = Telemetry()
+        >> (ciphertext, stats) = encrypt_with_stats(model, key, plaintext)
+        >> telemetry.observe(stats)
+        >> telemetry.snapshot()['padding_trials'].quantile(0.99)
+        12.0
+
+    Attrs:
+        messages (int): The number of messages observed.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, registry=None):
+        """ Instantiates empty histograms.
+
+        Args:
+            buckets (dict(string, list(float)), optional): The bucket bounds
+                for each field of `EncodingStats` to aggregate. Fields that
+                aren't present aren't aggregated.
+
+            registry (Registry, optional): The registry to serve the
+                histograms from. They aren't served if not provided.
+
+        Raises:
+            ValueError: If the registry already has the histograms' metrics.
+        """
+        self.messages = 0
+        self._histograms = {field: HistogramMetric('menc_message_' + field, _HELP[field], bounds)
+                            for (field, bounds) in buckets.items()}
+        self._lock = Lock()
+        if registry != None:
+            for histogram in self._histograms.values():
+                registry.register(histogram)
+
+    def observe(self, stats):
+        """ Adds a message's `EncodingStats` to the histograms. """
+        with self._lock:
+            self.messages += 1
+            for (field, histogram) in self._histograms.items():
+                histogram.observe(getattr(stats, field))
+
+    def snapshot(self):
+        """ Returns (dict(string, Histogram)): A consistent copy of each
+        field's histogram. """
+        with self._lock:
+            return {field: histogram.histogram() for (field, histogram) in self._histograms.items()}
+
+TELEMETRY = Telemetry(registry=REGISTRY)
+
+class PredictionCounter(ModelWrapper):
+    """Wraps a model and counts the sequences it's asked to predict. It can
+    be used anywhere a model is expected.
+
+    Attrs:
+        predictions (int): The number of sequences the wrapped model has
+            been asked to predict.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.predictions = 0
+
+    def predict_raw(self, sequence):
+        """ See `Model.predict_raw`. """
+        self.predictions += 1
+        return self.model.predict_raw(sequence)
+
+    def predict_batch_raw(self, sequences):
+        """ See `Model.predict_batch_raw`. """
+        self.predictions += len(sequences)
+        return self.model.predict_batch_raw(sequences)
+
+    def predict_windows(self, windows):
+        """ See `Model.predict_windows`. """
+        self.predictions += len(windows)
+        return self.model.predict_windows(windows)
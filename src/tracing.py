@@ -0,0 +1,227 @@
+""" Records a model's predictions and replays them without the model. """
+import numpy as np
+from os.path import isfile
+from time import perf_counter
+from config import config_values
+from model import Model
+from util.bundle import read_bundle, write_bundle
+from util.context import Context
+from util.metrics import timed_predictions
+from util.modeling import ModelWrapper
+
+# Multiplies each step's index when hashing a window. See `_window_keys`.
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+class TraceRecorder(ModelWrapper):
+    """Wraps a model and records every raw prediction it makes, so that a
+    real run (e.g. encrypting a production workload) can be replayed later
+    by a `TraceModel`. It can be used anywhere a model is expected.
+
+    Recording only works in the current process: pass the recorder to
+    functions that would otherwise spread the work across processes with
+    `processes` unset.
+
+    Example:
+        >> recorder = TraceRecorder(load_model("models/military/config.json"))
+        >> ciphertext = encrypt(recorder, "key", "ATTACK AT DAWN")
+        >> recorder.save("military.trace")
+        >> decrypt(load_model("military.trace"), "key", ciphertext)
+        'ATTACK AT DAWN'
+
+    Attrs:
+        model (Model): The wrapped model.
+
+        config (Config): The wrapped model's config.
+
+        fingerprint (bytes): The wrapped model's fingerprint.
+
+        seconds (float): The time spent in the wrapped model's predictions,
+            i.e. the cost of inference. Whatever else a run takes is overhead
+            that a `TraceModel` replay reproduces.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.fingerprint = model.fingerprint
+        self.seconds = 0.0
+        self._records = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def predict_raw(self, sequence):
+        """ See `Model.predict_raw`. """
+        start = perf_counter()
+        probabilities = self.model.predict_raw(sequence)
+        self.seconds += perf_counter() - start
+
+        self._records[self._key(sequence)] = np.array(probabilities)
+        return probabilities
+
+    def predict_batch_raw(self, sequences):
+        """ See `Model.predict_batch_raw`. """
+        start = perf_counter()
+        batch = self.model.predict_batch_raw(sequences)
+        self.seconds += perf_counter() - start
+
+        for (sequence, probabilities) in zip(sequences, batch):
+            self._records[self._key(sequence)] = np.array(probabilities)
+        return batch
+
+    def save(self, trace_file):
+        """Writes the recorded predictions to a trace file, which
+        `load_model` loads as a `TraceModel`. A trace file is a bundle (see
+        `util/bundle.py`) of the model's config, with a backend of "trace".
+
+        Args:
+            trace_file (string): The path to write the trace to.
+
+        Returns (bytes):
+            The trace file's content hash.
+        """
+        sequence_length = self.config.model.sequence_length
+        alphabet_size = len(self.config.model.alphabet)
+
+        dtype = np.result_type(np.float32, *self._records.values())
+        table = np.zeros(len(self._records), dtype=_trace_dtype(sequence_length, alphabet_size, dtype))
+        for (row, (key, probabilities)) in enumerate(self._records.items()):
+            table['window'][row, sequence_length - len(key):] = key
+            table['window'][row, :sequence_length - len(key)] = -1
+            table['probabilities'][row] = probabilities
+        table['key'] = _window_keys(table['window'])
+        table.sort(order='key')
+
+        values = config_values(self.config)
+        values['model'].update(backend='trace', weights_file=None)
+        fingerprint = np.frombuffer(self.fingerprint, dtype=np.uint8)
+        return write_bundle(trace_file, values, [table, fingerprint])
+
+class TraceModel(Model):
+    """A model that replays the predictions recorded by a `TraceRecorder`,
+    looking each window up in a table instead of running a model.
+
+    Replaying a run exercises the encoding, padding, sampling and packing
+    code with realistic predictions, but at almost no inference cost and
+    without loading keras, which isolates the overhead of everything but the
+    model. Ciphertexts are tagged with the recorded model's fingerprint, so
+    ciphertexts from the recorded run decrypt with the trace and vice versa.
+
+    Windows that weren't recorded (e.g. because encryption drew a different
+    IV) can't be replayed exactly. They're given the recorded prediction of
+    a pseudo-randomly chosen window instead, which keeps the predictions
+    realistic in shape, and are counted in `misses`.
+
+    The table is stored in the trace file sorted by a hash of each window,
+    and is memory-mapped when the model is loaded.
+
+    Attrs:
+        config (Config): The model's config.
+
+        fingerprint (bytes): The recorded model's fingerprint.
+
+        hits (int): The number of predictions that were replayed exactly.
+
+        misses (int): The number of predictions that weren't recorded.
+    """
+
+    def __init__(self, config, weights=None, fingerprint=None):
+        """ See `Model`. """
+        self.hits = 0
+        self.misses = 0
+        super().__init__(config, weights, fingerprint)
+        if len(self._fingerprint) > 0:
+            self.fingerprint = self._fingerprint.tobytes()
+
+    @timed_predictions
+    def predict_raw(self, sequence):
+        """ See `Model.predict_raw`. """
+        return self.predict_batch_raw([sequence])[0]
+
+    @timed_predictions
+    def predict_batch_raw(self, sequences):
+        """ See `Model.predict_batch_raw`. """
+        sequence_length = self.config.model.sequence_length
+
+        if len(sequences) == 0:
+            return []
+
+        windows = np.full((len(sequences), sequence_length), -1, dtype=np.int32)
+        for (row, sequence) in enumerate(sequences):
+            indices = self._indices(sequence)
+            if len(indices) > 0:
+                windows[row, -len(indices):] = indices
+
+        return self.predict_windows(windows)
+
+    @timed_predictions
+    def predict_windows(self, windows):
+        """ See `Model.predict_windows`. Short windows are padded on the left
+        with -1. """
+        alphabet_size = len(self.config.model.alphabet)
+        table = self.model
+
+        windows = np.asarray(windows, dtype=np.int32)
+        if len(table) == 0:
+            self.misses += len(windows)
+            return np.full((len(windows), alphabet_size), 1.0 / alphabet_size)
+
+        keys = _window_keys(windows)
+        rows = np.minimum(np.searchsorted(table['key'], keys), len(table) - 1)
+        found = (table['key'][rows] == keys) & np.all(table['window'][rows] == windows, axis=1)
+        rows[~found] = keys[~found].view(np.uint64) % np.uint64(len(table))
+
+        self.hits += int(np.count_nonzero(found))
+        self.misses += int(len(found) - np.count_nonzero(found))
+        return table['probabilities'][rows]
+
+    def train(self, data, resume=False, incremental=False):
+        """ Traces are recorded with a `TraceRecorder`, not trained.
+
+        Raises:
+            ValueError: Always.
+        """
+        raise ValueError("Trace models can't be trained. Record one with a TraceRecorder.")
+
+    def get_weights(self):
+        """ See `Model.get_weights`. The table and the recorded model's
+        fingerprint. """
+        return [self.model, self._fingerprint]
+
+    def set_weights(self, weights):
+        """ Uses the given table in place. See `Model.set_weights`. """
+        (self.model, self._fingerprint) = weights
+
+    def _indices(self, sequence):
+        if isinstance(sequence, Context):
+            return sequence.indices()
+
+        if any(x not in self._lookup for x in sequence):
+            raise ValueError("Sequence contains tokens that aren't in the alphabet.")
+        return [self._lookup[x] for x in sequence]
+
+    def _create_model(self, load=True):
+        alphabet = self.config.model.alphabet
+        sequence_length = self.config.model.sequence_length
+        weights_file = self.config.model.weights_file
+
+        self._lookup = {x: i for (i, x) in enumerate(alphabet)}
+        self._fingerprint = np.zeros(0, dtype=np.uint8)
+        if load and isfile(weights_file):
+            (table, self._fingerprint) = read_bundle(weights_file).arrays
+            return table
+
+        return np.zeros(0, dtype=_trace_dtype(sequence_length, len(alphabet), np.float32))
+
+def _trace_dtype(sequence_length, alphabet_size, dtype):
+    """ A row of the table: the hash of a window, the window's alphabet
+    indices (padded on the left with -1 if it's short) and the raw
+    prediction that followed it. """
+    return np.dtype([('key', '<i8'),
+                     ('window', '<i4', (sequence_length,)),
+                     ('probabilities', np.dtype(dtype).newbyteorder('<'), (alphabet_size,))])
+
+def _window_keys(windows):
+    """ Hashes each row of alphabet indices into a 64-bit key. """
+    powers = np.cumprod(np.full(windows.shape[1], _MULTIPLIER, dtype=np.uint64))
+    keys = ((windows.astype(np.int64) + 2).astype(np.uint64) * powers).sum(axis=1, dtype=np.uint64)
+    return keys.view(np.int64)
@@ -0,0 +1,62 @@
+import numpy as np
+
+def windows(encoded, length):
+    """Slices an encoded sequence into every overlapping window of `length`
+    values, paired with the value that follows each window.
+
+    Example:
+        >> (X, y) = windows(np.array([1, 2, 3, 4]), 2)
+        >> X.tolist()
+        [[1, 2], [2, 3]]
+        >> y.tolist()
+        [3, 4]
+
+    Args:
+        encoded (numpy.array): The encoded sequence (e.g. one-hot rows).
+
+        length (int): The length of each window.
+
+    Returns ((numpy.array, numpy.array)):
+        The windows and the value following each of them.
+    """
+    X = np.array([encoded[i : i + length] for i in range(len(encoded) - length)])
+    y = np.array(encoded[length:])
+    return (X, y)
+
+def streams(encoded, count, steps):
+    """Splits an encoded sequence into `count` contiguous, equal length
+    streams and generates consecutive batches of `steps` values from all of
+    the streams at once, paired with the values that follow each of them.
+
+    Row `i` of every batch continues where row `i` of the previous batch left
+    off, which is what a stateful recurrent model expects. Values that don't
+    fill a complete batch are dropped.
+
+    Example:
+        >> batches = streams(np.arange(9), 2, 2)
+        >> [(X.tolist(), y.tolist()) for (X, y) in batches]
+        [([[0, 1], [4, 5]], [[1, 2], [5, 6]]),
+         ([[2, 3], [6, 7]], [[3, 4], [7, 8]])]
+
+    Args:
+        encoded (numpy.array): The encoded sequence (e.g. one-hot rows).
+
+        count (int): The number of parallel streams.
+
+        steps (int): The number of values from each stream per batch.
+
+    Returns (generator((numpy.array, numpy.array))):
+        Batches of inputs shaped (count, steps, ...) and targets of the same
+        shape, shifted forward by one value.
+
+    Raises:
+        ValueError: If `count` or `steps` is less than 1.
+    """
+    if count < 1 or steps < 1:
+        raise ValueError("Stream count and steps must be greater than 0.")
+
+    length = max(0, len(encoded) - 1) // count
+    X = np.array([encoded[i * length : (i + 1) * length] for i in range(count)])
+    y = np.array([encoded[i * length + 1 : (i + 1) * length + 1] for i in range(count)])
+    for start in range(0, length - steps + 1, steps):
+        yield (X[:, start : start + steps], y[:, start : start + steps])
@@ -0,0 +1,174 @@
+""" A versioned, single-file format for a model's config and weights.
+
+Layout (all integers are little-endian):
+
+    magic          4 bytes   b'MENM'
+    version        1 byte
+    reserved       3 bytes   Zero.
+    hash           32 bytes  The SHA-256 of everything after this field.
+    header_length  4 bytes
+    header         header_length bytes. UTF-8 JSON: {"config": ...,
+                   "arrays": [{"dtype": ..., "shape": ..., "offset": ...}]}
+    padding        Zeros, up to the next multiple of 64 bytes.
+    data           The raw bytes of each array, in C order. Each array starts
+                   `offset` bytes into the data, on a multiple of 64 bytes.
+
+Arrays are read straight out of a memory map of the file, so loading a
+bundle doesn't parse or copy its weights.
+"""
+import json
+import mmap
+import numpy as np
+from struct import Struct
+from hashlib import sha256
+from os import replace
+from collections import namedtuple
+from .packing import align
+
+MAGIC = b'MENM'
+VERSION = 1
+VERSIONS = (1,)
+HASH_SIZE = 32
+
+_PREFIX = Struct('<4sB3x%ds' % HASH_SIZE)
+_HEADER_LENGTH = Struct('<I')
+
+Bundle = namedtuple('Bundle', [
+# The contents of a bundle.
+
+    'version',
+    # The format version the bundle was written with.
+
+    'config',
+    # The model's config, as a dictionary that `Config` accepts.
+
+    'arrays',
+    # The model's weights, as read-only numpy arrays backed by a memory map of
+    # the file.
+
+    'content_hash',
+    # The 32 byte SHA-256 of the bundle's config and weights.
+])
+
+def is_bundle(path):
+    """Checks whether or not a file begins like a bundle.
+
+    Args:
+        path (string): The file to check.
+
+    Returns (bool):
+        True if the file starts with the bundle's magic bytes.
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def write_bundle(path, config, arrays):
+    """Atomically writes a config and a list of arrays to a bundle.
+
+    Example:
+        >> write_bundle("model.bundle", {'model': {...}, ...}, model.get_weights())
+        >> read_bundle("model.bundle").config['model']['nodes']
+        512
+
+    Args:
+        path (string): The file to write.
+
+        config (dict): The config. It must be serializable as JSON.
+
+        arrays (list(numpy.array)): The weights.
+
+    Returns (bytes):
+        The bundle's content hash.
+    """
+    arrays = [np.require(a, requirements='C') for a in arrays]
+    entries = []
+    size = 0
+    for array in arrays:
+        entries.append({'dtype': np.lib.format.dtype_to_descr(array.dtype),
+                        'shape': list(array.shape),
+                        'offset': size})
+        size = align(size + array.nbytes)
+
+    header = json.dumps({'config': config, 'arrays': entries}, sort_keys=True).encode('utf-8')
+    start = _PREFIX.size + _HEADER_LENGTH.size + len(header)
+    padding = b'\x00' * (align(start) - start)
+
+    digest = sha256()
+    temporary = path + ".tmp"
+    with open(temporary, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, b'\x00' * HASH_SIZE))
+        for part in _parts(header, padding, arrays, entries):
+            digest.update(part)
+            f.write(part)
+
+        f.seek(0)
+        f.write(_PREFIX.pack(MAGIC, VERSION, digest.digest()))
+    replace(temporary, path)
+
+    return digest.digest()
+
+def read_bundle(path, verify=False):
+    """Memory maps a bundle.
+
+    Args:
+        path (string): The file to read.
+
+        verify (bool, optional): Whether to check the content hash against
+            the file's contents. This reads the whole file.
+
+    Returns (Bundle):
+        The bundle's contents.
+
+    Raises:
+        ValueError: If the file isn't a valid bundle, or it's been modified
+            and `verify` is set.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("'%s' is not a menc model bundle." % (path))
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(data) < _PREFIX.size + _HEADER_LENGTH.size:
+        raise ValueError("The bundle is truncated.")
+
+    (_, version, content_hash) = _PREFIX.unpack_from(data)
+    if version not in VERSIONS:
+        raise ValueError("Unsupported bundle version: %s" % (version))
+
+    if verify and sha256(memoryview(data)[_PREFIX.size:]).digest() != content_hash:
+        raise ValueError("The bundle's contents don't match its hash.")
+
+    (header_length,) = _HEADER_LENGTH.unpack_from(data, _PREFIX.size)
+    start = _PREFIX.size + _HEADER_LENGTH.size
+    header = json.loads(data[start : start + header_length].decode('utf-8'))
+
+    base = align(start + header_length)
+    arrays = []
+    for entry in header['arrays']:
+        dtype = np.lib.format.descr_to_dtype(_descr(entry['dtype']))
+        shape = tuple(entry['shape'])
+        count = int(np.prod(shape))
+        if base + entry['offset'] + count * dtype.itemsize > len(data):
+            raise ValueError("The bundle is truncated.")
+        array = np.frombuffer(data, dtype, count, base + entry['offset'])
+        arrays.append(array.reshape(shape))
+
+    return Bundle(version, header['config'], arrays, content_hash)
+
+def _parts(header, padding, arrays, entries):
+    """ Generates the serialized parts of a bundle after its hash. """
+    yield _HEADER_LENGTH.pack(len(header))
+    yield header
+    yield padding
+    position = 0
+    for (array, entry) in zip(arrays, entries):
+        yield b'\x00' * (entry['offset'] - position)
+        yield array.reshape(-1).view(np.uint8)
+        position = entry['offset'] + array.nbytes
+
+def _descr(value):
+    """ JSON turns the tuples of a structured dtype's description into lists.
+    Turns them back. """
+    if isinstance(value, str):
+        return value
+    return [(field[0], _descr(field[1])) + tuple(tuple(shape) for shape in field[2:]) for field in value]
@@ -0,0 +1,98 @@
+from time import monotonic
+from threading import Lock
+from collections import OrderedDict
+
+class TTLCache(object):
+    """A thread-safe, least-recently-used cache whose entries also expire a
+    fixed amount of time after they're stored.
+
+    Example:
+        >> cache = TTLCache(max_size=2, ttl=60)
+        >> cache.get('a', lambda: 1)
+        1
+        >> cache.get('a', lambda: 2) # Cached
+        1
+        >> (cache.hits, cache.misses)
+        (1, 1)
+
+    Attrs:
+        max_size (int): The maximum number of entries to keep.
+
+        ttl (float): The number of seconds an entry remains valid for, or None
+            if entries never expire.
+
+        hits (int): The number of lookups that were served from the cache.
+
+        misses (int): The number of lookups that had to compute their value.
+    """
+
+    def __init__(self, max_size=128, ttl=None, clock=monotonic):
+        """ Instantiates an empty cache.
+
+        Args:
+            max_size (int, optional): The maximum number of entries to keep.
+
+            ttl (float, optional): The number of seconds an entry remains
+                valid for. Entries never expire if this is None.
+
+            clock (function, optional): Returns the current time in seconds.
+
+        Raises:
+            ValueError: If `max_size` is less than 1.
+        """
+        if max_size < 1:
+            raise ValueError("Cache size must be greater than 0.")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """Returns the cached value for `key`, calling `compute` to create it
+        if it's missing or expired.
+
+        Note: `compute` is called without holding the cache's lock, so two
+        threads missing on the same key at once may both compute it.
+
+        Args:
+            key (hashable): The key to look up.
+
+            compute (function): Called with no arguments to create the value.
+
+        Returns:
+            The cached or newly computed value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry != None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """ Stores a value, evicting the least recently used entry if full. """
+        with self._lock:
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Removes every entry from the cache. """
+        with self._lock:
+            self._entries.clear()
+
+    def _expired(self, entry):
+        return self.ttl != None and self._clock() - entry[0] >= self.ttl
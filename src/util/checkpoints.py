@@ -0,0 +1,219 @@
+""" Writes training checkpoints on a background thread. """
+import numpy as np
+from hashlib import sha256
+from os import replace, remove
+from os.path import exists, isfile
+from shutil import copyfile
+from queue import Queue
+from threading import Thread
+
+class Checkpointer(object):
+    """Saves snapshots of a model's weights on a background thread so that
+    training doesn't wait on disk writes (or on generating samples).
+
+    Every checkpoint is written to a temporary file and then atomically
+    renamed into place, so a crash mid-write never leaves a torn file behind.
+
+    Files written for a checkpoint path of 'model.weights':
+
+        model.weights       The latest checkpoint.
+        model.weights.N     The checkpoint for epoch N. Only the last `keep`
+                            of these are kept. Not written if `keep` is None.
+        model.weights.best  The checkpoint with the lowest validation loss.
+        model.weights.state The training state that goes with the latest
+                            checkpoint, if any was provided. See `save_state`.
+                            It records the checkpoint's digest (see
+                            `matches_weights`), since the two files can't be
+                            replaced together.
+
+    Example:
+        >> checkpointer = Checkpointer(save, "model.weights", keep=3)
+        >> for epoch in range(epochs):
+        >>     train()
+        >>     checkpointer.checkpoint(epoch, model.get_weights(), val_loss)
+        >> checkpointer.close()
+
+    Attrs:
+        path (string): The path of the latest checkpoint.
+
+        keep (int): The number of per-epoch checkpoints to keep.
+
+        best_loss (float): The lowest validation loss seen so far.
+    """
+
+    def __init__(self, save, path, keep=None, sample=None, pending=2, best_loss=None):
+        """ Instantiates a checkpointer and starts its background thread.
+
+        Args:
+            save (function): Called with a snapshot of the weights and a path.
+                Writes the weights to the path.
+
+            path (string): The path of the latest checkpoint.
+
+            keep (int, optional): The number of per-epoch checkpoints to keep.
+                If None, only the latest (and best) checkpoints are written.
+
+            sample (function, optional): Called with a snapshot of the weights
+                after it's saved, e.g. to print a sample from the model.
+
+            pending (int, optional): The maximum number of snapshots waiting
+                to be written. `checkpoint` blocks when this many are waiting,
+                which bounds the memory used by snapshots.
+
+            best_loss (float, optional): The lowest validation loss of an
+                earlier run, when resuming training.
+        """
+        self.path = path
+        self.keep = keep
+        self.best_loss = best_loss
+        self._save = save
+        self._sample = sample
+        self._queue = Queue(maxsize=pending)
+        self._error = None
+        self._thread = Thread(target=self._run, name="Checkpointer", daemon=True)
+        self._thread.start()
+
+    def checkpoint(self, epoch, weights, validation_loss=None, state=None):
+        """Queues a snapshot of the weights to be written.
+
+        Args:
+            epoch (int): The epoch that just finished.
+
+            weights (list(numpy.array)): A snapshot of the weights. This must
+                not be modified after it's passed in.
+
+            validation_loss (float, optional): The epoch's validation loss,
+                used to track the best checkpoint.
+
+            state (dict(string, numpy.array), optional): The training state
+                to write along with the weights. The best validation loss so
+                far is added to it as 'best_loss' (NaN if there is none).
+
+        Raises:
+            Exception: If writing an earlier checkpoint failed.
+        """
+        self._raise_error()
+        self._queue.put((epoch, weights, validation_loss, state))
+
+    def close(self):
+        """Waits for every queued checkpoint to be written and stops the
+        background thread.
+
+        Raises:
+            Exception: If writing a checkpoint failed.
+        """
+        if self._thread != None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item == None:
+                return
+            if self._error != None:
+                continue # Drain the queue so that `checkpoint` never blocks.
+            try:
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, epoch, weights, validation_loss, state):
+        if self.keep == None:
+            self._write_atomically(weights, self.path)
+        else:
+            self._write_atomically(weights, "%s.%s" % (self.path, epoch))
+            self._copy_atomically("%s.%s" % (self.path, epoch), self.path)
+            stale = "%s.%s" % (self.path, epoch - self.keep)
+            if exists(stale):
+                remove(stale)
+
+        if validation_loss != None and (self.best_loss == None or validation_loss < self.best_loss):
+            self.best_loss = validation_loss
+            self._copy_atomically(self.path, self.path + ".best")
+
+        if state != None:
+            best_loss = np.nan if self.best_loss == None else self.best_loss
+            weights_digest = np.frombuffer(file_digest(self.path), dtype=np.uint8)
+            save_state(dict(state, best_loss=best_loss, weights_digest=weights_digest), self.path + ".state")
+
+        if self._sample != None:
+            self._sample(weights)
+
+    def _write_atomically(self, weights, path):
+        temporary = path + ".tmp"
+        self._save(weights, temporary)
+        replace(temporary, path)
+
+    def _copy_atomically(self, source, path):
+        temporary = path + ".tmp"
+        copyfile(source, temporary)
+        replace(temporary, path)
+
+    def _raise_error(self):
+        if self._error != None:
+            raise self._error
+
+def save_state(state, path):
+    """Atomically writes a training state (e.g. the epoch and optimizer
+    weights) to a file as a set of named numpy arrays.
+
+    Example:
+        >> save_state({'epoch': 3}, "model.weights.state")
+        >> load_state("model.weights.state")['epoch']
+        array(3)
+
+    Args:
+        state (dict(string, numpy.array)): The state to save. Values can be
+            anything numpy can turn into an array.
+
+        path (string): The file to write.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, 'wb') as f:
+        np.savez(f, **state)
+    replace(temporary, path)
+
+def load_state(path):
+    """ Reads a training state written by `save_state`.
+
+    Args:
+        path (string): The file to read.
+
+    Returns (dict(string, numpy.array)):
+        The state, or None if the file doesn't exist.
+    """
+    if not isfile(path):
+        return None
+
+    with np.load(path) as state:
+        return {key: state[key] for key in state.files}
+
+def matches_weights(state, path):
+    """Checks that a training state written by `Checkpointer` goes with the
+    weights in a file. They don't if a crash came between replacing one and
+    the other.
+
+    Args:
+        state (dict(string, numpy.array)): The training state.
+
+        path (string): The weights file.
+
+    Returns (bool):
+        False if the state doesn't record a digest of the weights in the
+        file, or the file doesn't exist.
+    """
+    if 'weights_digest' not in state or not isfile(path):
+        return False
+
+    return state['weights_digest'].tobytes() == file_digest(path)
+
+def file_digest(path):
+    """ Returns (bytes): The sha256 digest of a file's contents. """
+    digest = sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.digest()
@@ -0,0 +1,181 @@
+""" A versioned, framed binary container for ciphertexts.
+
+Layout (all integers are little-endian):
+
+    magic        4 bytes   b'MENC'
+    version      1 byte
+    flags        1 byte    A bitmask of the flags below.
+    fingerprint  32 bytes  The fingerprint of the model used for encoding.
+    iv_length    1 byte
+    iv           iv_length bytes
+    kdf_length   1 byte    Version 2 and later.
+    kdf          kdf_length bytes. Opaque key derivation parameters (e.g. a
+                 salt). Version 2 and later.
+    chunks       Repeated (length: 4 bytes, data: length bytes). A chunk with
+                 a length of zero marks the end of the container.
+
+Flags:
+
+    SEGMENTED    Each chunk is an independently encoded segment, rather than
+                 an arbitrary slice of a single encoded payload.
+"""
+from struct import Struct
+from collections import namedtuple
+
+MAGIC = b'MENC'
+VERSION = 2
+VERSIONS = (1, 2)
+FINGERPRINT_SIZE = 32
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+SEGMENTED = 0x01
+
+_HEADER = Struct('<4sBB%dsB' % FINGERPRINT_SIZE)
+_LENGTH = Struct('<B')
+_CHUNK_LENGTH = Struct('<I')
+
+Header = namedtuple('Header', ['version', 'flags', 'fingerprint', 'iv', 'kdf'])
+
+def is_container(data):
+    """Checks whether or not a byte string begins like a container.
+
+    Args:
+        data (bytes): The data (or a prefix of it) to check.
+
+    Returns (bool):
+        True if `data` starts with the container's magic bytes.
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+def pack_container(fingerprint, iv, chunks, flags=0, kdf=b''):
+    """Serializes a header and a sequence of chunks into a container.
+
+    Example:
+        >> data = pack_container(b'\\x00' * 32, b'\\x01' * 16, [b'foo', b'bar'])
+        >> header = read_header(BytesIO(data))
+        >> header.iv
+        b'\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01\\x01'
+
+    Args:
+        fingerprint (bytes): The fingerprint of the model used for encoding.
+
+        iv (bytes): The initialization vector used for encryption.
+
+        chunks (sequence(bytes)): The payload, split into chunks.
+
+        flags (int, optional): Container flags.
+
+        kdf (bytes, optional): The key derivation parameters.
+
+    Returns (bytes):
+        The serialized container.
+
+    Raises:
+        ValueError: If the fingerprint, iv or kdf have an invalid length.
+    """
+    return b''.join(_frame(fingerprint, iv, chunks, flags, kdf))
+
+def write_container(stream, fingerprint, iv, chunks, flags=0, kdf=b''):
+    """ Same as `pack_container`, but writes directly to a binary stream.
+    Returns the number of bytes written. """
+    written = 0
+    for part in _frame(fingerprint, iv, chunks, flags, kdf):
+        stream.write(part)
+        written += len(part)
+    return written
+
+def read_header(stream):
+    """Reads and validates a container header from a binary stream.
+
+    Args:
+        stream (file): A binary stream positioned at the start of a container.
+
+    Returns (Header):
+        The parsed header. The stream is left positioned at the first chunk.
+
+    Raises:
+        ValueError: If the stream does not contain a valid header.
+    """
+    raw = _read_exactly(stream, _HEADER.size)
+    (magic, version, flags, fingerprint, iv_length) = _HEADER.unpack(raw)
+
+    if magic != MAGIC:
+        raise ValueError("Data is not a menc container.")
+
+    if version not in VERSIONS:
+        raise ValueError("Unsupported container version: %s" % (version))
+
+    iv = _read_exactly(stream, iv_length)
+
+    kdf = b''
+    if version >= 2:
+        (kdf_length,) = _LENGTH.unpack(_read_exactly(stream, _LENGTH.size))
+        kdf = _read_exactly(stream, kdf_length)
+
+    return Header(version, flags, fingerprint, iv, kdf)
+
+def read_chunks(stream):
+    """Reads the chunks that follow a container header, one at a time.
+
+    Args:
+        stream (file): A binary stream positioned after the header.
+
+    Returns (generator(bytes)):
+        Each chunk's data, in order.
+
+    Raises:
+        ValueError: If the stream ends before the terminating chunk.
+    """
+    while True:
+        (length,) = _CHUNK_LENGTH.unpack(_read_exactly(stream, _CHUNK_LENGTH.size))
+        if length == 0:
+            return
+        yield _read_exactly(stream, length)
+
+def chunked(data, size=DEFAULT_CHUNK_SIZE):
+    """Splits a byte string into chunks of at most `size` bytes.
+
+    Example:
+        >> list(chunked(b'abcde', 2))
+        [b'ab', b'cd', b'e']
+
+    Args:
+        data (bytes): The data to split.
+
+        size (int, optional): The maximum size of each chunk.
+
+    Returns (generator(bytes)):
+        The chunks of `data`.
+    """
+    view = memoryview(data)
+    for i in range(0, len(data), size):
+        yield bytes(view[i : i + size])
+
+def _frame(fingerprint, iv, chunks, flags, kdf):
+    """ Generates the serialized parts of a container. """
+    if len(fingerprint) != FINGERPRINT_SIZE:
+        raise ValueError("Fingerprint must be %s bytes." % (FINGERPRINT_SIZE))
+
+    if len(iv) > 255:
+        raise ValueError("IV must be at most 255 bytes.")
+
+    if len(kdf) > 255:
+        raise ValueError("Key derivation parameters must be at most 255 bytes.")
+
+    yield _HEADER.pack(MAGIC, VERSION, flags, fingerprint, len(iv))
+    yield iv
+    yield _LENGTH.pack(len(kdf))
+    yield kdf
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue # A zero length chunk would terminate the container.
+        yield _CHUNK_LENGTH.pack(len(chunk))
+        yield chunk
+    yield _CHUNK_LENGTH.pack(0)
+
+def _read_exactly(stream, size):
+    """ Reads exactly `size` bytes from a stream or raises a ValueError. """
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Container is truncated.")
+    return data
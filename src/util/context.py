@@ -0,0 +1,95 @@
+import numpy as np
+
+class Context(object):
+    """The last `length` values fed to a model, kept in preallocated ring
+    buffers of alphabet indices and one-hot rows.
+
+    Each buffer holds every value twice (at `i` and `i + length`), so the
+    current window is always a contiguous slice. Pushing a value writes a
+    couple of rows and the window is returned as a view, so stepping a model
+    through a long sequence doesn't allocate a new context each step.
+
+    Models accept a Context anywhere they accept a sequence of values. See
+    `Model.predict_raw`.
+
+    Example:
+        >> context = Context("ABC", 2, "ABC")
+        >> context.values()
+        ['B', 'C']
+        >> context.push('A')
+        >> context.indices()
+        array([2, 0])
+        >> context.one_hot()
+        array([[False, False,  True],
+               [ True, False, False]])
+    """
+
+    def __init__(self, alphabet, length, initial=()):
+        """ Instantiates a context.
+
+        Args:
+            alphabet (sequence): The model's alphabet.
+
+            length (int): The number of values to keep, i.e. the model's
+                sequence_length.
+
+            initial (sequence, optional): Values to push.
+
+        Raises:
+            ValueError: If a value in `initial` isn't in the alphabet.
+        """
+        self.alphabet = alphabet
+        self.length = length
+        self._lookup = {x: i for (i, x) in enumerate(alphabet)}
+        self._indices = np.zeros(2 * length, dtype=np.int64)
+        self._one_hot = np.zeros((2 * length, len(alphabet)), dtype=np.bool_)
+        self._position = 0
+        self._count = 0
+        for value in list(initial)[-length:] if length > 0 else []:
+            self.push(value)
+
+    def __len__(self):
+        return min(self._count, self.length)
+
+    def push(self, value):
+        """ Appends a value to the context, dropping the oldest value if the
+        context is full.
+
+        Raises:
+            ValueError: If `value` isn't in the alphabet.
+        """
+        if value not in self._lookup:
+            raise ValueError("Value '%s' is not present in the alphabet" % (value))
+
+        if self.length == 0:
+            return
+
+        index = self._lookup[value]
+        for row in (self._position, self._position + self.length):
+            self._indices[row] = index
+            self._one_hot[row] = False
+            self._one_hot[row, index] = True
+
+        self._position = (self._position + 1) % self.length
+        self._count += 1
+
+    def indices(self):
+        """ Returns a view of the alphabet indices of the values, oldest
+        first. """
+        return self._indices[self._window()]
+
+    def one_hot(self):
+        """ Returns a view of the one-hot encoded values, oldest first. """
+        return self._one_hot[self._window()]
+
+    def values(self):
+        """ Returns a new list of the values, oldest first. """
+        return [self.alphabet[i] for i in self.indices()]
+
+    def key(self):
+        """ Returns a hashable copy of the values' indices. """
+        return tuple(self.indices().tolist())
+
+    def _window(self):
+        end = self._position + self.length
+        return slice(end - len(self), end)
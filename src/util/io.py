@@ -36,3 +36,47 @@ def read_file(filename):
     else:
         with open(filename) as fin:
             return fin.read()
+
+def read_blocks(filename, size=1024 * 1024):
+    """Reads a file (or stdin, like `read_file`) in blocks of whole lines,
+    so that a large file never has to be held in memory at once.
+
+    Args:
+        filename (string): The filename to read.
+
+        size (int, optional): The number of characters to read per block.
+            Blocks are extended to the end of the line they stop in.
+
+    Returns (generator(string)):
+        The blocks, which concatenate back to the contents of the file.
+    """
+    if filename == '-' or filename == None:
+        return _read_blocks(stdin, size)
+
+    def blocks():
+        with open(filename) as fin:
+            for block in _read_blocks(fin, size):
+                yield block
+    return blocks()
+
+def _read_blocks(stream, size):
+    while True:
+        block = stream.read(size)
+        if block == '':
+            return
+        yield block + stream.readline()
+
+def open_binary(filename):
+    """Opens a file for reading bytes. If the filename is None or '-',
+    defaults to stdin.
+
+    Args:
+        filename (string): The filename to open.
+
+    Returns:
+        A buffered binary stream for the file or stdin.
+    """
+    if filename == '-' or filename == None:
+        return stdin.buffer
+    else:
+        return open(filename, 'rb')
@@ -0,0 +1,170 @@
+""" Memory-hard key derivation (scrypt) with an in-process cache. """
+from os import urandom
+from struct import Struct
+from hashlib import scrypt, sha256
+from collections import namedtuple
+from .cache import TTLCache
+
+KEY_SIZE = 32
+SALT_SIZE = 16
+
+# Refuse parameters that would need more memory than this, so that a crafted
+# header can't exhaust the machine.
+MAX_MEMORY = 1024 * 1024 * 1024
+
+KdfParams = namedtuple('KdfParams', [
+# The scrypt cost parameters.
+
+    'n',
+    # The CPU/memory cost. Must be a power of 2.
+
+    'r',
+    # The block size.
+
+    'p',
+    # The parallelization factor.
+])
+
+DEFAULT_PARAMS = KdfParams(n=2**14, r=8, p=1)
+
+# log2(n), r, p and the salt.
+_KDF = Struct('<BBB%ds' % (SALT_SIZE))
+
+def derive_key(password, salt, params=DEFAULT_PARAMS):
+    """Derives a 32 byte key from a password with scrypt.
+
+    Args:
+        password (string): The password to derive a key from.
+
+        salt (bytes): A random salt.
+
+        params (KdfParams, optional): The scrypt cost parameters.
+
+    Returns (bytes):
+        The derived key.
+    """
+    # scrypt needs 128 * n * r * p bytes, plus some headroom.
+    maxmem = 129 * params.n * params.r * params.p + 1024 * 1024
+    return scrypt(bytes(password, 'utf-8'), salt=salt, n=params.n, r=params.r,
+                  p=params.p, maxmem=maxmem, dklen=KEY_SIZE)
+
+def pack_kdf(salt, params):
+    """Serializes a salt and its scrypt parameters for storing in a header.
+
+    Example:
+        >> unpack_kdf(pack_kdf(salt, DEFAULT_PARAMS)) == (salt, DEFAULT_PARAMS)
+        True
+
+    Args:
+        salt (bytes): The salt.
+
+        params (KdfParams): The scrypt cost parameters.
+
+    Returns (bytes):
+        The serialized salt and parameters.
+
+    Raises:
+        ValueError: If `params.n` is not a power of 2 or `salt` has the wrong
+            length.
+    """
+    if params.n < 2 or params.n & (params.n - 1) != 0:
+        raise ValueError("Scrypt's n must be a power of 2.")
+
+    if len(salt) != SALT_SIZE:
+        raise ValueError("Salt must be %s bytes." % (SALT_SIZE))
+
+    return _KDF.pack(params.n.bit_length() - 1, params.r, params.p, salt)
+
+def unpack_kdf(data):
+    """Deserializes a salt and scrypt parameters. See `pack_kdf`.
+
+    Args:
+        data (bytes): The serialized salt and parameters.
+
+    Returns ((bytes, KdfParams)):
+        The salt and the scrypt parameters.
+
+    Raises:
+        ValueError: If `data` is malformed or the parameters would use more
+            than MAX_MEMORY bytes.
+    """
+    if len(data) != _KDF.size:
+        raise ValueError("Invalid key derivation parameters.")
+
+    (log_n, r, p, salt) = _KDF.unpack(data)
+    if log_n < 1 or r < 1 or p < 1 or 128 * (2**log_n) * r * p > MAX_MEMORY:
+        raise ValueError("Invalid key derivation parameters.")
+
+    return (salt, KdfParams(2**log_n, r, p))
+
+class KeyCache(object):
+    """Caches derived keys in-process so that reusing a password doesn't pay
+    the cost of the memory-hard KDF every time.
+
+    Derived keys are keyed by (sha256(password), salt, params). When
+    encrypting, the same salt is reused for a password for as long as the
+    derived key is cached, so encrypting many messages with one password only
+    derives a single key. Every message still gets its own random IV.
+
+    Note: Derived keys are held in memory until they expire or are evicted.
+
+    Example:
+        >> cache = KeyCache(max_size=64, ttl=300)
+        >> (salt, key) = cache.encryption_key("foo")
+        >> cache.decryption_key("foo", salt) == key
+        True
+    """
+
+    def __init__(self, max_size=128, ttl=600, derive=derive_key):
+        """ Instantiates an empty cache.
+
+        Args:
+            max_size (int, optional): The maximum number of derived keys (and
+                separately, encryption salts) to keep.
+
+            ttl (float, optional): The number of seconds a derived key is kept
+                for. None keeps keys until they're evicted.
+
+            derive (function, optional): The key derivation function.
+        """
+        self.keys = TTLCache(max_size, ttl)
+        self.salts = TTLCache(max_size, ttl)
+        self._derive = derive
+
+    def encryption_key(self, password, params=DEFAULT_PARAMS):
+        """Returns a salt and the key derived from it for encrypting with
+        `password`.
+
+        Args:
+            password (string): The password to derive a key from.
+
+            params (KdfParams, optional): The scrypt cost parameters.
+
+        Returns ((bytes, bytes)):
+            The salt and the derived key.
+        """
+        hashed = sha256(bytes(password, 'utf-8')).digest()
+        salt = self.salts.get((hashed, params), lambda: urandom(SALT_SIZE))
+        return (salt, self.decryption_key(password, salt, params))
+
+    def decryption_key(self, password, salt, params=DEFAULT_PARAMS):
+        """Returns the key derived from `password` and `salt`.
+
+        Args:
+            password (string): The password to derive a key from.
+
+            salt (bytes): The salt that was used when encrypting.
+
+            params (KdfParams, optional): The scrypt cost parameters.
+
+        Returns (bytes):
+            The derived key.
+        """
+        hashed = sha256(bytes(password, 'utf-8')).digest()
+        return self.keys.get((hashed, salt, params),
+                             lambda: self._derive(password, salt, params))
+
+    def clear(self):
+        """ Forgets every cached key and salt. """
+        self.keys.clear()
+        self.salts.clear()
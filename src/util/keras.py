@@ -10,7 +10,7 @@ sys.stderr = open(devnull, 'w')
 #################################
 
 from keras.models import Sequential
-from keras.layers import LSTM, Dense, Activation
+from keras.layers import LSTM, Dense, Activation, TimeDistributed
 
 #################################
 # Enable stderr
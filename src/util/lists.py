@@ -1,6 +1,6 @@
 from itertools import chain
 
-def rfind(x, xs):
+def rfind(x, xs, key=None):
     """Finds the right-most index of an element in a list.
 
     Example:
@@ -8,22 +8,28 @@ def rfind(x, xs):
         5
         >> rfind(4, [1, 2, 3, 1, 2, 3])
         None
+        >> rfind(True, [1, 2, 3, 1, 2, 3], key=lambda y: y % 2 == 0)
+        4
 
     Args:
         x (obj): The element to find the index of.
 
         xs (list): The list to search through.
 
+        key (function, optional): If provided, `key(y)` is compared to `x`
+            instead of each element `y` itself.
+
     Returns:
         The index of the right-most occurence of `x` in `xs`, or None if it
         isn't in the list.
     """
+    key = key or _identity
     for i in range(len(xs) - 1, -1, -1):
-        if xs[i] == x:
+        if key(xs[i]) == x:
             return i
     return None
 
-def drop_tail_until(x, xs):
+def drop_tail_until(x, xs, key=None):
     """Removes all right-most elements from a list until a value is found.
 
     Example:
@@ -37,10 +43,12 @@ def drop_tail_until(x, xs):
 
         xs (list): The list to drop values from.
 
+        key (function, optional): See `rfind`.
+
     Returns:
         A copy of `xs` with anything after the right-most `x` value removed.
     """
-    last = rfind(x, xs)
+    last = rfind(x, xs, key)
     if last == None:
         return xs[:]
     return xs[:last + 1]
@@ -73,3 +81,42 @@ def take(n, xs):
 def to_generator(xs):
     """ Converts a sequence to a generator. """
     return (x for x in xs)
+
+def split_after(x, xs, size, key=None):
+    """Splits a list into pieces of at least `size` elements that each end
+    with `x`. The last piece holds whatever remains, and may be shorter or not
+    end with `x`.
+
+    Example:
+        >> split_after(0, [1, 0, 1, 1, 0, 1], 2)
+        [[1, 0], [1, 1, 0], [1]]
+        >> split_after(0, [1, 0, 1, 1, 0], 3)
+        [[1, 0, 1, 1, 0]]
+        >> split_after(0, [], 3)
+        []
+
+    Args:
+        x (obj): The value to split after.
+
+        xs (list): The list to split.
+
+        size (int): The minimum length of each piece (except the last).
+
+        key (function, optional): See `rfind`.
+
+    Returns (list(list)):
+        The pieces of `xs`, which concatenate back to `xs`.
+    """
+    key = key or _identity
+    pieces = []
+    start = 0
+    for i, y in enumerate(xs):
+        if key(y) == x and i + 1 - start >= size:
+            pieces.append(xs[start : i + 1])
+            start = i + 1
+    if start < len(xs):
+        pieces.append(xs[start:])
+    return pieces
+
+def _identity(x):
+    return x
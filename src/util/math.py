@@ -1,4 +1,5 @@
 import numpy as np
+from math import isqrt
 
 def log_normalize(values, temperature):
     """Normalizes a list of values such that they sum to 1.0, while also
@@ -73,3 +74,205 @@ def scale(values, total, lowest=0):
     scaled[max_index] += delta
 
     return scaled
+
+def average_arrays(array_lists):
+    """Averages several lists of numpy arrays element-wise. This is useful
+    for merging the weights of several copies of a model.
+
+    Example:
+        >> average_arrays([[np.array([1, 2])], [np.array([3, 4])]])
+        [array([2., 3.])]
+
+    Args:
+        array_lists (list(list(numpy.array))): The lists to average. Each list
+            must contain arrays with the same shapes, in the same order.
+
+    Returns (list(numpy.array)):
+        The element-wise mean of each array.
+
+    Raises:
+        ValueError: If `array_lists` is empty.
+    """
+    if len(array_lists) == 0:
+        raise ValueError("Can't average zero lists.")
+
+    return [np.mean(arrays, axis=0) for arrays in zip(*array_lists)]
+
+def cross_entropy(p, q):
+    """Returns the mean cross-entropy (in nats) of the distributions in `q`
+    relative to the distributions in `p`, i.e. the average number of nats
+    needed to encode values drawn from `p` with a code optimized for `q`.
+
+    Example:
+        >> cross_entropy([[0.5, 0.5]], [[0.5, 0.5]])
+        0.693...
+        >> cross_entropy([[1.0, 0.0]], [[0.5, 0.5]])
+        0.693...
+
+    Args:
+        p (numpy.array): The true distributions, one per row.
+
+        q (numpy.array): The estimated distributions, one per row.
+
+    Returns (float):
+        The cross-entropy, averaged over the rows.
+    """
+    (p, q) = (np.asarray(p, dtype='float64'), np.asarray(q, dtype='float64'))
+    logs = np.log(np.maximum(q, np.finfo('float64').tiny))
+    return float(-np.sum(p * logs) / len(p))
+
+def kl_divergence(p, q):
+    """Returns the mean Kullback-Leibler divergence (in nats) of the
+    distributions in `q` from the distributions in `p`. This is the
+    cross-entropy minus the entropy of `p`, so it's 0 when `q` matches `p`.
+
+    Example:
+        >> kl_divergence([[0.5, 0.5]], [[0.5, 0.5]])
+        0.0
+        >> kl_divergence([[1.0, 0.0]], [[0.5, 0.5]])
+        0.693...
+
+    Args:
+        p (numpy.array): The true distributions, one per row.
+
+        q (numpy.array): The estimated distributions, one per row.
+
+    Returns (float):
+        The divergence, averaged over the rows.
+    """
+    return cross_entropy(p, q) - cross_entropy(p, p)
+
+# The number of fractional bits of the fixed-point logarithms that
+# `integer_weights` works with.
+FIXED_POINT_BITS = 24
+
+# Products are kept in fixed-point with this many fractional bits, which
+# leaves room to multiply two of them in 64 bits.
+_PRODUCT_BITS = 30
+
+def integer_weights(probabilities, temperature, total):
+    """Applies a temperature to a model's probabilities and scales them to
+    integer weights that sum to exactly `total`, with every weight at least 1.
+
+    This is a lean alternative to
+    `scale(log_normalize(probabilities, temperature), total, lowest=1)`. The
+    probabilities are split exactly into their mantissas and exponents, and
+    everything after that (the logarithms, the temperature and the
+    exponentials) is exact integer arithmetic in vectorized numpy
+    operations. Floating point
+    transcendental functions differ in their last bits between platforms
+    (and between numpy's SIMD implementations), which would change the
+    weights. This way, the same probabilities give the same weights
+    everywhere. The weights differ slightly from `scale`'s, so both sides of
+    an encoding must use the same one.
+
+    Example:
+        >> integer_weights([0.25, 0.75], 1.0, 100)
+        array([25, 75])
+        >> integer_weights([0.0, 1.0], 1.0, 100)
+        array([ 1, 99])
+
+    Args:
+        probabilities (numpy.array): The model's (raw) probabilities.
+
+        temperature (float): See `log_normalize`. It's rounded to a multiple
+            of 2^-FIXED_POINT_BITS.
+
+        total (int): The value that the weights will sum to. It must be at
+            least the number of probabilities, and at most 2^32.
+
+    Returns (numpy.array(int64)):
+        The weights.
+
+    Raises:
+        ValueError: If `total` is too small for every weight to be at least 1.
+    """
+    # Only zeros are raised, so that they have a logarithm.
+    values = np.maximum(np.asarray(probabilities, dtype=np.float64), np.finfo(np.float64).tiny)
+    logs = _fixed_log2(values)
+    divisor = max(1, int(round(temperature * 2 ** FIXED_POINT_BITS)))
+    logits = (logs * (1 << FIXED_POINT_BITS)) // divisor
+    fixed = _fixed_exp2(np.max(logits) - logits) # The largest is exactly 2^30
+
+    spare = total - len(fixed)
+    if spare < 0:
+        raise ValueError("The total, %s, is less than the number of weights." % (total))
+
+    weights = 1 + fixed * spare // np.sum(fixed)
+    weights[np.argmax(fixed)] += total - np.sum(weights)
+    return weights
+
+def _fixed_log2(values):
+    """ log2 of positive (normal) floats, in fixed-point with FIXED_POINT_BITS
+    fractional bits. The mantissa's logarithm is interpolated linearly
+    between the entries of `_LOG2_TABLE`. """
+    # Splitting a float into its mantissa and exponent is exact.
+    (mantissas, exponents) = np.frexp(values)
+    x = (mantissas * 2.0 ** (_PRODUCT_BITS + 1)).astype(np.int64) - (1 << _PRODUCT_BITS) # In [0, 1)
+
+    shift = _PRODUCT_BITS - _LOG2_TABLE_BITS
+    (index, remainder) = (x >> shift, x & ((1 << shift) - 1))
+    (low, high) = (_LOG2_TABLE[index], _LOG2_TABLE[index + 1])
+    return (exponents.astype(np.int64) - 1) * (1 << FIXED_POINT_BITS) + low + (((high - low) * remainder) >> shift)
+
+def _fixed_exp2(negated):
+    """ 2^-x for fixed-point x >= 0 with FIXED_POINT_BITS fractional bits, in
+    fixed-point with _PRODUCT_BITS fractional bits. The fraction is looked up
+    a byte at a time. """
+    whole = np.minimum(negated >> FIXED_POINT_BITS, 63)
+
+    results = np.full(len(negated), 1 << _PRODUCT_BITS, dtype=np.int64)
+    for (i, table) in enumerate(_EXP2_TABLES):
+        byte = (negated >> (FIXED_POINT_BITS - 8 * (i + 1))) & 0xFF
+        results = (results * table[byte]) >> _PRODUCT_BITS
+    return results >> whole
+
+def _exp2_tables():
+    """ Tables of 2^-(j * 2^-8k) for each byte j, for the k-th byte of a
+    fraction with FIXED_POINT_BITS bits, in fixed-point.
+
+    They're built from 2^-(2^-b) for each bit b, each of which is the square
+    root of the last. Integer square roots and products are exact, so the
+    tables are the same everywhere.
+    """
+    one = 1 << _PRODUCT_BITS
+    factors = [isqrt(1 << (2 * _PRODUCT_BITS - 1))]
+    while len(factors) < FIXED_POINT_BITS:
+        factors.append(isqrt(factors[-1] << _PRODUCT_BITS))
+
+    tables = []
+    for k in range(FIXED_POINT_BITS // 8):
+        table = []
+        for j in range(256):
+            value = one
+            for b in range(8):
+                if j & (0x80 >> b):
+                    value = (value * factors[8 * k + b]) >> _PRODUCT_BITS
+            table.append(value)
+        tables.append(np.array(table, dtype=np.int64))
+    return tables
+
+def _log2_table():
+    """ log2(1 + i / 2^_LOG2_TABLE_BITS) for every i up to 2^_LOG2_TABLE_BITS,
+    in fixed-point with FIXED_POINT_BITS fractional bits. Each bit is found
+    by squaring, so that the table is exact integer arithmetic, and the same
+    everywhere. """
+    shift = _PRODUCT_BITS - _LOG2_TABLE_BITS
+    x = (np.arange((1 << _LOG2_TABLE_BITS) + 1, dtype=np.int64) << shift) + (1 << _PRODUCT_BITS)
+    logs = np.zeros(len(x), dtype=np.int64)
+    # The last entry is log2(2).
+    logs[-1] = 1 << FIXED_POINT_BITS
+    x[-1] = 1 << _PRODUCT_BITS
+    for bit in reversed(range(FIXED_POINT_BITS)):
+        x = (x * x) >> _PRODUCT_BITS
+        carry = x >> (_PRODUCT_BITS + 1) # 1 if x is in [2, 4)
+        logs |= carry << bit
+        x >>= carry
+    return logs
+
+_EXP2_TABLES = _exp2_tables()
+
+# Linear interpolation between entries this close together is accurate to
+# within the last fractional bit.
+_LOG2_TABLE_BITS = 12
+_LOG2_TABLE = _log2_table()
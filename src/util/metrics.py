@@ -0,0 +1,426 @@
+""" In-process metrics, exposed in the Prometheus text format.
+
+Every layer reports into the metrics declared at the bottom of this module,
+which are registered with `REGISTRY`. `serve_metrics` exposes them over HTTP.
+Per-message stats are aggregated by `telemetry.Telemetry` instead.
+"""
+import numpy as np
+from bisect import bisect_left
+from threading import Lock, Thread, local
+from time import perf_counter
+from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The content type of the Prometheus text format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def exponential_buckets(start, factor, count):
+    """Upper bounds for `count` histogram buckets, growing by `factor` from
+    `start`.
+
+    Example:
+        >> exponential_buckets(1, 2, 4)
+        [1, 2, 4, 8]
+    """
+    return [start * factor ** i for i in range(count)]
+
+class Histogram(object):
+    """Counts observations into buckets with fixed upper bounds, plus a
+    final bucket for everything above the last bound, so that any number of
+    observations is summarized in constant memory.
+
+    Example:
+        >> histogram = Histogram([1, 2, 4])
+        >> for value in [0.5, 3, 3, 9]:
+        >>     histogram.observe(value)
+        >> histogram.counts
+        [1, 0, 2, 1]
+        >> histogram.quantile(0.5)
+        3.0
+
+    Attrs:
+        bounds (list(float)): The inclusive upper bound of each bucket, in
+            increasing order.
+
+        counts (list(int)): The number of observations in each bucket. The
+            last one counts observations above every bound.
+
+        count (int): The number of observations.
+
+        sum (float): The sum of the observations.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """ Adds an observation. NaNs are ignored. """
+        if value != value:
+            return
+
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """ The number of observations at or below each bound, followed by
+        the total, e.g. for Prometheus' `le` buckets. """
+        return np.cumsum(self.counts).tolist()
+
+    def quantile(self, q):
+        """Estimates a quantile of the observations, interpolating linearly
+        within the bucket it falls in.
+
+        Args:
+            q (float): The quantile, from 0 to 1.
+
+        Returns (float):
+            The estimate. NaN if nothing has been observed. Quantiles that
+            fall above the last bound are reported as the last bound.
+        """
+        if self.count == 0:
+            return np.nan
+
+        rank = q * self.count
+        below = 0
+        for (i, count) in enumerate(self.counts):
+            if below + count >= rank and count > 0:
+                if i == len(self.bounds):
+                    return float(self.bounds[-1])
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                return float(lower + (self.bounds[i] - lower) * (rank - below) / count)
+            below += count
+
+        return float(self.bounds[-1])
+
+    def copy(self):
+        histogram = Histogram(self.bounds)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+class Metric(object):
+    """A named family of values, one per combination of label values.
+
+    Attrs:
+        name (string): The metric's name, e.g. 'menc_operations_total'.
+
+        help (string): A description of the metric.
+
+        labels (tuple(string)): The names of the metric's labels.
+    """
+    kind = None
+
+    def __init__(self, name, help, labels=(), fn=None):
+        """ Instantiates a metric.
+
+        Args:
+            name (string): See `name`.
+
+            help (string): See `help`.
+
+            labels (sequence(string), optional): See `labels`.
+
+            fn (function, optional): Called when the metric is rendered, in
+                place of the recorded values. Returns a dictionary from tuples
+                of label values to values (or just a value, if the metric
+                has no labels). Useful for values that are already counted
+                elsewhere, e.g. a cache's hits.
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._fn = fn
+        self._values = {}
+        self._lock = Lock()
+
+    def samples(self):
+        """ Returns (list(tuple(string, dict, float))): The name, labels and
+        value of each of the metric's samples. """
+        with self._lock:
+            values = dict(self._values)
+        if self._fn != None:
+            values = self._fn()
+            values = values if isinstance(values, dict) else {(): values}
+
+        return [(self.name, dict(zip(self.labels, key)), value) for (key, value) in sorted(values.items())]
+
+    def _key(self, values):
+        if len(values) != len(self.labels):
+            raise ValueError("%s takes the labels %s." % (self.name, self.labels))
+        return tuple(str(value) for value in values)
+
+class Counter(Metric):
+    """ A value that only goes up, e.g. the number of requests served. """
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """ Adds `amount` to the value for the given label values. """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """ A value that can go up and down, e.g. the memory in use. """
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        """ Sets the value for the given label values. """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def remove(self, *labels):
+        """ Stops reporting the value for the given label values. """
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+class HistogramMetric(Metric):
+    """ A distribution of observations, e.g. request latencies, as a
+    `Histogram` per combination of label values. """
+    kind = 'histogram'
+
+    def __init__(self, name, help, bounds, labels=()):
+        """ Instantiates a metric. See `Metric`.
+
+        Args:
+            bounds (list(float)): The upper bound of each bucket.
+        """
+        super().__init__(name, help, labels)
+        self.bounds = list(bounds)
+
+    def observe(self, value, *labels):
+        """ Adds an observation for the given label values. """
+        key = self._key(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram == None:
+                histogram = self._values[key] = Histogram(self.bounds)
+            histogram.observe(value)
+
+    def histogram(self, *labels):
+        """ Returns (Histogram): A copy of the observations for the given
+        label values. """
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, Histogram(self.bounds)).copy()
+
+    def samples(self):
+        """ See `Metric.samples`. Each histogram is rendered as cumulative
+        `_bucket` samples, and its `_sum` and `_count`. """
+        with self._lock:
+            histograms = {key: histogram.copy() for (key, histogram) in self._values.items()}
+
+        samples = []
+        for (key, histogram) in sorted(histograms.items()):
+            labels = dict(zip(self.labels, key))
+            bounds = [_number(bound) for bound in self.bounds] + ['+Inf']
+            for (bound, count) in zip(bounds, histogram.cumulative()):
+                samples.append((self.name + '_bucket', dict(labels, le=bound), count))
+            samples.append((self.name + '_sum', labels, histogram.sum))
+            samples.append((self.name + '_count', labels, histogram.count))
+        return samples
+
+class Registry(object):
+    """A set of metrics that are rendered together.
+
+    Example:
+        >> registry = Registry()
+        >> requests = registry.register(Counter('requests_total', "Requests.", ['path']))
+        >> requests.inc('/ready')
+        >> print(registry.render())
+        # HELP requests_total Requests.
+        # TYPE requests_total counter
+        requests_total{path="/ready"} 1
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = Lock()
+
+    def register(self, metric):
+        """ Adds a metric, and returns it. """
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError("A metric named '%s' is already registered." % (metric.name))
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """ Returns (string): Every metric, in the Prometheus text format. """
+        with self._lock:
+            metrics = list(self._metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP %s %s" % (metric.name, _escape(metric.help)))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for (name, labels, value) in metric.samples():
+                lines.append("%s%s %s" % (name, _labels(labels), _number(value)))
+        return "\n".join(lines) + "\n"
+
+def serve_metrics(port, host='127.0.0.1', ready=lambda: True, registry=None):
+    """Serves the metrics over HTTP from a background thread, in the
+    Prometheus text format at /metrics. /ready answers 200 if `ready`
+    returns True, and 503 otherwise.
+
+    Example:
+        >> server = serve_metrics(9184, ready=lambda: service.ready)
+        >> # $ curl localhost:9184/metrics
+        >> server.shutdown()
+
+    Args:
+        port (int): The port to listen on. 0 picks a free port, which can be
+            read from `server.server_address`.
+
+        host (string, optional): The address to listen on. Metrics aren't
+            authenticated, so this defaults to the loopback interface.
+
+        ready (function, optional): Whether the process is ready to serve
+            requests.
+
+        registry (Registry, optional): The metrics to serve. Defaults to
+            `REGISTRY`.
+
+    Returns (ThreadingHTTPServer):
+        The running server. Call `shutdown` to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), metrics_handler(registry or REGISTRY, ready))
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def metrics_handler(registry, ready):
+    """ Returns a request handler class that serves /metrics and /ready. See
+    `serve_metrics`. Subclass it to serve more. """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                self.respond(200, registry.render(), CONTENT_TYPE)
+            elif self.path == '/ready':
+                is_ready = ready()
+                self.respond(200 if is_ready else 503, "ready\n" if is_ready else "not ready\n")
+            else:
+                self.respond(404, "not found\n")
+
+        def respond(self, status, body, content_type='text/plain; charset=utf-8'):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes would flood stderr.
+
+    return MetricsHandler
+
+@contextmanager
+def timed(operation):
+    """Counts an operation and records how long it took, by whether or not it
+    raised.
+
+    Example:
+        >> with timed('encrypt'):
+        >>     ...
+    """
+    start = perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        OPERATIONS.inc(operation, outcome)
+        OPERATION_SECONDS.observe(perf_counter() - start, operation)
+
+def timed_predictions(method):
+    """Decorates a model's `predict_raw`, `predict_batch_raw` or
+    `predict_windows` to report the predictions it makes.
+
+    Models implement these in terms of each other, so only the outermost call
+    in a thread is reported.
+    """
+    batch = method.__name__ != 'predict_raw'
+
+    @wraps(method)
+    def reported(self, sequences):
+        if getattr(_predicting, 'active', False):
+            return method(self, sequences)
+
+        _predicting.active = True
+        start = perf_counter()
+        try:
+            return method(self, sequences)
+        finally:
+            _predicting.active = False
+            # The batch sizes' sum is the number of predictions, and the
+            # latencies' count is the number of calls.
+            OPERATION_SECONDS.observe(perf_counter() - start, 'predict')
+            PREDICTION_BATCH_SIZE.observe(len(sequences) if batch else 1)
+
+    return reported
+
+def resident_bytes():
+    """ The process' resident memory in bytes, or NaN where it can't be read
+    (i.e. outside of Linux). """
+    try:
+        from os import sysconf
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * sysconf('SC_PAGE_SIZE')
+    except (ImportError, OSError, ValueError):
+        return float('nan')
+
+def _labels(labels):
+    if len(labels) == 0:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value, True)) for (name, value) in labels.items())
+
+def _escape(value, quotes=False):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quotes else value
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    if np.isnan(value):
+        return 'NaN'
+    if np.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+_predicting = local()
+
+REGISTRY = Registry()
+
+OPERATIONS = REGISTRY.register(Counter(
+    'menc_operations_total', "Operations run, by operation (encrypt, decrypt, sample, ...) and outcome. Predictions are counted by menc_operation_seconds.",
+    ['operation', 'outcome']))
+
+OPERATION_SECONDS = REGISTRY.register(HistogramMetric(
+    'menc_operation_seconds', "How long operations took, by operation.",
+    exponential_buckets(0.0001, 2, 20), ['operation']))
+
+PREDICTION_BATCH_SIZE = REGISTRY.register(HistogramMetric(
+    'menc_prediction_batch_size', "Sequences per call to the model. The sum is the number of predictions.",
+    exponential_buckets(1, 2, 14)))
+
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'menc_cache_lookups_total', "Lookups of the per-message prediction cache, by result (hit or miss).",
+    ['result']))
+
+PADDING_BATCH_SIZE = REGISTRY.register(HistogramMetric(
+    'menc_padding_batch_size', "Candidate padding tokens generated together.",
+    exponential_buckets(1, 2, 12)))
+
+MODEL_BYTES = REGISTRY.register(Gauge(
+    'menc_model_weight_bytes', "The size of the weights of each loaded model, by fingerprint.",
+    ['fingerprint']))
+
+REGISTRY.register(Gauge(
+    'menc_process_resident_bytes', "The process' resident memory.", fn=resident_bytes))
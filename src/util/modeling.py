@@ -1,6 +1,110 @@
 from .sampling import choose_choice, choose_weight
-from .math import scale
-from .packing import MAX_INT
+from .math import scale, log_normalize, integer_weights
+from .packing import BITS_IN_BYTE, max_int
+from .context import Context
+from .metrics import CACHE_LOOKUPS
+
+class ModelWrapper(object):
+    """Wraps a model, so that it can be used anywhere a model is expected.
+    Subclasses override `predict_raw` and `predict_batch_raw`, which
+    `predict` and `predict_batch` go through. Everything else goes straight
+    to the wrapped model.
+
+    Attrs:
+        model (Model): The wrapped model.
+
+        config (Config): The wrapped model's config.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.config = model.config
+        self._lookup = {x: i for (i, x) in enumerate(model.config.model.alphabet)}
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def predict(self, sequence, novelty=None):
+        """ See `Model.predict`. """
+        if novelty == None:
+            novelty = self.config.encoding.novelty
+
+        return log_normalize(self.predict_raw(sequence), novelty)
+
+    def predict_batch(self, sequences, novelty=None):
+        """ See `Model.predict_batch`. """
+        if novelty == None:
+            novelty = self.config.encoding.novelty
+
+        return [log_normalize(p, novelty) for p in self.predict_batch_raw(sequences)]
+
+    def predict_raw(self, sequence):
+        """ See `Model.predict_raw`. """
+        return self.model.predict_raw(sequence)
+
+    def predict_batch_raw(self, sequences):
+        """ See `Model.predict_batch_raw`. """
+        return self.model.predict_batch_raw(sequences)
+
+    def _key(self, sequence):
+        """ Sequences are keyed by their alphabet indices, so that a Context
+        and a list holding the same values share a key. """
+        if isinstance(sequence, Context):
+            return sequence.key()
+        return tuple(self._lookup[x] for x in sequence)
+
+class CachedPredictions(ModelWrapper):
+    """Wraps a model and memoizes its raw predictions by sequence, so that
+    predicting the same sequence again (at any novelty) doesn't call the
+    underlying model. It can be used anywhere a model is expected by
+    `tabulate` and `recite`.
+
+    Example:
+        >> cached = CachedPredictions(model)
+        >> token = list(recite(cached, initial, weights, 1.5))
+        >> list(tabulate(cached, initial, token)) # No new model predictions
+
+    Attrs:
+        model (Model): The wrapped model.
+
+        config (Config): The wrapped model's config.
+
+        predictions (int): The number of sequences that the wrapped model
+            has been asked to predict, i.e. cache misses.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.predictions = 0
+        self._cache = {}
+
+    def predict_raw(self, sequence):
+        """ See `Model.predict_raw`. """
+        key = self._key(sequence)
+        if key not in self._cache:
+            self._cache[key] = self.model.predict_raw(sequence)
+            self.predictions += 1
+            CACHE_LOOKUPS.inc('miss')
+        else:
+            CACHE_LOOKUPS.inc('hit')
+        return self._cache[key]
+
+    def predict_batch_raw(self, sequences):
+        """ See `Model.predict_batch_raw`. Only the sequences that haven't
+        been predicted before are passed on to the model, in one batch. """
+        keys = [self._key(sequence) for sequence in sequences]
+        missing = {}
+        for (key, sequence) in zip(keys, sequences):
+            if key not in self._cache and key not in missing:
+                missing[key] = sequence
+
+        if len(missing) > 0:
+            predictions = self.model.predict_batch_raw(list(missing.values()))
+            self._cache.update(zip(missing.keys(), predictions))
+            self.predictions += len(missing)
+        CACHE_LOOKUPS.inc('miss', amount=len(missing))
+        CACHE_LOOKUPS.inc('hit', amount=len(keys) - len(missing))
+        return [self._cache[key] for key in keys]
 
 def tabulate(model, initial, values, novelty=None):
     """Given a sequence of values, this returns a list of random integer
@@ -65,6 +169,38 @@ def recite(model, initial, weights, novelty=None):
 
     return _scan_model(model, fn, initial, weights, novelty)
 
+def recite_many(model, initials, weights, novelty=None):
+    """Same as `recite`, but recites several sequences at once. Every step
+    makes a single batched prediction for all of the sequences that still
+    have weights remaining.
+
+    Example:
+        >> initial = list("THIS IS AN INITIAL SEQUENCE FOR AN EXAMPLE FOOBAR ")
+        >> weights = [3248025205, 3874735365, 4292362767, 3915527017, 4267391621]
+        >> recite_many(model, [initial, initial], [weights, weights[:2]])
+        [['H', 'E', 'L', 'L', 'O'], ['H', 'E']]
+
+    Args:
+        model (Model): The model to use for predictions.
+
+        initials (list(list)): The initial sequence for each recitation.
+
+        weights (list(list(int))): The weights for each recitation. These may
+            have different lengths.
+
+        novelty (float, optional): The conservativeness of the predictions.
+
+    Returns (list(list)):
+        The values chosen by each list of weights.
+    """
+    alphabet = model.config.model.alphabet
+
+    def fn(weight, weights):
+        value = choose_choice(weight, alphabet, weights)
+        return (value, value)
+
+    return _scan_model_many(model, fn, initials, weights, novelty)
+
 def _scan_model(model, fn, init, xs, novelty=None):
     """For every value in `xs`, this calls `fn` with both the value and the
     weights of the model's current predictions. The sequence being fed to the
@@ -96,12 +232,86 @@ def _scan_model(model, fn, init, xs, novelty=None):
     Returns (generator):
         A sequence of the values computed by `fn`.
     """
+    alphabet = model.config.model.alphabet
     sequence_length = model.config.model.sequence_length
-    sequence = init[-sequence_length:]
+    # We use (max + 1) because weights are chosen 0 <= w <= max
+    total = max_weight(model) + 1
+    context = Context(alphabet, sequence_length, init)
     for x in xs:
-        probabilities = model.predict(sequence, novelty)
-        # We use (MAX_INT + 1) because weights are chosen 0 <= w <= MAX_INT
-        scaled = scale(probabilities, MAX_INT + 1, lowest=1)
+        scaled = _scale(model, model.predict_raw(context), total, novelty)
         (next_value, y) = fn(x, scaled)
         yield y
-        sequence = (sequence + [next_value])[-sequence_length:]
+        context.push(next_value)
+
+def _scan_model_many(model, fn, inits, xss, novelty=None):
+    """Same as `_scan_model`, but scans several sequences in lockstep using
+    batched predictions. Sequences drop out of the batch as their `xs` are
+    exhausted.
+
+    Args:
+        model (Model): The model to use for predictions.
+
+        fn (function): See `_scan_model`.
+
+        inits (list(list)): The initial values for each sequence.
+
+        xss (list(sequence)): The values to feed to `fn` for each sequence.
+
+        novelty (float): The conservativeness of the predictions.
+
+    Returns (list(list)):
+        The values computed by `fn` for each sequence.
+    """
+    sequence_length = model.config.model.sequence_length
+    total = max_weight(model) + 1
+    sequences = [_tail(init, sequence_length) for init in inits]
+    iterators = [iter(xs) for xs in xss]
+    results = [[] for _ in xss]
+
+    active = list(range(len(iterators)))
+    while len(active) > 0:
+        pending = []
+        for i in active:
+            for x in iterators[i]:
+                pending.append((i, x))
+                break
+
+        batch = model.predict_batch_raw([sequences[i] for (i, _) in pending])
+        for ((i, x), probabilities) in zip(pending, batch):
+            scaled = _scale(model, probabilities, total, novelty)
+            (next_value, y) = fn(x, scaled)
+            results[i].append(y)
+            sequences[i] = _tail(sequences[i] + [next_value], sequence_length)
+
+        active = [i for (i, _) in pending]
+
+    return results
+
+def _tail(sequence, length):
+    """ The last `length` values of the sequence. Unlike slicing with
+    `[-length:]`, this is empty when `length` is 0. """
+    return sequence[max(0, len(sequence) - length):]
+
+def _scale(model, probabilities, total, novelty=None):
+    """Turns a model's raw probabilities into integer weights that sum to
+    `total`, using the numeric precision from the model's config.
+
+    Returns (list(int)|numpy.array):
+        The weights. With "float32" precision, they're a numpy array, which
+        `choose_choice` and `choose_weight` search in a vectorized step.
+    """
+    if novelty == None:
+        novelty = model.config.encoding.novelty
+
+    if model.config.encoding.precision == 'float32':
+        return integer_weights(probabilities, novelty, total)
+
+    return scale(log_normalize(probabilities, novelty), total, lowest=1)
+
+def weight_size(model):
+    """ The number of bytes used to store each of the model's weights. """
+    return model.config.encoding.weight_bits // BITS_IN_BYTE
+
+def max_weight(model):
+    """ The largest weight that the model's encoding can store. """
+    return max_int(weight_size(model))
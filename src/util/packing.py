@@ -5,40 +5,104 @@ BYTES_IN_INT = calcsize('I')
 INT_SIZE = BYTES_IN_INT * BITS_IN_BYTE
 MAX_INT = (2**INT_SIZE) - 1
 
-def pack_ints(xs):
-    """Serializes a list of 32-bit integers into a byte string.
+# Arrays that are laid out in a block of memory (or a file) start on cache
+# line boundaries. See `align`.
+ALIGNMENT = 64
+
+# Struct formats for the integer widths that struct supports natively. Other
+# widths fall back to `int.to_bytes` / `int.from_bytes`.
+_FORMATS = {1: 'B', 2: '<H', BYTES_IN_INT: 'I'}
+
+def max_int(size):
+    """ The largest unsigned integer that fits in `size` bytes. """
+    return (2**(size * BITS_IN_BYTE)) - 1
+
+def align(size):
+    """ Rounds `size` up to a multiple of `ALIGNMENT`.
+
+    Example:
+        >> align(65)
+        128
+    """
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+def pack_ints(xs, size=BYTES_IN_INT):
+    """Serializes a list of unsigned integers into a byte string.
 
     Example:
         >> pack_ints([1, 2, 3])
         b'\x01\x00\x00\x00\x02\x00\x00\x00\x03\x00\x00\x00'
+        >> pack_ints([1, 2, 3], 2)
+        b'\x01\x00\x02\x00\x03\x00'
 
     Args:
         xs (list(int)): The list of integers to encode.
 
+        size (int, optional): The number of bytes to use for each integer.
+
     Returns:
         A byte string encoding the list of integers.
 
     Raises:
         Error: If `xs` does not contain integers.
 
-        Error: If a value is not 0 <= x < 2^32.
+        Error: If a value is not 0 <= x < 2^(8 * size).
     """
-    return pack('I' * len(xs), *xs)
+    if size in _FORMATS:
+        fmt = _FORMATS[size]
+        return pack(fmt[:-1] + fmt[-1] * len(xs), *xs)
+    return b''.join(x.to_bytes(size, 'little') for x in xs)
 
-def unpack_ints(data):
-    """Deserializes a byte string into 32-bit integers.
+def unpack_ints(data, size=BYTES_IN_INT):
+    """Deserializes a byte string into unsigned integers.
 
     Example:
         >> unpack_ints(pack_ints([1,2,3]))
         (1, 2, 3)
+        >> unpack_ints(pack_ints([1,2,3], 3), 3)
+        (1, 2, 3)
 
     Args:
         data (bytes): The bytes to deserialize.
 
+        size (int, optional): The number of bytes used for each integer.
+
     Returns:
         A tuple of the decoded integers.
 
     Raises:
-        Error: If the data length is not a multiple of 4.
+        Error: If the data length is not a multiple of `size`.
+    """
+    count = len(data) // size
+    if size in _FORMATS:
+        fmt = _FORMATS[size]
+        return unpack(fmt[:-1] + fmt[-1] * count, data)
+    return tuple(int.from_bytes(data[i : i + size], 'little')
+                 for i in range(0, count * size, size))
+
+def unpack_ints_stream(chunks, size=BYTES_IN_INT):
+    """Deserializes a stream of byte strings into unsigned integers.
+
+    The chunks don't need to be aligned to integer boundaries. Any trailing
+    bytes that don't form a complete integer are ignored, just like
+    `unpack_ints`.
+
+    Example:
+        >> list(unpack_ints_stream([b'\x01\x00', b'\x00\x00\x02\x00\x00\x00']))
+        [1, 2]
+
+    Args:
+        chunks (sequence(bytes)): The byte strings to deserialize.
+
+        size (int, optional): The number of bytes used for each integer.
+
+    Returns (generator(int)):
+        The decoded integers.
     """
-    return unpack('I' * (len(data) // BYTES_IN_INT), data)
+    remainder = b''
+    for chunk in chunks:
+        data = remainder + chunk
+        usable = len(data) - (len(data) % size)
+        for x in unpack_ints(data[:usable], size):
+            yield x
+        remainder = data[usable:]
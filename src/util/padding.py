@@ -1,12 +1,131 @@
+import numpy as np
 from random import SystemRandom
-from .modeling import recite
+from threading import Lock
+from collections import namedtuple
+from .modeling import tabulate, weight_size, max_weight, CachedPredictions, _scale, _tail
+from .checkpoints import save_state, load_state
 from .lists import drop_tail_until
-from .packing import BYTES_IN_INT
-from .randoms import random_ints
+from .sampling import choose_choice
+from .tokenization import ends_token
+from .metrics import PADDING_BATCH_SIZE
 
 RAND = SystemRandom()
 
-def pad(model, initial, values, blocksize):
+PaddingReport = namedtuple('PaddingReport', [
+# What it took to pad a message. See `tabulate_padded_with_report`.
+
+    'length',
+    # The number of values of padding that were added, not counting a
+    # boundary added to terminate the message.
+
+    'trials',
+    # The number of trials up to and including the one whose token was used.
+
+    'novelty',
+    # The novelty of the trial whose token was used.
+
+    'candidates',
+    # The number of candidate tokens that were started, including those of
+    # trials after the one that was used. See `_padding`.
+
+    'predictions',
+    # The number of sequences the model predicted while generating padding.
+])
+
+class PaddingStatistics(object):
+    """Counts how many trials padding took to generate a token that was long
+    enough, for each length that was needed, so that later messages can
+    generate several candidate tokens at once instead of one per trial.
+
+    The statistics only decide how many trials are attempted per batch. The
+    candidates of a batch are exactly the tokens that would have been tried
+    one at a time (each with its own trial's novelty), and the first one that
+    is long enough is chosen, so the padding's distribution doesn't depend on
+    them. See `_padding`. They're safe to use from several threads.
+
+    They can be persisted to a file (see `save_state`), along with the
+    model's fingerprint so that statistics gathered for other weights are
+    ignored. Only do so where the file is as private as the plaintexts: how
+    many values each message needed to fill its last block is the message's
+    length modulo the block's capacity, so the counts reveal something about
+    the lengths of every message that was encrypted.
+
+    Example:
+        >> statistics = PaddingStatistics("padding.stats", model.fingerprint)
+        >> tabulate_padded(model, initial, values, 16, statistics)
+        >> statistics.batch_size(3)
+        4
+        >> statistics.save()
+
+    Attrs:
+        path (string): The file the statistics are kept in. None if they
+            aren't persisted.
+
+        fingerprint (bytes): The fingerprint of the model they're for.
+
+        counts (numpy.array): The number of times a token of at least each
+            length (the row) was first generated at each trial (the column),
+            counting from 0.
+    """
+
+    def __init__(self, path=None, fingerprint=None, quantile=0.9):
+        """ Instantiates statistics, loading them from `path` if they were
+        saved there for the same fingerprint.
+
+        Args:
+            path (string, optional): See `path`.
+
+            fingerprint (bytes, optional): See `fingerprint`.
+
+            quantile (float, optional): The share of recorded paddings that
+                the first batch of candidates should be large enough for.
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self._quantile = quantile
+        self._modified = False
+        self._lock = Lock()
+
+        state = load_state(path) if path != None else None
+        if state != None and bytes(state['fingerprint']) == (fingerprint or b''):
+            self.counts = state['counts'].astype(np.int64)
+
+    def record(self, length, trial):
+        """ Records that padding a block that needed a token of `length`
+        values succeeded at `trial` (counting from 0). """
+        with self._lock:
+            rows = max(self.counts.shape[0], length + 1)
+            columns = max(self.counts.shape[1], trial + 1)
+            if (rows, columns) != self.counts.shape:
+                counts = np.zeros((rows, columns), dtype=np.int64)
+                counts[:self.counts.shape[0], :self.counts.shape[1]] = self.counts
+                self.counts = counts
+
+            self.counts[length, trial] += 1
+            self._modified = True
+
+    def batch_size(self, length):
+        """ The number of trials that were enough for the statistics'
+        quantile of the recorded paddings that needed a token of `length`
+        values. 1 if none have been recorded. """
+        with self._lock:
+            if length >= self.counts.shape[0] or not np.any(self.counts[length]):
+                return 1
+            cumulative = np.cumsum(self.counts[length])
+
+        return int(np.searchsorted(cumulative, self._quantile * cumulative[-1])) + 1
+
+    def save(self):
+        """ Atomically writes the statistics to `path`, if anything has been
+        recorded since they were loaded. """
+        with self._lock:
+            if self.path != None and self._modified:
+                save_state({'fingerprint': np.frombuffer(self.fingerprint or b'', dtype=np.uint8),
+                            'counts': self.counts}, self.path)
+                self._modified = False
+
+def pad(model, initial, values, blocksize, statistics=None):
     """Extends the provided values with model predictions to make the total
     length of (initial + values) equal to a multiple of blocksize.
 
@@ -39,11 +158,15 @@ def pad(model, initial, values, blocksize):
 
         blocksize (int): The mutliple that we need to pad to.
 
+        statistics (PaddingStatistics, optional): Statistics to size batches
+            of candidate tokens with, and to record this padding in.
+
     Returns:
         A list of values + padding.
 
     Raises:
-        ValueError: If blocksize is not a multiple of 4 or greater than 0.
+        ValueError: If blocksize is not greater than 0 and a multiple of the
+        model's weight size (4 bytes by default).
 
         Exception: If padding fails to generate. This is a non-deterministic
         process, so trying again may work. This is extremely unlikely to be
@@ -51,30 +174,77 @@ def pad(model, initial, values, blocksize):
         max_padding_trials in your config.
     """
 
-    if blocksize < 1 or blocksize % BYTES_IN_INT != 0:
-        raise ValueError("Blocksize must be greater than 0.")
+    values = _terminate(model, values, blocksize)
+    (padding, _, _) = _padding(model, initial, values, blocksize, statistics)
+    return values + padding
 
-    boundary = model.config.model.boundary
-    if len(values) == 0 or values[-1] != boundary:
-        values = values + [boundary]
+def tabulate_padded(model, initial, values, blocksize, statistics=None):
+    """Pads the values and tabulates the result in a single pass. This is
+    equivalent to:
 
-    length = _base_length(model, values)
-    block_capacity = blocksize // BYTES_IN_INT
-    first_length = block_capacity - (length % block_capacity)
-    joined = initial + values
+        tabulate(model, initial, pad(model, initial, values, blocksize))
 
-    for token in _tokens(model, joined):
-        if len(token) >= first_length:
-            offsets = range(first_length, len(token) + 1, block_capacity)
-            token_prefixes = [token[:j] for j in offsets]
-            padding = RAND.choice(token_prefixes)
-            return values + padding
+    However, the model's predictions made while generating candidate padding
+    are reused when tabulating the chosen padding, so the padding is never
+    predicted twice.
 
-    raise Exception("Failed to generate padding. This is non-deterministic. Run again or try increasing padding_novelty_growth_rate count.")
+    Example:
+        >> initial = list("THIS IS AN INITIAL SEQUENCE FOR AN EXAMPLE FOOBAR ")
+        >> weights = tabulate_padded(model, initial, list("HELLO"), 16)
+        >> "".join(recite(model, initial, weights))
+        'HELLO MUC'
+
+    Args:
+        model (Model): The model to use for encoding.
+
+        initial (list): The initial sequence used to seed the model.
+
+        values (list): The values to pad and tabulate.
+
+        blocksize (int): The mutliple that we need to pad to.
+
+        statistics (PaddingStatistics, optional): See `pad`.
+
+    Returns (list(int)):
+        The weights for the values and padding.
+
+    Raises:
+        See `pad`.
+    """
+    (weights, _) = tabulate_padded_with_report(model, initial, values, blocksize, statistics)
+    return weights
+
+def tabulate_padded_with_report(model, initial, values, blocksize, statistics=None):
+    """Same as `tabulate_padded`, but also reports what padding took.
+
+    Example:
+        >> (weights, report) = tabulate_padded_with_report(model, initial, list("HELLO"), 16)
+        >> report.trials
+        3
+
+    Returns (tuple(list(int), PaddingReport)):
+        The weights for the values and padding, and the padding's report.
+
+    Raises:
+        See `pad`.
+    """
+    values = _terminate(model, values, blocksize)
+    weights = list(tabulate(model, initial, values))
+
+    # Only the padding phase is cached, the values are never predicted again.
+    cached = CachedPredictions(model)
+    (padding, trial, candidates) = _padding(cached, initial, values, blocksize, statistics)
+    weights += tabulate(cached, initial + values, padding)
+
+    novelty = model.config.encoding.novelty * model.config.encoding.padding_novelty_growth_rate ** trial
+    return (weights, PaddingReport(len(padding), trial + 1, novelty, candidates, cached.predictions))
 
 def unpad(model, values):
     """Removes the last token (including any trailing boundaries) from values.
 
+    For alphabets of multi-character tokens, any value that ends with the
+    boundary (e.g. "THE ") counts as a boundary.
+
     Example:
         >> unpad(model, "FOO BAR ")
         'FOO '
@@ -95,17 +265,64 @@ def unpad(model, values):
         is only one token.
     """
     boundary = model.config.model.boundary
+    ends = lambda value: ends_token(value, boundary)
 
     # Trim boundary if it's on the end then drop token.
-    if len(values) > 0 and values[-1] == boundary:
+    if len(values) > 0 and ends(values[-1]):
         values = values[:-1]
 
-    return drop_tail_until(boundary, values)
+    return drop_tail_until(True, values, key=ends)
 
-def _tokens(model, base):
-    """ Generates a stream of tokens with increasing novelty. """
-    for novelty in _novelities(model):
-        yield _generate_token(model, base, novelty)
+def _terminate(model, values, blocksize):
+    """ Validates the blocksize and ensures that values end in a boundary. """
+    size = weight_size(model)
+    if blocksize < 1 or blocksize % size != 0:
+        raise ValueError("Blocksize must be greater than 0 and a multiple of %s." % (size))
+
+    boundary = model.config.model.boundary
+    if len(values) == 0 or not ends_token(values[-1], boundary):
+        values = values + [boundary]
+
+    return values
+
+def _padding(model, initial, values, blocksize, statistics=None):
+    """Generates the padding to append to `values`. See `pad`. Returns the
+    padding, the trial (from 0) it was generated at and the number of
+    candidate tokens that were started.
+
+    Trials are attempted in batches of candidate tokens. The first batch is
+    sized from the statistics (if any), and each batch after it is twice as
+    large, so even a padding that takes hundreds of trials only needs a
+    handful of batches. Within a batch, the candidate of the earliest trial
+    that's long enough is used, which is the token that trying them one at a
+    time would have stopped at.
+    """
+    length = _base_length(model, values)
+    block_capacity = blocksize // weight_size(model)
+    first_length = block_capacity - (length % block_capacity)
+    joined = initial + values
+    novelties = list(_novelities(model))
+
+    trial = 0
+    candidates = 0
+    size = statistics.batch_size(first_length) if statistics != None else 1
+    while trial < len(novelties):
+        batch = novelties[trial : trial + size]
+        found = _first_long_token(model, joined, batch, first_length)
+        candidates += len(batch)
+        PADDING_BATCH_SIZE.observe(len(batch))
+        if found != None:
+            (offset, token) = found
+            if statistics != None:
+                statistics.record(first_length, trial + offset)
+            offsets = range(first_length, len(token) + 1, block_capacity)
+            token_prefixes = [token[:j] for j in offsets]
+            return (RAND.choice(token_prefixes), trial + offset, candidates)
+
+        trial += size
+        size *= 2
+
+    raise Exception("Failed to generate padding. This is non-deterministic. Run again or try increasing padding_novelty_growth_rate count.")
 
 def _novelities(model):
     """ A sequence of increasing novelities. """
@@ -115,40 +332,59 @@ def _novelities(model):
     for i in range(trials):
         yield novelty * (growth_rate ** i)
 
-def _generate_token(model, start, novelty):
-    """Generates a random single token following the `start` sequence.
+def _first_long_token(model, start, novelties, length):
+    """Generates a random token following the `start` sequence for each
+    novelty, all at once, and returns the first one that's at least `length`
+    values long.
+
+    Every step makes a single batched prediction for the candidates that
+    haven't hit a boundary yet. Candidates after one that's already long
+    enough can't be chosen, so they're dropped as soon as it is.
 
     Note: If the probability of generating a boundary character is low then
-    this could take a while to run. It won't stop trying to generate values
-    until it succeeds in generating a boundary.
+    this could take a while to run. A candidate isn't done until it generates
+    a boundary.
 
     Example:
         >> initial = list("THIS IS AN INITIAL SEQUENCE FOR AN EXAMPLE FOOBAR ")
-        >> _generate_token(model, initial, 1.0)
-        ['A', 'N', 'D', ' ']
-        >> _generate_token(model, initial, 1.0)
-        ['M', 'E', 'A', 'N', 'S', ' ']
+        >> _first_long_token(model, initial, [1.0, 1.01, 1.0201], 5)
+        (1, ['M', 'E', 'A', 'N', 'S', ' '])
 
     Args:
         model (Model): The model to be used for prediction.
 
-        start (list): The sequence to generate a subsequent token for.
+        start (list): The sequence to generate subsequent tokens for.
 
-        novelty (float): The conservativeness of the token generation.
+        novelties (list(float)): The novelty of each candidate, in the order
+            they're tried.
 
-    Returns:
-        A random token that the model believes would reasonably follow the
-        provided sequence.
+        length (int): The number of values a token needs.
+
+    Returns (tuple(int, list)):
+        The index of the chosen candidate and its token, or None if no
+        candidate was long enough.
     """
-    # Non-deterministic. If `boundary` has a low prob of being generated, this
-    # could take a while to run.
+    alphabet = model.config.model.alphabet
     boundary = model.config.model.boundary
-    stream = recite(model, start, random_ints(), novelty) # Infinite stream
-    token = []
-    for c in stream:
-        token.append(c)
-        if c == boundary:
-            return token
+    sequence_length = model.config.model.sequence_length
+    total = max_weight(model) + 1
+    base = _tail(list(start), sequence_length)
+
+    tokens = [[] for _ in novelties]
+    done = [False for _ in novelties]
+    active = list(range(len(novelties)))
+    while len(active) > 0:
+        sequences = [_tail(base + tokens[i], sequence_length) for i in active]
+        for (i, probabilities) in zip(active, model.predict_batch_raw(sequences)):
+            weights = _scale(model, probabilities, total, novelties[i])
+            value = choose_choice(RAND.randint(0, total - 1), alphabet, weights)
+            tokens[i].append(value)
+            done[i] = ends_token(value, boundary)
+
+        cutoff = next((i for (i, token) in enumerate(tokens) if len(token) >= length), len(novelties))
+        active = [i for i in active if not done[i] and i <= cutoff]
+
+    return next(((i, token) for (i, token) in enumerate(tokens) if len(token) >= length), None)
 
 def _base_length(model, values):
     """ Returns the length of the payload without padding. """
@@ -3,7 +3,7 @@ from .packing import MAX_INT
 
 RAND = SystemRandom()
 
-def random_ints():
-    """ Generates an infinite stream of 32-bit integers. """
+def random_ints(maximum=MAX_INT):
+    """ Generates an infinite stream of integers, 0 <= x <= `maximum`. """
     while True:
-        yield RAND.randint(0, MAX_INT)
+        yield RAND.randint(0, maximum)
@@ -1,3 +1,4 @@
+import numpy as np
 from random import SystemRandom
 
 RAND = SystemRandom()
@@ -40,8 +41,9 @@ def choose_choice(weight, choices, weights):
 
         choices (list(x)): The list of items to choose from.
 
-        weights (list(int)): The integer weights associated with each
-            item in `choices`.
+        weights (list(int)|numpy.array): The integer weights associated with
+            each item in `choices`. A numpy array is searched in a single
+            vectorized step.
 
     Returns:
         The choice corresponding to the provided weight.
@@ -61,6 +63,13 @@ def choose_choice(weight, choices, weights):
     if weight < 0:
         raise ValueError("Weight, %s, can not be less than zero." % (weight))
 
+    if isinstance(weights, np.ndarray):
+        cdf = np.cumsum(weights)
+        if weight >= cdf[-1]:
+            raise ValueError("Weight, %s, must be less than %s, the sum of all weights."
+                            % (weight, cdf[-1]))
+        return choices[int(np.searchsorted(cdf, weight, side='right'))]
+
     total = 0
     for c, w in zip(choices, weights):
         total = total + w
@@ -114,7 +123,8 @@ def choose_weight(choice, choices, weights):
 
         choices (list(x)): The items being sampled from.
 
-        weights (list(int)): The weights of each item in `choices`.
+        weights (list(int)|numpy.array): The weights of each item in
+            `choices`.
 
     Returns:
         A random weight from the interval corresponding to the given `choice`.
@@ -128,6 +138,12 @@ def choose_weight(choice, choices, weights):
         raise ValueError("Weights has length %s, but choices has length %s."
                          % (len(weights), len(choices)))
 
+    if isinstance(weights, np.ndarray):
+        (start, end) = _bounds(choice, choices, weights)
+        if start == end:
+            return None # When weight is zero
+        return RAND.randint(start, end - 1)
+
     start, end = 0, 0
     for c, w in zip(choices, weights):
         start, end = end, end + w
@@ -140,3 +156,14 @@ def choose_weight(choice, choices, weights):
         return None # When weight is zero
 
     return RAND.randint(start, end - 1)
+
+def _bounds(choice, choices, weights):
+    """ Returns the range of weights, [start, end), of a choice given a numpy
+    array of weights. """
+    try:
+        index = choices.index(choice)
+    except ValueError:
+        raise ValueError("Choice, %s, is not present in choices: %s" % (choice, choices))
+
+    end = int(np.sum(weights[:index + 1]))
+    return (end - int(weights[index]), end)
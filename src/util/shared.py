@@ -0,0 +1,71 @@
+""" Shares read-only numpy arrays between processes without copying them. """
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from .packing import align
+
+class SharedArrays(object):
+    """Publishes a list of numpy arrays into a single block of shared memory,
+    once, so that any number of processes can attach to them without making
+    their own copy.
+
+    The block stays available until `close` is called by the process that
+    published it. `handle` is small and picklable, so it can be sent to
+    workers in place of the arrays themselves.
+
+    Example:
+        >> shared = SharedArrays(model.get_weights())
+        >> # In another process:
+        >> (memory, weights) = attach_arrays(shared.handle)
+        >> shared.close()
+
+    Attrs:
+        handle (tuple): Identifies the block and where each array lives in
+            it. See `attach_arrays`.
+    """
+
+    def __init__(self, arrays):
+        """ Copies the arrays into a new block of shared memory.
+
+        Args:
+            arrays (list(numpy.array)): The arrays to publish.
+        """
+        arrays = [np.ascontiguousarray(a) for a in arrays]
+        layout = []
+        size = 0
+        for array in arrays:
+            layout.append((array.dtype, array.shape, size))
+            size += align(array.nbytes)
+
+        # Shared memory blocks can't be empty.
+        self._memory = SharedMemory(create=True, size=max(1, size))
+        for (array, (dtype, shape, offset)) in zip(arrays, layout):
+            np.ndarray(shape, dtype, self._memory.buf, offset)[...] = array
+
+        self.handle = (self._memory.name, layout)
+
+    def close(self):
+        """ Releases the block. Processes that are still attached keep their
+        mapping until they detach. """
+        if self._memory != None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+def attach_arrays(handle):
+    """Attaches to arrays published by `SharedArrays`.
+
+    Args:
+        handle (tuple): The `handle` of the published arrays.
+
+    Returns (tuple(SharedMemory, list(numpy.array))):
+        The attached block and read-only views of the arrays. The views are
+        only valid while a reference to the block is kept.
+    """
+    (name, layout) = handle
+    memory = SharedMemory(name=name)
+    arrays = []
+    for (dtype, shape, offset) in layout:
+        array = np.ndarray(shape, dtype, memory.buf, offset)
+        array.flags.writeable = False
+        arrays.append(array)
+    return (memory, arrays)
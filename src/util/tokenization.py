@@ -0,0 +1,115 @@
+from collections import Counter
+
+# Marks the node of the trie where a token ends. Characters are never None.
+_END = None
+
+class Tokenizer(object):
+    """Splits text into the tokens of an alphabet, taking the longest token
+    that matches at each position.
+
+    Matching never backtracks, so every character of a multi-character token
+    must also be a token by itself (see `config._validate_tokens`). Otherwise
+    text could be rejected even though some split into tokens exists.
+
+    Tokens are stored in a trie, so tokenizing only ever looks at each
+    character of the text as many times as the longest token is long.
+
+    Example:
+        >> tokenizer = Tokenizer(["A", "B", " ", "AB", "ABA "])
+        >> tokenizer.tokenize("ABA AB B")
+        ['ABA ', 'AB', ' ', 'B']
+    """
+
+    def __init__(self, tokens):
+        """ Instantiates a tokenizer.
+
+        Args:
+            tokens (sequence(string)): The tokens to split text into.
+        """
+        self._trie = {}
+        for token in tokens:
+            node = self._trie
+            for c in token:
+                node = node.setdefault(c, {})
+            node[_END] = token
+
+    def tokenize(self, text):
+        """ Splits the text into tokens.
+
+        Args:
+            text (string): The text to split.
+
+        Returns (list(string)):
+            The tokens, which concatenate back to `text`.
+
+        Raises:
+            ValueError: If no token matches some part of the text.
+        """
+        tokens = []
+        i = 0
+        while i < len(text):
+            node = self._trie
+            match = None
+            j = i
+            while j < len(text) and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if _END in node:
+                    match = (node[_END], j)
+
+            if match == None:
+                raise ValueError("No token matches the text at '%s'." % (text[i : i + 10]))
+
+            tokens.append(match[0])
+            i = match[1]
+
+        return tokens
+
+def ends_token(value, boundary):
+    """Returns whether an item of a sequence completes a token (e.g. a word),
+    i.e. whether it ends with the boundary character. For alphabets of single
+    characters, this is the same as being the boundary.
+
+    Example:
+        >> ends_token(" ", " ")
+        True
+        >> ends_token("THE ", " ")
+        True
+        >> ends_token("TH", " ")
+        False
+    """
+    return value.endswith(boundary)
+
+def learn_tokens(text, count, max_length, boundary):
+    """Finds the multi-character tokens that shorten the text the most when
+    it's tokenized, judged by how often each one occurs.
+
+    Tokens never contain the boundary, except as their last character, so
+    that each token belongs to a single word.
+
+    Example:
+        >> learn_tokens("THE CAT THE HAT ", 2, 4, " ")
+        ['THE ', 'AT ']
+
+    Args:
+        text (string): The (transformed) text to learn tokens from.
+
+        count (int): The number of tokens to learn.
+
+        max_length (int): The length of the longest token.
+
+        boundary (string): The boundary character.
+
+    Returns (list(string)):
+        The tokens, most useful first.
+    """
+    counts = Counter()
+    for length in range(2, max_length + 1):
+        for i in range(len(text) - length + 1):
+            token = text[i : i + length]
+            if boundary not in token[:-1]:
+                counts[token] += 1
+
+    # Each occurrence of a token saves (length - 1) steps.
+    ranked = sorted(counts, key=lambda token: (-counts[token] * (len(token) - 1), token))
+    return ranked[:count]
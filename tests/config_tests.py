@@ -0,0 +1,104 @@
+import unittest
+from os.path import join
+from tempfile import TemporaryDirectory
+from config import Config, ValidationError, load_config, save_config
+from mock_model import config
+
+class TestConfig(unittest.TestCase):
+
+    def test_defaults(self):
+        cfg = config()
+        self.assertEqual(Config(cfg).encoding.weight_bits, 32)
+
+        cfg['encoding']['weight_bits'] = 16
+        self.assertEqual(Config(cfg).encoding.weight_bits, 16)
+
+    def test_missing_field(self):
+        cfg = config()
+        del cfg['encoding']['novelty']
+        with self.assertRaises(ValidationError):
+            Config(cfg)
+
+    def test_invalid_weight_bits(self):
+        cfg = config()
+        cfg['encoding']['weight_bits'] = 12
+        with self.assertRaises(ValidationError):
+            Config(cfg)
+
+        cfg = config()
+        cfg['model']['alphabet'] = "".join(chr(i) for i in range(300))
+        cfg['encoding']['weight_bits'] = 8
+        with self.assertRaises(ValidationError):
+            Config(cfg)
+
+    def test_backend(self):
+        cfg = config()
+        self.assertEqual(Config(cfg).model.backend, 'lstm')
+
+        cfg['model']['backend'] = 'foo'
+        with self.assertRaises(ValidationError):
+            Config(cfg)
+
+        cfg = config()
+        cfg['model'].update({'backend': 'ngram', 'order': 31})
+        self.assertEqual(Config(cfg).model.order, 31)
+
+        cfg['model']['order'] = 32 # 4^32 keys don't fit in 63 bits
+        with self.assertRaises(ValidationError):
+            Config(cfg)
+
+        # The order only matters to the n-gram backend.
+        cfg['model']['backend'] = 'lstm'
+        self.assertEqual(Config(cfg).model.order, 32)
+
+    def test_save_config(self):
+        cfg = config()
+        cfg['transformations']['translate'] = ["ab", "01"]
+        with TemporaryDirectory() as directory:
+            cfg['model']['weights_file'] = join(directory, 'weights')
+            saved = Config(cfg)
+            save_config(saved, join(directory, 'config.json'))
+            loaded = load_config(join(directory, 'config.json'))
+
+        self.assertEqual(loaded.model, saved.model)
+        self.assertEqual(loaded.training, saved.training)
+        self.assertEqual(list(loaded.transformations.translate), ["ab", "01"])
+
+    def test_token_alphabet(self):
+        cfg = config()
+        cfg['model']['alphabet'] = ['0', '1', '2', '12', '120']
+        self.assertEqual(Config(cfg).model.alphabet, ['0', '1', '2', '12', '120'])
+
+        # '102' contains the boundary, and '13' needs '3' to be a token too.
+        for alphabet in [['0', '1', '1'], ['0', '1', ''], ['0', '1', '102'], ['0', '1', '13']]:
+            cfg['model']['alphabet'] = alphabet
+            with self.assertRaises(ValidationError):
+                Config(cfg)
+
+    def test_precision(self):
+        cfg = config()
+        self.assertEqual(Config(cfg).encoding.precision, 'float64')
+
+        cfg['encoding']['precision'] = 'float16'
+        with self.assertRaises(ValidationError):
+            Config(cfg)
+
+    def test_training_mode(self):
+        cfg = config()
+        self.assertEqual(Config(cfg).training.mode, 'windows')
+
+        cfg['training']['mode'] = 'streams'
+        self.assertEqual(Config(cfg).training.mode, 'streams')
+
+        cfg['training']['mode'] = 'foo'
+        with self.assertRaises(ValidationError):
+            Config(cfg)
+
+    def test_training_workers(self):
+        cfg = config()
+        self.assertEqual(Config(cfg).training.workers, 1)
+
+        cfg['training']['workers'] = 4
+        cfg['training']['mode'] = 'streams'
+        with self.assertRaises(ValidationError):
+            Config(cfg)
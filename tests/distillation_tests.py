@@ -0,0 +1,90 @@
+import unittest
+import numpy as np
+from io import StringIO
+from os.path import join
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from config import Config
+from distillation import distill, predictions
+from ngram import NGramModel
+from mock_model import MockModel, config
+
+DATA = "0120120120110120120210120120120"
+
+def ngram_model(directory, name, order):
+    cfg = config()
+    cfg['model'].update({'backend': 'ngram', 'order': order, 'sequence_length': 4,
+                         'weights_file': join(directory, name)})
+    cfg['training']['validation_split'] = 0.25
+    return NGramModel(Config(cfg))
+
+class TestDistillation(unittest.TestCase):
+
+    def test_predictions(self):
+        with TemporaryDirectory() as directory:
+            model = ngram_model(directory, 'teacher', 2)
+            with redirect_stdout(StringIO()):
+                model.train(DATA)
+
+            rows = predictions(model, DATA, 4, 10, batch_size=4)
+
+        self.assertEqual(rows.shape, (6, 3))
+        self.assertTrue(np.allclose(rows[0], model.predict_raw(DATA[0:4])))
+        self.assertTrue(np.allclose(rows[5], model.predict_raw(DATA[5:9])))
+
+    def test_distill(self):
+        with TemporaryDirectory() as directory:
+            teacher = ngram_model(directory, 'teacher', 3)
+            students = [ngram_model(directory, 'student%s' % (order), order) for order in [0, 3]]
+            with redirect_stdout(StringIO()):
+                teacher.train(DATA)
+                reports = [distill(teacher, student, DATA) for student in students]
+
+        for report in reports:
+            self.assertGreaterEqual(report.kl_divergence, 0.0)
+            self.assertAlmostEqual(report.cross_entropy, report.entropy + report.kl_divergence)
+
+        # A student with the teacher's order learns more of its predictions.
+        self.assertLess(reports[1].kl_divergence, reports[0].kl_divergence)
+
+    def test_distill_lstm(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        cfg['training'].update({'validation_split': 0.0, 'epochs': 1, 'sample_length': 0})
+
+        with TemporaryDirectory() as directory:
+            cfg['model']['weights_file'] = join(directory, 'student')
+            teacher = ngram_model(directory, 'teacher', 2)
+            student = MockModel(Config(cfg))
+            with redirect_stdout(StringIO()):
+                teacher.train(DATA)
+                report = distill(teacher, student, DATA)
+
+        # The mock "trains" on every window that follows the teacher's sequences.
+        self.assertEqual(student.model.get_weights()[0].tolist(), [len(DATA) - 4])
+        self.assertGreaterEqual(report.kl_divergence, 0.0)
+
+    def test_distill_lstm_validation(self):
+        """ The data is only held out once, by `distill`. """
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        cfg['training'].update({'validation_split': 0.25, 'epochs': 1, 'sample_length': 0})
+
+        with TemporaryDirectory() as directory:
+            cfg['model']['weights_file'] = join(directory, 'student')
+            teacher = ngram_model(directory, 'teacher', 2)
+            student = MockModel(Config(cfg))
+            with redirect_stdout(StringIO()):
+                teacher.train(DATA)
+                distill(teacher, student, DATA)
+
+        count = len(DATA) - 4
+        self.assertEqual(student.model.get_weights()[0].tolist(), [count - int(count * 0.25)])
+        self.assertEqual(student.model.validation_split, 0.0)
+
+    def test_mismatched_alphabets(self):
+        cfg = config()
+        cfg['model']['alphabet'] = '0123'
+        with TemporaryDirectory() as directory:
+            with self.assertRaises(ValueError):
+                distill(ngram_model(directory, 'teacher', 2), MockModel(Config(cfg)), DATA)
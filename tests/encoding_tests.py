@@ -1,7 +1,8 @@
 import unittest
 from random import choice
-from encoding import encode, decode
-from mock_model import mock_model
+from encoding import encode, encode_with_stats, decode, decode_stream, decode_many, encode_segments, decode_segments
+from util.container import chunked
+from mock_model import mock_model, config
 
 class TestEncoding(unittest.TestCase):
 
@@ -22,3 +23,88 @@ class TestEncoding(unittest.TestCase):
             message = "".join(choice("01") for _ in range(i)) + model.config.model.boundary
             result = decode(model, encode(model, message))
             self.assertEqual(message, result)
+
+    def test_stats(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        cfg = config()
+        cfg['encoding'].update({'normalizing_length': 2, 'priming_length': 3})
+        model = mock_model(cfg)
+
+        (encoded, stats) = encode_with_stats(model, "101")
+        self.assertEqual(decode(model, encoded), "1010")
+        self.assertEqual((stats.tokens, stats.plaintext_bytes, stats.output_bytes), (4, 3, len(encoded)))
+        self.assertAlmostEqual(stats.expansion_ratio, len(encoded) / 3)
+        # 5 initial weights, then the message and its padding.
+        self.assertEqual(len(encoded), 4 * (5 + 4 + stats.padding_tokens))
+        self.assertEqual((stats.initialization_predictions, stats.encoding_predictions), (5, 4))
+        self.assertGreaterEqual(stats.padding_candidates, stats.padding_trials)
+        self.assertGreaterEqual(stats.padding_predictions, 1) # Cached by context
+        self.assertAlmostEqual(stats.padding_novelty, 0.5 * 1.01 ** (stats.padding_trials - 1))
+        self.assertGreater(stats.seconds, 0.0)
+
+    def test_token_alphabet(self):
+        """ Test round-trip encoding with multi-character tokens.
+
+        Note: This is a non-deterministic test, but should always pass.
+        """
+        cfg = config()
+        cfg['model']['alphabet'] = ['0', '1', '2', '12', '210', '1110']
+        model = mock_model(cfg)
+
+        self.assertEqual(model.tokenize("1211102"), ['12', '1110', '2'])
+        for i in range(20):
+            message = "".join(choice("012") for _ in range(i)) + model.config.model.boundary
+            self.assertEqual(decode(model, encode(model, message)), message)
+
+        segments = encode_segments(model, "12101210121012", 2)
+        self.assertEqual(decode_segments(model, segments), "121012101210120")
+
+    def test_decode_stream(self):
+        model = mock_model()
+        message = "1201" + model.config.model.boundary
+        encoded = encode(model, message)
+        for size in [1, 3, 4, 7, len(encoded)]:
+            self.assertEqual(decode_stream(model, chunked(encoded, size)), message)
+
+    def test_weight_bits(self):
+        for weight_bits in [8, 16, 24, 32]:
+            cfg = config()
+            cfg['encoding']['weight_bits'] = weight_bits
+            model = mock_model(cfg)
+            for i in range(10):
+                message = "".join(choice("012") for _ in range(i)) + model.config.model.boundary
+                # A small block size keeps the padding short. Long padding is
+                # unlikely to be generated by the mock model.
+                encoded = encode(model, message, 4)
+                self.assertEqual(len(encoded) % (weight_bits // 8), 0)
+                self.assertEqual(len(encoded) % 4, 0)
+                self.assertEqual(decode(model, encoded), message)
+
+    def test_float32_precision(self):
+        cfg = config()
+        cfg['encoding']['precision'] = 'float32'
+        model = mock_model(cfg)
+
+        messages = ["".join(choice("012") for _ in range(i)) + model.config.model.boundary for i in range(10)]
+        encoded = [encode(model, message) for message in messages]
+        self.assertEqual([decode(model, e) for e in encoded], messages)
+        self.assertEqual(decode_many(model, encoded), messages)
+
+    def test_segments(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        model = mock_model()
+        boundary = model.config.model.boundary
+
+        self.assertEqual(decode_segments(model, encode_segments(model, "", 4)), boundary)
+
+        with self.assertRaises(ValueError):
+            encode_segments(model, "1", 0)
+
+        message = "".join(choice("012") for _ in range(200)) + boundary
+        for segment_size in [1, 10, 50, 500]:
+            segments = encode_segments(model, message, segment_size)
+            self.assertEqual(decode_segments(model, segments), message)
+
+        # In parallel
+        segments = encode_segments(model, message, 20, processes=2)
+        self.assertEqual(decode_segments(model, segments, processes=2), message)
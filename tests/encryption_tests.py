@@ -1,7 +1,13 @@
 import unittest
 from random import choice
-from encryption import encrypt, decrypt
-from mock_model import mock_model
+from io import BytesIO
+from Crypto.Cipher import AES
+from hashlib import sha256
+from encryption import encrypt, encrypt_with_stats, encrypt_stream, encrypt_segments, decrypt, decrypt_stream, decrypt_candidates, KEY_CACHE, KDF_PARAMS
+from encoding import encode
+from util.container import pack_container, read_header, SEGMENTED
+from util.kdf import unpack_kdf
+from mock_model import mock_model, config
 
 class TestEncryption(unittest.TestCase):
 
@@ -28,3 +34,103 @@ class TestEncryption(unittest.TestCase):
             message = "".join(choice("01") for _ in range(i)) + model.config.model.boundary
             result = decrypt(model, "bar", encrypt(model, "foo", message))
             self.assertNotEqual(message, result)
+
+    def test_stream_encryption(self):
+        model = mock_model()
+        message = "1010110" + model.config.model.boundary
+
+        stream = BytesIO()
+        stats = encrypt_stream(model, "foo", message, stream)
+        self.assertEqual(decrypt(model, "foo", stream.getvalue()), message)
+        self.assertEqual(stats.output_bytes, len(stream.getvalue()))
+        self.assertAlmostEqual(stats.expansion_ratio, len(stream.getvalue()) / len(message))
+
+        (ciphertext, stats) = encrypt_with_stats(model, "foo", message)
+        self.assertEqual(decrypt(model, "foo", ciphertext), message)
+        self.assertEqual((stats.tokens, stats.output_bytes), (len(message), len(ciphertext)))
+
+        ciphertext = BytesIO(encrypt(model, "foo", message))
+        self.assertEqual(decrypt_stream(model, "foo", ciphertext), message)
+
+    def test_wrong_model(self):
+        cfg = config()
+        cfg['encoding']['novelty'] = 0.75
+        model = mock_model()
+        other = mock_model(cfg)
+        self.assertNotEqual(model.fingerprint, other.fingerprint)
+
+        with self.assertRaises(ValueError):
+            decrypt(other, "foo", encrypt(model, "foo", "0"))
+
+    def test_decrypt_candidates(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        cfg = config()
+        cfg['model']['sequence_length'] = 5
+        cfg['encoding']['normalizing_length'] = 5
+        cfg['encoding']['priming_length'] = 5
+        model = mock_model(cfg)
+
+        self.assertEqual(decrypt_candidates(model, []), [])
+
+        message = "".join(choice("01") for _ in range(80)) + model.config.model.boundary
+        short = "1" + model.config.model.boundary
+        ciphertext = encrypt(model, "foo", message)
+        candidates = [("bar", ciphertext), ("foo", ciphertext), ("foo", encrypt(model, "foo", short))]
+
+        results = decrypt_candidates(model, candidates)
+        self.assertEqual(len(results), 3)
+        self.assertNotEqual(results[0], message)
+        self.assertEqual(results[1], message)
+        self.assertEqual(results[2], short)
+        self.assertEqual(results[0], decrypt(model, "bar", ciphertext))
+
+    def test_key_derivation(self):
+        model = mock_model()
+        misses = KEY_CACHE.keys.misses
+
+        # Reusing a key reuses its salt and derived key.
+        ciphertexts = [encrypt(model, "baz", "1") for _ in range(5)]
+        headers = [read_header(BytesIO(c)) for c in ciphertexts]
+        self.assertEqual(len(set(h.kdf for h in headers)), 1)
+        self.assertEqual(len(set(h.iv for h in headers)), 5)
+        self.assertEqual(unpack_kdf(headers[0].kdf)[1], KDF_PARAMS)
+        for c in ciphertexts:
+            self.assertEqual(decrypt(model, "baz", c), "10")
+        self.assertEqual(KEY_CACHE.keys.misses, misses + 1)
+
+    def test_version_1(self):
+        """ Version 1 containers hash the key with sha256 and have no salt. """
+        model = mock_model()
+        iv = b'\x00' * AES.block_size
+        encoded = encode(model, "1", AES.block_size)
+        encrypted = AES.new(sha256(b'foo').digest(), AES.MODE_CFB, iv).encrypt(encoded)
+        ciphertext = bytearray(pack_container(model.fingerprint, iv, [encrypted]))
+        ciphertext[4] = 1 # Version
+        del ciphertext[6 + 32 + 1 + AES.block_size] # kdf_length
+        self.assertEqual(decrypt(model, "foo", bytes(ciphertext)), "10")
+
+    def test_legacy(self):
+        """ Ciphertexts from before containers are the iv, then the payload. """
+        model = mock_model()
+        iv = b'\x01' * AES.block_size
+        encoded = encode(model, "1", AES.block_size)
+        encrypted = AES.new(sha256(b'foo').digest(), AES.MODE_CFB, iv).encrypt(encoded)
+        self.assertEqual(decrypt(model, "foo", iv + encrypted), "10")
+        self.assertEqual(decrypt_candidates(model, [("foo", iv + encrypted)]), ["10"])
+
+        with self.assertRaises(ValueError):
+            decrypt(model, "foo", iv[:5])
+
+    def test_segments(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        model = mock_model()
+        message = "".join(choice("01") for _ in range(100)) + model.config.model.boundary
+
+        ciphertext = encrypt_segments(model, "foo", message, 10)
+        self.assertTrue(read_header(BytesIO(ciphertext)).flags & SEGMENTED)
+        self.assertEqual(decrypt(model, "foo", ciphertext), message)
+        self.assertEqual(decrypt(model, "foo", ciphertext, processes=2), message)
+        self.assertNotEqual(decrypt(model, "bar", ciphertext), message)
+
+        results = decrypt_candidates(model, [("foo", ciphertext), ("foo", encrypt(model, "foo", "1"))])
+        self.assertEqual(results, [message, "10"])
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from io import StringIO
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from evaluation import Evaluator, evaluate, expected_padding_trials, _steps
+from mock_model import mock_model, config
+from ngram import NGramModel
+from ngram_tests import ngram_config
+
+class TestEvaluation(unittest.TestCase):
+
+    def test_uniform(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        report = evaluate(mock_model(cfg), "0120120120", k=1)
+
+        self.assertEqual(report.tokens, 8)
+        self.assertAlmostEqual(report.cross_entropy, np.log(3))
+        self.assertAlmostEqual(report.bits_per_character, np.log2(3))
+        self.assertAlmostEqual(report.accuracy, 3 / 8) # Ties go to '0'
+        self.assertAlmostEqual(report.top_k_accuracy, 1.0)
+        self.assertAlmostEqual(report.boundary_accuracy, 1.0)
+        self.assertGreaterEqual(report.expected_padding_trials, 1.0)
+
+    def test_expected_padding_trials(self):
+        """ Note: The estimate is sampled, but should always pass. """
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        model = mock_model(cfg)
+        windows = np.zeros((4096, 2), dtype=np.int64)
+
+        # Each step ends the token with probability 1/3, so a token is long
+        # enough for a block that needs f more tokens with probability
+        # (2/3)^(f-1), for f from 1 to 4.
+        expected = np.mean([1.5 ** (f - 1) for f in range(1, 5)])
+        self.assertAlmostEqual(expected_padding_trials(model, windows, 4), expected, delta=0.2)
+        self.assertEqual(expected_padding_trials(model, windows, 1), 1.0)
+        self.assertTrue(np.isnan(expected_padding_trials(model, windows[:0], 4)))
+
+    def test_blocks(self):
+        data = "0120120120120121201200120012"
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+            with redirect_stdout(StringIO()):
+                model.train(data)
+
+            whole = evaluate(model, data, k=2, batch_size=3)
+            evaluator = Evaluator(model, k=2, batch_size=5)
+            for (start, end) in [(0, 2), (2, 2), (2, 3), (3, 19), (19, len(data))]:
+                evaluator.update(data[start:end])
+            blocks = evaluator.report()
+
+        self.assertEqual(whole.tokens, len(data) - 4)
+        self.assertLess(whole.cross_entropy, np.log(3))
+        for field in ['tokens', 'cross_entropy', 'bits_per_character', 'accuracy', 'top_k_accuracy', 'boundary_accuracy']:
+            self.assertAlmostEqual(getattr(whole, field), getattr(blocks, field))
+
+    def test_empty(self):
+        report = evaluate(mock_model(), "")
+        self.assertEqual(report.tokens, 0)
+        self.assertTrue(np.isnan(report.cross_entropy))
+        self.assertTrue(np.isnan(report.expected_padding_trials))
+
+    def test_steps(self):
+        ends = np.array([False, True, False, False, True])
+        self.assertEqual(_steps(ends, 0).tolist(), [1, 0, 1, 2, 0])
+        self.assertEqual(_steps(ends, 3).tolist(), [4, 0, 1, 2, 0])
@@ -0,0 +1,87 @@
+import unittest
+from threading import Event, Thread
+from hosting import ModelHost, warm_up
+from util.metrics import MODEL_BYTES
+from mock_model import MockModel, DEFAULT_CONFIG
+from config import Config
+
+def model(version):
+    return MockModel(Config(DEFAULT_CONFIG), fingerprint=bytes([version]) * 32)
+
+def reported():
+    return set(labels['fingerprint'] for (_, labels, _) in MODEL_BYTES.samples())
+
+class TestHosting(unittest.TestCase):
+
+    def test_swap(self):
+        (old, new) = (model(1), model(2))
+        host = ModelHost(old)
+        self.assertIs(host.current, old)
+        self.assertIn(old.fingerprint.hex(), reported())
+
+        host.swap(new)
+        self.assertIs(host.current, new)
+        # Nothing was using the old model, so it's released right away.
+        self.assertEqual(host.fingerprints(), [new.fingerprint])
+        self.assertTrue(host.drain(0))
+        self.assertNotIn(old.fingerprint.hex(), reported())
+        self.assertIn(new.fingerprint.hex(), reported())
+
+        with host.acquire(old.fingerprint) as acquired:
+            self.assertIs(acquired, new)
+
+    def test_drain(self):
+        (old, new) = (model(3), model(4))
+        host = ModelHost(old)
+
+        with host.acquire() as in_flight:
+            host.swap(new)
+            self.assertIs(in_flight, old)
+            self.assertEqual(host.fingerprints(), [new.fingerprint, old.fingerprint])
+            self.assertFalse(host.drain(0))
+
+            # New requests go to the new model, and requests for the old
+            # model's fingerprint are still routed to it.
+            with host.acquire() as acquired:
+                self.assertIs(acquired, new)
+            with host.acquire(old.fingerprint) as acquired:
+                self.assertIs(acquired, old)
+            self.assertIn(old.fingerprint.hex(), reported())
+
+        self.assertTrue(host.drain(0))
+        self.assertEqual(host.fingerprints(), [new.fingerprint])
+        self.assertNotIn(old.fingerprint.hex(), reported())
+
+    def test_drain_waits(self):
+        (old, new) = (model(5), model(6))
+        host = ModelHost(old)
+        (acquired, finish) = (Event(), Event())
+
+        def request():
+            with host.acquire():
+                acquired.set()
+                finish.wait()
+
+        thread = Thread(target=request)
+        thread.start()
+        acquired.wait()
+        host.swap(new)
+
+        Thread(target=finish.set).start()
+        self.assertTrue(host.drain(5))
+        thread.join()
+
+    def test_same_fingerprint(self):
+        """ Reloading weights that didn't change keeps reporting them. """
+        (old, new) = (model(7), model(7))
+        host = ModelHost(old)
+        host.swap(new)
+        self.assertIs(host.current, new)
+        self.assertIn(new.fingerprint.hex(), reported())
+
+    def test_warm_up(self):
+        old = model(8)
+        self.assertIs(warm_up(old), old)
+
+if __name__ == '__main__':
+    unittest.main()
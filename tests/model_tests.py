@@ -1,7 +1,14 @@
 import unittest
+from io import StringIO
+from contextlib import redirect_stdout
 from random import choice
+from os import listdir
+from os.path import join
+from tempfile import TemporaryDirectory
 from encoding import encode, decode
-from mock_model import mock_model, config
+from mock_model import mock_model, config, MockModel
+from config import Config
+from util.checkpoints import load_state
 
 class TestModel(unittest.TestCase):
 
@@ -18,6 +25,18 @@ class TestModel(unittest.TestCase):
         # Ensure we're normalizing probabilities
         self.assertEqual(result.tolist(), [0.5, 0.5])
 
+    def test_predict_batch(self):
+        cfg = config()
+        cfg['model']['alphabet'] = "01"
+        model = mock_model(cfg)
+
+        self.assertEqual(model.predict_batch([]), [])
+
+        result = model.predict_batch(["001", "110"])
+        self.assertEqual(model.model.last_sequence.tolist(), [[[True, False], [True, False], [False, True]],
+                                                              [[False, True], [False, True], [True, False]]])
+        self.assertEqual([r.tolist() for r in result], [[0.5, 0.5], [0.5, 0.5]])
+
     def test_sample(self):
         model = mock_model()
 
@@ -31,6 +50,30 @@ class TestModel(unittest.TestCase):
         # Could in theory get a sequence of all '0's or something though.
         self.assertEqual(set(model.config.model.alphabet), set(sequence))
 
+    def test_sample_tokens(self):
+        """ Samples are measured in characters, not tokens. """
+        cfg = config()
+        cfg['model']['alphabet'] = ['0', '1', '2', '12', '1110']
+        model = mock_model(cfg)
+
+        self.assertEqual(len(model.sample(25)), 25)
+        self.assertEqual([len(s) for s in model.sample_many(3, 25)], [25] * 3)
+
+    def test_sample_many(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 3
+        model = mock_model(cfg)
+
+        self.assertEqual(list(model.sample_many(0, 10)), [])
+
+        samples = list(model.sample_many(5, 20, batch_size=2))
+        self.assertEqual([len(s) for s in samples], [20] * 5)
+        self.assertEqual(set(model.config.model.alphabet), set(''.join(samples)))
+        self.assertEqual(len(model.model.last_sequence), 1) # The last batch
+
+        samples = list(model.sample_many(5, 20, batch_size=2, processes=2))
+        self.assertEqual([len(s) for s in samples], [20] * 5)
+
     def test_translations(self):
         cfg = config()
         cfg['transformations']['translate'] = ["ab", "01"]
@@ -55,5 +98,105 @@ class TestModel(unittest.TestCase):
         cfg['transformations']['translate'] = ["01", "ab"]
         cfg['transformations']['substitutions'] = [["a", "aa"], ["b", "bb"]]
         model = mock_model(cfg)
-        with self.assertRaises(Exception):
+        with self.assertRaises(ValueError):
             model.transform("0101")
+
+    def test_train_parallel(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        cfg['training'].update({'validation_split': 0.0, 'batch_size': 2, 'epochs': 2,
+                                'workers': 2, 'sync_steps': 1})
+
+        with TemporaryDirectory() as directory:
+            cfg['model']['weights_file'] = join(directory, 'weights')
+            model = mock_model(cfg)
+
+            # 8 windows are split between 2 workers. Each round, both workers
+            # train on one batch of 2 windows and their weights are averaged.
+            with redirect_stdout(StringIO()):
+                model.train("0120120120")
+
+        self.assertEqual(model.model.get_weights()[0].tolist(), [8.0])
+
+    def test_train_checkpoints(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        cfg['training'].update({'validation_split': 0.2, 'batch_size': 2, 'epochs': 4,
+                                'keep_checkpoints': 2, 'sample_length': 0})
+
+        with TemporaryDirectory() as directory:
+            cfg['model']['weights_file'] = join(directory, 'weights')
+            model = mock_model(cfg)
+            with redirect_stdout(StringIO()) as output:
+                model.train("0120120120")
+
+            files = sorted(listdir(directory))
+            with open(join(directory, 'weights'), 'rb') as latest:
+                saved = latest.read()
+
+        self.assertEqual(files, ['weights', 'weights.2', 'weights.3', 'weights.state'])
+        self.assertEqual(saved, model.model.get_weights()[0].tobytes())
+        self.assertNotIn("Sampling model", output.getvalue())
+
+    def test_train_resume(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        cfg['training'].update({'validation_split': 0.0, 'epochs': 4, 'sample_length': 0})
+
+        class PreemptedModel(MockModel):
+            def _start_epoch(self, epoch):
+                if epoch == 2:
+                    raise KeyboardInterrupt()
+
+        with TemporaryDirectory() as directory:
+            cfg['model']['weights_file'] = join(directory, 'weights')
+            with redirect_stdout(StringIO()):
+                with self.assertRaises(KeyboardInterrupt):
+                    PreemptedModel(Config(cfg)).train("0120120120")
+                self.assertEqual(int(load_state(join(directory, 'weights.state'))['epoch']), 1)
+
+                with self.assertRaises(ValueError):
+                    mock_model(cfg).train("0000000000", resume=True)
+
+                # As if the weights were replaced, but not the state.
+                weights = join(directory, 'weights')
+                with open(weights, 'rb') as f:
+                    saved = f.read()
+                with open(weights, 'wb') as f:
+                    f.write(saved[::-1] + b'\x00')
+                with self.assertRaises(ValueError):
+                    mock_model(cfg).train("0120120120", resume=True)
+                with open(weights, 'wb') as f:
+                    f.write(saved)
+
+                model = mock_model(cfg)
+                model.train("0120120120", resume=True)
+                state = load_state(join(directory, 'weights.state'))
+
+        # The optimizer's state carried over, so it has seen all 4 epochs.
+        self.assertEqual(model.model.optimizer.get_weights()[0].tolist(), [4.0])
+        self.assertEqual(int(state['epoch']), 3)
+
+    def test_train_incremental(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        cfg['training'].update({'validation_split': 0.0, 'epochs': 2, 'sample_length': 0})
+
+        with TemporaryDirectory() as directory:
+            cfg['model']['weights_file'] = join(directory, 'weights')
+            with redirect_stdout(StringIO()):
+                with self.assertRaises(ValueError):
+                    mock_model(cfg).train("0120120120", incremental=True)
+
+                mock_model(cfg).train("0120120120")
+                with self.assertRaises(ValueError):
+                    mock_model(cfg).train("0120120120", incremental=True)
+
+                model = mock_model(cfg)
+                model.train("0120120120012", incremental=True)
+                state = load_state(join(directory, 'weights.state'))
+
+        # Only the 3 windows ending in the new data are trained on.
+        self.assertEqual(model.model.get_weights()[0].tolist(), [6.0])
+        self.assertEqual((int(state['epoch']), int(state['offset']), int(state['length'])), (3, 10, 13))
+
@@ -0,0 +1,135 @@
+import unittest
+import numpy as np
+from io import StringIO
+from os.path import join
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from config import Config
+from encoding import encode, decode
+from ngram import NGramModel, _count, _context_keys
+from mock_model import config
+from util.context import Context
+from parallel import map_with_model
+from model import load_model, save_bundle
+
+def ngram_config(directory, order=2):
+    cfg = config()
+    cfg['model'].update({'backend': 'ngram', 'order': order, 'sequence_length': 4,
+                         'weights_file': join(directory, 'table')})
+    cfg['training']['validation_split'] = 0.0
+    return Config(cfg)
+
+def _shared_prediction(model, sequence):
+    return (model.predict_raw(sequence).tolist(), model.model.flags.writeable, model.fingerprint)
+
+class TestNGram(unittest.TestCase):
+
+    def test_context_keys(self):
+        # Alphabet of 3, so digits are base 4 and shifted by one.
+        keys = _context_keys(np.array([0, 1, 2]), 3, 2)
+        self.assertEqual(keys.tolist(), [2 * 1 + 1 * 4])
+        self.assertEqual(_context_keys(np.array([0, 1]), 3, 0).tolist(), [0, 0])
+
+    def test_count(self):
+        table = _count(np.array([0, 1, 0, 1]), 3, 1)
+        self.assertEqual(table['key'].tolist(), [0, 1, 2])
+        self.assertEqual(table['counts'].tolist(), [[2, 2, 0], [0, 2, 0], [1, 0, 0]])
+
+    def test_predict(self):
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+
+            # Untrained, every prediction is uniform.
+            self.assertTrue(np.allclose(model.predict_raw("0120"), [1/3] * 3))
+
+            with redirect_stdout(StringIO()):
+                model.train("0120120120120120")
+            probs = model.predict_raw("0120")
+
+            # The table is memory-mapped when the model is loaded.
+            loaded = NGramModel(ngram_config(directory))
+            self.assertIsInstance(loaded.model, np.memmap)
+            self.assertTrue(np.allclose(loaded.predict_raw("0120"), probs))
+
+        self.assertEqual(np.argmax(probs), 1)
+        self.assertAlmostEqual(sum(probs), 1.0)
+        self.assertTrue(all(p > 0 for p in probs))
+
+        context = Context(model.config.model.alphabet, 4, "0120")
+        self.assertTrue(np.allclose(model.predict_raw(context), probs))
+
+        batch = model.predict_batch(["0120", "1201"], 1.0)
+        self.assertTrue(np.allclose(batch[0], probs))
+        self.assertEqual(np.argmax(batch[1]), 2)
+
+        with self.assertRaises(ValueError):
+            model.predict_raw("01a")
+
+    def test_encoding(self):
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+            with redirect_stdout(StringIO()):
+                model.train("0120120120120120")
+
+            for message in ["0", "120", "2112010"]:
+                self.assertEqual(decode(model, encode(model, message)), message)
+
+    def test_shared_weights(self):
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+            with redirect_stdout(StringIO()):
+                model.train("0120120120120120")
+
+            sequences = ["0120", "1201", "2012"]
+            results = map_with_model(model, _shared_prediction, sequences, processes=2)
+
+        # Workers use the table from shared memory, read-only, in place.
+        for (sequence, (probs, writeable, fingerprint)) in zip(sequences, results):
+            self.assertTrue(np.allclose(probs, model.predict_raw(sequence)))
+            self.assertFalse(writeable)
+            self.assertEqual(fingerprint, model.fingerprint)
+
+    def test_table_dtype(self):
+        """ Tables with integer counts aren't misread as fractional ones. """
+        with TemporaryDirectory() as directory:
+            cfg = ngram_config(directory)
+            table = np.zeros(1, dtype=[('key', '<i8'), ('counts', '<u4', (3,))])
+            with open(cfg.model.weights_file, 'wb') as f:
+                np.save(f, table)
+
+            with self.assertRaises(ValueError):
+                NGramModel(cfg)
+
+    def test_bundle(self):
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+            with redirect_stdout(StringIO()):
+                model.train("0120120120120120")
+
+            path = join(directory, 'model.bundle')
+            content_hash = save_bundle(model, path)
+            bundled = load_model(path)
+
+            self.assertIsInstance(bundled, NGramModel)
+            self.assertEqual(bundled.fingerprint, content_hash)
+            self.assertEqual(bundled.config.model._replace(weights_file=None),
+                             model.config.model._replace(weights_file=None))
+            self.assertFalse(bundled.model.flags.writeable)
+            self.assertTrue(np.allclose(bundled.predict_raw("0120"), model.predict_raw("0120")))
+            self.assertEqual(decode(bundled, encode(bundled, "2112010")), "2112010")
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            with self.assertRaises(ValueError):
+                bundled.train("0120")
+            with self.assertRaises(ValueError):
+                bundled.train_targets([], np.zeros((0, 3)), 0)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+            with open(path, 'r+b') as f:
+                f.seek(-1, 2)
+                f.write(bytes([data[-1] ^ 0xff]))
+            with self.assertRaises(ValueError):
+                load_model(path)
+            load_model(path, verify=False)
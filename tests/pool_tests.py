@@ -0,0 +1,63 @@
+import unittest
+from time import sleep
+from encoding import encode, decode
+from encryption import encrypt, decrypt
+from pool import InitializationPool
+from mock_model import mock_model, config
+
+class TestPool(unittest.TestCase):
+
+    def model(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 5
+        cfg['encoding']['normalizing_length'] = 5
+        cfg['encoding']['priming_length'] = 5
+        return mock_model(cfg)
+
+    def test_fill(self):
+        model = self.model()
+        pool = InitializationPool(model, size=4)
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.fill(2), 2)
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.fill(), 2)
+        self.assertEqual(len(pool), 4)
+        self.assertEqual(pool.fill(), 0)
+
+    def test_single_use(self):
+        model = self.model()
+        pool = InitializationPool(model, size=8)
+        pool.fill()
+
+        # Pairs are removed when taken and never handed out twice.
+        pairs = [pool.get() for _ in range(8)]
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(len(set(tuple(weights) for (weights, _) in pairs)), 8)
+
+        # An empty pool generates inline.
+        (weights, sequence) = pool.get()
+        self.assertEqual(len(weights), 15)
+
+    def test_background_refill(self):
+        model = self.model()
+        pool = InitializationPool(model, size=4)
+        pool.start()
+        for _ in range(100):
+            if len(pool) == 4:
+                break
+            sleep(0.01)
+        pool.stop()
+        self.assertEqual(len(pool), 4)
+
+    def test_encoding_with_pool(self):
+        model = self.model()
+        pool = InitializationPool(model, size=4)
+        pool.fill()
+
+        message = "1201" + model.config.model.boundary
+        self.assertEqual(decode(model, encode(model, message, pool=pool)), message)
+        self.assertEqual(decrypt(model, "foo", encrypt(model, "foo", message, pool=pool)), message)
+        self.assertEqual(len(pool), 2)
+
+        with self.assertRaises(ValueError):
+            encode(self.model(), message, pool=pool)
@@ -0,0 +1,105 @@
+import json
+import unittest
+from threading import Thread
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from service import Service
+from telemetry import Telemetry
+from util.metrics import OPERATION_SECONDS
+from config import Config
+from mock_model import MockModel, DEFAULT_CONFIG
+
+class TestService(unittest.TestCase):
+
+    def setUp(self):
+        self.versions = []
+        self.service = Service(self.load, telemetry=Telemetry())
+        self.server = self.service.server(0)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%s' % (self.server.server_address[1])
+
+    def load(self):
+        """ Loads a model with a new fingerprint each time, as if it had been
+        retrained. """
+        self.versions.append(MockModel(Config(DEFAULT_CONFIG), fingerprint=bytes([len(self.versions)]) * 32))
+        return self.versions[-1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, path, body):
+        request = Request(self.url + path, json.dumps(body).encode('utf-8'),
+                          {'Content-Type': 'application/json'})
+        with urlopen(request) as response:
+            return json.loads(response.read())
+
+    def assertStatus(self, status, path, body=None):
+        with self.assertRaises(HTTPError) as context:
+            if body == None:
+                urlopen(self.url + path)
+            else:
+                self.post(path, body)
+        self.assertEqual(context.exception.code, status)
+
+    def test_ready(self):
+        self.assertStatus(503, '/ready')
+        self.assertStatus(503, '/encrypt', {'key': "foo", 'plaintext': "10"})
+
+        self.service.warm_up()
+        with urlopen(self.url + '/ready') as response:
+            self.assertEqual(response.status, 200)
+        with urlopen(self.url + '/metrics') as response:
+            self.assertIn('menc_model_weight_bytes{fingerprint="%s"}' % (self.service.model.fingerprint.hex()),
+                          response.read().decode('utf-8'))
+
+    def test_requests(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        self.service.warm_up()
+
+        encrypted = self.post('/encrypt', {'key': "foo", 'plaintext': "1010"})
+        self.assertEqual(encrypted['stats']['tokens'], 4)
+        self.assertEqual(self.service.telemetry.messages, 1)
+        decrypted = self.post('/decrypt', {'key': "foo", 'ciphertext': encrypted['ciphertext']})
+        self.assertEqual(decrypted['plaintext'], "1010")
+
+        sampled = OPERATION_SECONDS.histogram('sample').count
+        samples = self.post('/sample', {'size': 5, 'count': 3})['samples']
+        self.assertEqual(len(samples), 3)
+        self.assertEqual(OPERATION_SECONDS.histogram('sample').count, sampled + 1)
+
+        self.assertStatus(400, '/encrypt', {'plaintext': "10"})
+        self.assertStatus(400, '/encrypt', {'key': "foo", 'plaintext': "hello"})
+        self.assertStatus(400, '/sample', {'size': "five"})
+        self.assertStatus(404, '/missing', {})
+
+    def test_reload(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        self.service.warm_up()
+        (old, encrypted) = (self.service.model, self.post('/encrypt', {'key': "foo", 'plaintext': "1010"}))
+        self.assertEqual(encrypted['fingerprint'], old.fingerprint.hex())
+
+        with self.service.host.acquire():
+            # While the old model is in use, its ciphertexts are decrypted
+            # with it.
+            reloaded = self.post('/reload', {})
+            self.assertEqual(reloaded['fingerprint'], self.service.model.fingerprint.hex())
+            self.assertIsNot(self.service.model, old)
+            decrypted = self.post('/decrypt', {'key': "foo", 'ciphertext': encrypted['ciphertext']})
+            self.assertEqual(decrypted['plaintext'], "1010")
+
+        # Once it's drained, it's released.
+        self.assertTrue(self.service.host.drain(5))
+        self.assertStatus(400, '/decrypt', {'key': "foo", 'ciphertext': encrypted['ciphertext']})
+        encrypted = self.post('/encrypt', {'key': "foo", 'plaintext': "1010"})
+        self.assertEqual(encrypted['fingerprint'], self.service.model.fingerprint.hex())
+
+    def test_failed_reload(self):
+        self.service.warm_up()
+        model = self.service.model
+        self.service._load = lambda: MockModel(Config({}))
+        self.assertStatus(500, '/reload', {})
+        self.assertIs(self.service.model, model)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from telemetry import Telemetry, PredictionCounter
+from util.metrics import Registry
+from encoding import encode_with_stats
+from mock_model import mock_model
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_telemetry(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        model = mock_model()
+        telemetry = Telemetry()
+        for message in ["", "1", "12", "120" * 10]:
+            (_, stats) = encode_with_stats(model, message)
+            telemetry.observe(stats)
+
+        snapshot = telemetry.snapshot()
+        self.assertEqual(telemetry.messages, 4)
+        self.assertEqual(snapshot['tokens'].count, 4)
+        self.assertEqual(snapshot['tokens'].sum, 1 + 2 + 3 + 30)
+        # The empty message has no expansion ratio.
+        self.assertEqual(snapshot['expansion_ratio'].count, 3)
+        self.assertEqual(snapshot['padding_trials'].count, 4)
+        self.assertGreaterEqual(snapshot['padding_trials'].sum, 4)
+
+        telemetry = Telemetry({'tokens': [10]})
+        telemetry.observe(stats)
+        self.assertEqual(list(telemetry.snapshot()), ['tokens'])
+
+    def test_registry(self):
+        model = mock_model()
+        registry = Registry()
+        telemetry = Telemetry({'tokens': [10], 'expansion_ratio': [8]}, registry)
+        telemetry.observe(encode_with_stats(model, "120")[1])
+
+        rendered = registry.render()
+        self.assertIn('# TYPE menc_message_tokens histogram', rendered)
+        self.assertIn('menc_message_tokens_bucket{le="10"} 1', rendered)
+        self.assertIn('menc_message_tokens_sum 3', rendered)
+        self.assertIn('menc_message_expansion_ratio_count 1', rendered)
+        with self.assertRaises(ValueError):
+            Telemetry({'tokens': [10]}, registry)
+
+    def test_prediction_counter(self):
+        model = mock_model()
+        counter = PredictionCounter(model)
+        counter.predict_raw([])
+        counter.predict_batch_raw([[], []])
+        counter.predict_windows(np.zeros((3, 0), dtype=np.int64))
+        self.assertEqual(counter.predictions, 6)
+        counter.predict([])
+        counter.predict_batch([[], []])
+        self.assertEqual(counter.predictions, 9)
+        self.assertIs(counter.config, model.config)
+        self.assertEqual(counter.tokenize("012"), model.tokenize("012"))
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+from io import StringIO
+from os.path import join
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from encoding import encode, decode, encode_segments, decode_segments
+from model import load_model
+from ngram import NGramModel
+from ngram_tests import ngram_config
+from tracing import TraceRecorder, TraceModel
+
+class TestTracing(unittest.TestCase):
+
+    def test_replay(self):
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+            with redirect_stdout(StringIO()):
+                model.train("0120120120120120")
+
+            recorder = TraceRecorder(model)
+            encoded = encode(recorder, "2112010")
+            self.assertEqual(decode(recorder, encoded), "2112010")
+            self.assertGreater(len(recorder), 0)
+            self.assertGreater(recorder.seconds, 0.0)
+            self.assertEqual(recorder.transform("012"), "012")
+
+            path = join(directory, 'model.trace')
+            recorder.save(path)
+            trace = load_model(path)
+
+            self.assertIsInstance(trace, TraceModel)
+            self.assertEqual(trace.config.model.backend, 'trace')
+            self.assertEqual(trace.fingerprint, model.fingerprint)
+
+            # Replaying the recorded run never touches the n-gram model.
+            self.assertEqual(decode(trace, encoded), "2112010")
+            self.assertEqual((trace.hits > 0, trace.misses), (True, 0))
+            for row in trace.model:
+                window = [model.config.model.alphabet[i] for i in row['window'] if i >= 0]
+                self.assertTrue(np.allclose(trace.predict_raw(window), model.predict_raw(window)))
+            self.assertEqual(trace.misses, 0)
+
+
+            message = "0" * 50 + "12" * 20 + "0"
+            self.assertEqual(decode(trace, encode(trace, message)), message)
+            segments = encode_segments(trace, message, 20, processes=2)
+            self.assertEqual(decode_segments(trace, segments, processes=2), message)
+
+            with self.assertRaises(ValueError):
+                trace.train("0120")
+
+    def test_unrecorded(self):
+        """ Windows that weren't recorded are still given realistic
+        predictions. """
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+            with redirect_stdout(StringIO()):
+                model.train("0120120120120120")
+
+            recorder = TraceRecorder(model)
+            recorder.predict_raw("0120")
+            path = join(directory, 'model.trace')
+            recorder.save(path)
+            trace = load_model(path)
+
+            probs = trace.predict_raw("2222")
+            self.assertEqual((trace.hits, trace.misses), (0, 1))
+            self.assertTrue(np.allclose(probs, model.predict_raw("0120")))
+
+    def test_empty(self):
+        with TemporaryDirectory() as directory:
+            model = NGramModel(ngram_config(directory))
+            path = join(directory, 'model.trace')
+            TraceRecorder(model).save(path)
+            trace = load_model(path)
+
+        self.assertTrue(np.allclose(trace.predict_raw("0120"), [1/3] * 3))
+        self.assertEqual(trace.misses, 1)
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from util.batching import windows, streams
+
+class TestBatching(unittest.TestCase):
+
+    def test_windows(self):
+        (X, y) = windows(np.arange(5), 2)
+        self.assertEqual(X.tolist(), [[0, 1], [1, 2], [2, 3]])
+        self.assertEqual(y.tolist(), [2, 3, 4])
+
+    def test_streams(self):
+        batches = [(X.tolist(), y.tolist()) for (X, y) in streams(np.arange(9), 2, 2)]
+        self.assertEqual(batches, [([[0, 1], [4, 5]], [[1, 2], [5, 6]]),
+                                   ([[2, 3], [6, 7]], [[3, 4], [7, 8]])])
+
+        # Incomplete batches are dropped
+        batches = [X.tolist() for (X, _) in streams(np.arange(10), 3, 2)]
+        self.assertEqual(batches, [[[0, 1], [3, 4], [6, 7]]])
+
+        self.assertEqual(list(streams(np.arange(0), 2, 2)), [])
+        self.assertEqual(list(streams(np.arange(3), 4, 1)), [])
+
+        with self.assertRaises(ValueError):
+            list(streams(np.arange(9), 0, 2))
+
+    def test_stream_continuity(self):
+        """ Each row continues the same row of the previous batch, and every
+        target is the value following its input. """
+        encoded = np.arange(1000)
+        previous = None
+        for (X, y) in streams(encoded, 7, 11):
+            self.assertEqual(X.shape, (7, 11))
+            self.assertEqual((X + 1).tolist(), y.tolist())
+            if previous is not None:
+                self.assertEqual((previous[:, -1] + 1).tolist(), X[:, 0].tolist())
+            previous = X
+
+    def test_one_hot_streams(self):
+        encoded = np.eye(3, dtype=np.bool)[[0, 1, 2, 0, 1, 2, 0]]
+        (X, y) = next(streams(encoded, 2, 3))
+        self.assertEqual(X.shape, (2, 3, 3))
+        self.assertEqual(y.shape, (2, 3, 3))
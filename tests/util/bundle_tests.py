@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+from os.path import join
+from tempfile import TemporaryDirectory
+from util.bundle import write_bundle, read_bundle, is_bundle
+
+CONFIG = {'model': {'alphabet': ['0', '1', '2', '12'], 'nodes': 4}}
+
+def arrays():
+    table = np.zeros(3, dtype=[('key', '<i8'), ('counts', '<f4', (2,))])
+    table['key'] = [1, 2, 3]
+    table['counts'][1] = [0.5, 2.0]
+    return [np.arange(6, dtype=np.float32).reshape((2, 3)), np.zeros((0, 2)), table, np.eye(3)[:, 1]]
+
+class TestBundle(unittest.TestCase):
+
+    def test_round_trip(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'model.bundle')
+            content_hash = write_bundle(path, CONFIG, arrays())
+            self.assertTrue(is_bundle(path))
+
+            bundle = read_bundle(path, verify=True)
+            self.assertEqual(bundle.config, CONFIG)
+            self.assertEqual(bundle.content_hash, content_hash)
+            self.assertEqual(len(content_hash), 32)
+            for (expected, actual) in zip(arrays(), bundle.arrays):
+                self.assertEqual(actual.dtype, expected.dtype)
+                self.assertTrue(np.array_equal(actual, expected))
+                self.assertFalse(actual.flags.writeable)
+                self.assertEqual(actual.__array_interface__['data'][0] % 64, 0)
+
+            # The hash only depends on the contents.
+            self.assertEqual(write_bundle(join(directory, 'copy'), CONFIG, arrays()), content_hash)
+            self.assertNotEqual(write_bundle(join(directory, 'other'), CONFIG, arrays()[:2]), content_hash)
+
+    def test_invalid(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'model.bundle')
+            write_bundle(path, CONFIG, arrays())
+            with open(path, 'rb') as f:
+                data = bytearray(f.read())
+
+            data[-1] ^= 0xff
+            with open(path, 'wb') as f:
+                f.write(data)
+            read_bundle(path)
+            with self.assertRaises(ValueError):
+                read_bundle(path, verify=True)
+
+            with open(path, 'wb') as f:
+                f.write(bytes(data[:100]))
+            with self.assertRaises(ValueError):
+                read_bundle(path)
+
+            data[4] = 99 # Version
+            with open(path, 'wb') as f:
+                f.write(data)
+            with self.assertRaises(ValueError):
+                read_bundle(path)
+
+            with open(path, 'w') as f:
+                f.write('{"model": {}}')
+            self.assertFalse(is_bundle(path))
+            with self.assertRaises(ValueError):
+                read_bundle(path)
@@ -0,0 +1,46 @@
+import unittest
+from util.cache import TTLCache
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestCache(unittest.TestCase):
+
+    def test_get(self):
+        cache = TTLCache(max_size=2)
+        self.assertEqual(cache.get('a', lambda: 1), 1)
+        self.assertEqual(cache.get('a', lambda: 2), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction(self):
+        cache = TTLCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a', lambda: None) # 'a' is now most recently used
+        cache.put('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a', lambda: None), 1)
+        self.assertEqual(cache.get('b', lambda: None), None)
+
+    def test_ttl(self):
+        clock = Clock()
+        cache = TTLCache(max_size=2, ttl=10, clock=clock)
+        cache.put('a', 1)
+        clock.now = 9.9
+        self.assertEqual(cache.get('a', lambda: 2), 1)
+        clock.now = 10.0
+        self.assertEqual(cache.get('a', lambda: 2), 2)
+
+    def test_clear(self):
+        cache = TTLCache()
+        cache.put('a', 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            TTLCache(max_size=0)
@@ -0,0 +1,91 @@
+import unittest
+from os import listdir
+from os.path import join
+from tempfile import TemporaryDirectory
+import numpy as np
+from util.checkpoints import Checkpointer, save_state, load_state, matches_weights
+
+def save(weights, path):
+    with open(path, 'w') as f:
+        f.write(str(weights))
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+class TestCheckpoints(unittest.TestCase):
+
+    def test_latest(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'weights')
+            checkpointer = Checkpointer(save, path)
+            for epoch in range(3):
+                checkpointer.checkpoint(epoch, epoch)
+            checkpointer.close()
+
+            self.assertEqual(listdir(directory), ['weights'])
+            self.assertEqual(read(path), '2')
+
+    def test_rotation(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'weights')
+            checkpointer = Checkpointer(save, path, keep=2)
+            losses = [3.0, 1.0, 2.0, 4.0]
+            for (epoch, loss) in enumerate(losses):
+                checkpointer.checkpoint(epoch, epoch * 10, loss)
+            checkpointer.close()
+
+            files = sorted(listdir(directory))
+            self.assertEqual(files, ['weights', 'weights.2', 'weights.3', 'weights.best'])
+            self.assertEqual(read(path), '30')
+            self.assertEqual(read(path + '.best'), '10')
+            self.assertEqual(checkpointer.best_loss, 1.0)
+
+    def test_sample(self):
+        samples = []
+        with TemporaryDirectory() as directory:
+            checkpointer = Checkpointer(save, join(directory, 'weights'), sample=samples.append)
+            checkpointer.checkpoint(0, 'a')
+            checkpointer.checkpoint(1, 'b')
+            checkpointer.close()
+
+        self.assertEqual(samples, ['a', 'b'])
+
+    def test_error(self):
+        def fail(weights, path):
+            raise IOError("disk full")
+
+        with TemporaryDirectory() as directory:
+            checkpointer = Checkpointer(fail, join(directory, 'weights'))
+            checkpointer.checkpoint(0, 'a')
+            with self.assertRaises(IOError):
+                checkpointer.close()
+
+    def test_state(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'weights')
+            checkpointer = Checkpointer(save, path, best_loss=1.0)
+            checkpointer.checkpoint(0, 'a', 2.0, {'epoch': 0})
+            checkpointer.close()
+            state = load_state(path + '.state')
+
+            self.assertEqual(int(state['epoch']), 0)
+            self.assertEqual(float(state['best_loss']), 1.0)
+            self.assertFalse(path + '.best' in listdir(directory))
+
+            # The state goes with the weights it was written with.
+            self.assertTrue(matches_weights(state, path))
+            save('b', path)
+            self.assertFalse(matches_weights(state, path))
+            self.assertFalse(matches_weights({'epoch': 0}, path))
+
+    def test_save_state(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'state')
+            self.assertEqual(load_state(path), None)
+
+            save_state({'epoch': 3, 'weights': np.arange(3)}, path)
+            state = load_state(path)
+
+        self.assertEqual(int(state['epoch']), 3)
+        self.assertEqual(state['weights'].tolist(), [0, 1, 2])
@@ -0,0 +1,43 @@
+import unittest
+from io import BytesIO
+from util.container import pack_container, write_container, read_header, read_chunks, chunked, is_container
+
+FINGERPRINT = bytes(range(32))
+IV = b'\x01' * 16
+
+class TestContainer(unittest.TestCase):
+
+    def test_round_trip(self):
+        for chunks in [[], [b'a'], [b'foo', b'bar'], [b'x' * 1000] * 3]:
+            data = pack_container(FINGERPRINT, IV, chunks)
+            self.assertTrue(is_container(data))
+
+            stream = BytesIO(data)
+            header = read_header(stream)
+            self.assertEqual(header.fingerprint, FINGERPRINT)
+            self.assertEqual(header.iv, IV)
+            self.assertEqual(list(read_chunks(stream)), chunks)
+
+    def test_write_container(self):
+        stream = BytesIO()
+        write_container(stream, FINGERPRINT, IV, [b'foo', b'', b'bar'])
+        self.assertEqual(stream.getvalue(), pack_container(FINGERPRINT, IV, [b'foo', b'bar']))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            pack_container(b'short', IV, [])
+
+        with self.assertRaises(ValueError):
+            read_header(BytesIO(b'NOPE' + pack_container(FINGERPRINT, IV, [])[4:]))
+
+        # Missing terminating chunk
+        data = pack_container(FINGERPRINT, IV, [b'foo'])[:-4]
+        stream = BytesIO(data)
+        read_header(stream)
+        with self.assertRaises(ValueError):
+            list(read_chunks(stream))
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(b'', 2)), [])
+        self.assertEqual(list(chunked(b'abcde', 2)), [b'ab', b'cd', b'e'])
+        self.assertEqual(list(chunked(b'abcd', 2)), [b'ab', b'cd'])
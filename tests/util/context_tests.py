@@ -0,0 +1,38 @@
+import unittest
+from util.context import Context
+
+class TestContext(unittest.TestCase):
+
+    def test_push(self):
+        context = Context("ABC", 3)
+        self.assertEqual(context.values(), [])
+
+        expected = []
+        for value in "ABCCBAAB":
+            context.push(value)
+            expected = (expected + [value])[-3:]
+            self.assertEqual(context.values(), expected)
+            self.assertEqual(len(context), len(expected))
+            self.assertEqual(context.indices().tolist(), ["ABC".index(v) for v in expected])
+            self.assertEqual(context.one_hot().tolist(),
+                             [[v == c for c in "ABC"] for v in expected])
+
+    def test_initial(self):
+        context = Context(['A', 'BC'], 2, ['A', 'BC', 'BC'])
+        self.assertEqual(context.values(), ['BC', 'BC'])
+        self.assertEqual(context.key(), (1, 1))
+
+    def test_views(self):
+        context = Context("AB", 2, "AB")
+        self.assertIsNotNone(context.one_hot().base)
+        self.assertIsNotNone(context.indices().base)
+
+    def test_empty(self):
+        context = Context("AB", 0, "AB")
+        context.push('A')
+        self.assertEqual(context.values(), [])
+        self.assertEqual(context.one_hot().shape, (0, 2))
+
+    def test_invalid_value(self):
+        with self.assertRaises(ValueError):
+            Context("AB", 2, "ABC")
@@ -0,0 +1,50 @@
+import unittest
+from util.kdf import KdfParams, KeyCache, derive_key, pack_kdf, unpack_kdf, SALT_SIZE
+
+PARAMS = KdfParams(n=2**4, r=8, p=1)
+SALT = b'\x01' * SALT_SIZE
+
+class TestKdf(unittest.TestCase):
+
+    def test_derive_key(self):
+        key = derive_key("foo", SALT, PARAMS)
+        self.assertEqual(len(key), 32)
+        self.assertEqual(key, derive_key("foo", SALT, PARAMS))
+        self.assertNotEqual(key, derive_key("bar", SALT, PARAMS))
+        self.assertNotEqual(key, derive_key("foo", b'\x02' * SALT_SIZE, PARAMS))
+        self.assertNotEqual(key, derive_key("foo", SALT, PARAMS._replace(n=2**5)))
+
+    def test_packing(self):
+        self.assertEqual(unpack_kdf(pack_kdf(SALT, PARAMS)), (SALT, PARAMS))
+
+        with self.assertRaises(ValueError):
+            pack_kdf(SALT, PARAMS._replace(n=3))
+
+        with self.assertRaises(ValueError):
+            pack_kdf(b'short', PARAMS)
+
+        with self.assertRaises(ValueError):
+            unpack_kdf(b'')
+
+        # Parameters that need too much memory are rejected.
+        with self.assertRaises(ValueError):
+            unpack_kdf(pack_kdf(SALT, KdfParams(n=2**30, r=8, p=1)))
+
+    def test_key_cache(self):
+        calls = []
+        def derive(password, salt, params):
+            calls.append(password)
+            return derive_key(password, salt, params)
+
+        cache = KeyCache(derive=derive)
+        (salt, key) = cache.encryption_key("foo", PARAMS)
+        self.assertEqual(cache.encryption_key("foo", PARAMS), (salt, key))
+        self.assertEqual(cache.decryption_key("foo", salt, PARAMS), key)
+        self.assertEqual(calls, ["foo"])
+
+        self.assertEqual(cache.decryption_key("bar", salt, PARAMS), derive_key("bar", salt, PARAMS))
+        self.assertEqual(calls, ["foo", "bar"])
+
+        cache.clear()
+        (other_salt, _) = cache.encryption_key("foo", PARAMS)
+        self.assertNotEqual(salt, other_salt)
@@ -1,5 +1,5 @@
 import unittest
-from util.lists import rfind, drop_tail_until, take
+from util.lists import rfind, drop_tail_until, take, split_after
 
 class TestLists(unittest.TestCase):
 
@@ -17,6 +17,12 @@ class TestLists(unittest.TestCase):
         self.assertEqual(drop_tail_until(2, [1, 2, 3]), [1, 2])
         self.assertEqual(drop_tail_until(3, [1, 2, 3]), [1, 2, 3])
 
+    def test_key(self):
+        even = lambda x: x % 2 == 0
+        self.assertEqual(rfind(True, [1, 2, 3, 4, 5], key=even), 3)
+        self.assertEqual(drop_tail_until(True, [1, 2, 3, 5], key=even), [1, 2])
+        self.assertEqual(split_after(True, [1, 2, 3, 4, 5], 1, key=even), [[1, 2], [3, 4], [5]])
+
     def test_take(self):
         self.assertEqual(take(0, []), [])
         self.assertEqual(take(1, []), [])
@@ -26,3 +32,11 @@ class TestLists(unittest.TestCase):
         self.assertEqual(take(3, [1, 2, 3]), [1, 2, 3])
         self.assertEqual(take(4, [1, 2, 3]), [1, 2, 3])
         self.assertEqual(take(-1, [1, 2, 3]), [])
+
+    def test_split_after(self):
+        self.assertEqual(split_after(0, [], 1), [])
+        self.assertEqual(split_after(0, [1, 2], 1), [[1, 2]])
+        self.assertEqual(split_after(0, [0, 0, 1], 1), [[0], [0], [1]])
+        self.assertEqual(split_after(0, [1, 0, 1, 1, 0, 1], 2), [[1, 0], [1, 1, 0], [1]])
+        self.assertEqual(split_after(0, [1, 0, 1, 1, 0], 3), [[1, 0, 1, 1, 0]])
+        self.assertEqual(split_after(0, [1, 0, 1, 1, 0], 5), [[1, 0, 1, 1, 0]])
@@ -1,5 +1,6 @@
 import unittest
-from util.math import log_normalize, scale
+import numpy as np
+from util.math import log_normalize, scale, average_arrays, cross_entropy, kl_divergence, integer_weights
 
 class TestLists(unittest.TestCase):
 
@@ -24,6 +25,55 @@ class TestLists(unittest.TestCase):
         self.assertEqual(scale([0.0, 0.5], 10, 1), [1, 9])
         self.assertEqual(scale([0.0, 0.2, 0.8], 100, 1), [1, 20, 79])
 
+    def test_average_arrays(self):
+        averaged = average_arrays([[np.array([1, 2]), np.array([[0]])],
+                                   [np.array([3, 4]), np.array([[1]])]])
+        self.assertEqual([a.tolist() for a in averaged], [[2, 3], [[0.5]]])
+
+        with self.assertRaises(ValueError):
+            average_arrays([])
+
+    def test_cross_entropy(self):
+        uniform = [[0.5, 0.5], [0.5, 0.5]]
+        self.assertAlmostEqual(cross_entropy(uniform, uniform), np.log(2))
+        self.assertAlmostEqual(cross_entropy([[1.0, 0.0]], [[0.5, 0.5]]), np.log(2))
+        self.assertAlmostEqual(cross_entropy([[1.0, 0.0]], [[1.0, 0.0]]), 0.0)
+
+    def test_kl_divergence(self):
+        self.assertAlmostEqual(kl_divergence([[0.5, 0.5]], [[0.5, 0.5]]), 0.0)
+        self.assertAlmostEqual(kl_divergence([[1.0, 0.0]], [[0.5, 0.5]]), np.log(2))
+        self.assertGreater(kl_divergence([[0.5, 0.5]], [[0.9, 0.1]]), 0.0)
+
+    def test_integer_weights(self):
+        self.assertEqual(integer_weights([0.25, 0.75], 1.0, 100).tolist(), [25, 75])
+        self.assertEqual(integer_weights([0.0, 1.0], 1.0, 100).tolist(), [1, 99])
+        self.assertEqual(integer_weights([0.5, 0.5], 1.0, 3).tolist(), [2, 1])
+
+        # Sparse distributions have probabilities far below 2^-32, which
+        # the high temperatures of late padding trials raise.
+        for concentration in [1.0, 0.3]:
+            probabilities = np.random.dirichlet(np.full(39, concentration))
+            for temperature in [0.25, 1.0, 2.0, 10.0]:
+                weights = integer_weights(probabilities, temperature, 2 ** 32)
+                self.assertEqual(weights.sum(), 2 ** 32)
+                self.assertGreaterEqual(weights.min(), 1)
+                expected = scale(log_normalize(probabilities, temperature), 2 ** 32, lowest=1)
+                self.assertTrue(np.allclose(weights / 2 ** 32, np.asarray(expected) / 2 ** 32, atol=1e-6))
+
+        with self.assertRaises(ValueError):
+            integer_weights([0.5, 0.5], 1.0, 1)
+
+    def test_integer_weights_exact(self):
+        """ The weights are exact integer arithmetic after the probabilities
+        are split into mantissas and exponents, so they're pinned here. Any
+        platform that differs can't decrypt what another encrypted. """
+        self.assertEqual(integer_weights([0.1, 0.2, 0.3, 0.4], 0.75, 2 ** 16).tolist(),
+                         [4617, 11633, 19973, 29313])
+        self.assertEqual(integer_weights([0.001, 0.999, 0.0], 2.0, 2 ** 32).tolist(),
+                         [131719333, 4163247962, 1])
+        self.assertEqual(integer_weights([1e-12, 3e-10, 0.25, 0.75 - 3e-10 - 1e-12], 10.0, 2 ** 32).tolist(),
+                         [134361681, 237677220, 1853827979, 2069100416])
+
     def assertArrayAlmostEqual(self, xs, ys):
         self.assertEqual(len(xs), len(ys))
         for x, y in zip(xs, ys):
@@ -0,0 +1,136 @@
+import unittest
+import numpy as np
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from util.metrics import Counter, Gauge, Histogram, HistogramMetric, Registry, OPERATIONS, OPERATION_SECONDS, PREDICTION_BATCH_SIZE, exponential_buckets, serve_metrics, timed, timed_predictions
+
+class Predictor(object):
+    @timed_predictions
+    def predict_raw(self, sequence):
+        return self.predict_batch_raw([sequence])[0]
+
+    @timed_predictions
+    def predict_batch_raw(self, sequences):
+        return [0.5 for _ in sequences]
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram([1, 2, 4])
+        self.assertTrue(np.isnan(histogram.quantile(0.5)))
+
+        for value in [0.5, 3, 3, 9, 1, np.nan]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 0, 2, 1])
+        self.assertEqual(histogram.cumulative(), [2, 2, 4, 5])
+        self.assertEqual((histogram.count, histogram.sum), (5, 16.5))
+
+        self.assertAlmostEqual(histogram.quantile(0.2), 0.5)
+        self.assertAlmostEqual(histogram.quantile(0.6), 3.0)
+        self.assertAlmostEqual(histogram.quantile(1.0), 4.0) # Above the last bound
+
+        copy = histogram.copy()
+        histogram.observe(1)
+        self.assertEqual(copy.counts, [2, 0, 2, 1])
+
+    def test_exponential_buckets(self):
+        self.assertEqual(exponential_buckets(1, 2, 4), [1, 2, 4, 8])
+        self.assertEqual(exponential_buckets(0.5, 4, 2), [0.5, 2.0])
+
+    def test_render(self):
+        registry = Registry()
+        requests = registry.register(Counter('requests_total', "Requests.", ['path']))
+        memory = registry.register(Gauge('memory_bytes', "Memory\nin use."))
+        latency = registry.register(HistogramMetric('latency_seconds', "Latency.", [0.5, 1]))
+        registry.register(Gauge('answer', "Computed.", ['kind'], fn=lambda: {('"x"',): 42}))
+
+        requests.inc('/ready')
+        requests.inc('/ready', amount=2)
+        memory.set(1.5)
+        latency.observe(0.25)
+        latency.observe(3)
+
+        self.assertEqual(registry.render(), "\n".join([
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{path="/ready"} 3',
+            '# HELP memory_bytes Memory\\nin use.',
+            '# TYPE memory_bytes gauge',
+            'memory_bytes 1.5',
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.5"} 1',
+            'latency_seconds_bucket{le="1"} 1',
+            'latency_seconds_bucket{le="+Inf"} 2',
+            'latency_seconds_sum 3.25',
+            'latency_seconds_count 2',
+            '# HELP answer Computed.',
+            '# TYPE answer gauge',
+            'answer{kind="\\"x\\""} 42',
+        ]) + "\n")
+
+        memory.remove()
+        self.assertNotIn('memory_bytes 1.5', registry.render())
+        self.assertEqual(latency.histogram().count, 2)
+
+        with self.assertRaises(ValueError):
+            registry.register(Counter('requests_total', "Again."))
+        with self.assertRaises(ValueError):
+            requests.inc()
+
+    def test_timed(self):
+        (ok, error) = [_value(OPERATIONS, ('test', outcome)) for outcome in ['ok', 'error']]
+
+        with timed('test'):
+            pass
+        with self.assertRaises(KeyError):
+            with timed('test'):
+                raise KeyError()
+
+        self.assertEqual(_value(OPERATIONS, ('test', 'ok')), ok + 1)
+        self.assertEqual(_value(OPERATIONS, ('test', 'error')), error + 1)
+        self.assertEqual(OPERATION_SECONDS.histogram('test').count, ok + error + 2)
+
+    def test_timed_predictions(self):
+        predictor = Predictor()
+        (calls, predictions) = (OPERATION_SECONDS.histogram('predict').count, PREDICTION_BATCH_SIZE.histogram().sum)
+
+        # `predict_raw` calls `predict_batch_raw`, which isn't reported again.
+        predictor.predict_raw("a")
+        predictor.predict_batch_raw(["a", "b", "c"])
+
+        self.assertEqual(OPERATION_SECONDS.histogram('predict').count, calls + 2)
+        self.assertEqual(PREDICTION_BATCH_SIZE.histogram().sum, predictions + 4)
+
+    def test_serve_metrics(self):
+        registry = Registry()
+        registry.register(Counter('requests_total', "Requests.")).inc()
+        ready = [False]
+        server = serve_metrics(0, ready=lambda: ready[0], registry=registry)
+        url = 'http://127.0.0.1:%s' % (server.server_address[1])
+
+        try:
+            with urlopen(url + '/metrics') as response:
+                self.assertIn('requests_total 1', response.read().decode('utf-8'))
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+            with self.assertRaises(HTTPError) as context:
+                urlopen(url + '/ready')
+            self.assertEqual(context.exception.code, 503)
+            ready[0] = True
+            with urlopen(url + '/ready') as response:
+                self.assertEqual(response.status, 200)
+
+            with self.assertRaises(HTTPError) as context:
+                urlopen(url + '/missing')
+            self.assertEqual(context.exception.code, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+def _value(metric, labels):
+    values = {tuple(l.values()): value for (_, l, value) in metric.samples()}
+    return values.get(labels, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,20 @@
 import unittest
 from random import choice
-from util.modeling import tabulate, recite
-from mock_model import config, mock_model
+from util.modeling import tabulate, recite, recite_many, CachedPredictions
+from config import Config
+from mock_model import config, mock_model, MockModel
+
+class CountingModel(MockModel):
+    """ Counts calls to the underlying model. """
+    calls = 0
+
+    def predict_raw(self, sequence):
+        self.calls += 1
+        return MockModel.predict_raw(self, sequence)
+
+    def predict_batch_raw(self, sequences):
+        self.calls += len(sequences)
+        return MockModel.predict_batch_raw(self, sequences)
 
 class TestModeling(unittest.TestCase):
 
@@ -17,3 +30,47 @@ class TestModeling(unittest.TestCase):
             message = [choice(alphabet) for _ in range(i)]
             result = recite(model, [], tabulate(model, [], message))
             self.assertEqual(message, list(result))
+
+    def test_recite_many(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        cfg = config()
+        cfg['model']['sequence_length'] = 3
+        model = mock_model(cfg)
+        alphabet = model.config.model.alphabet
+
+        self.assertEqual(recite_many(model, [], []), [])
+
+        initials = [list("012"), list("210"), list("000")]
+        messages = [[choice(alphabet) for _ in range(i)] for i in [5, 0, 12]]
+        weights = [list(tabulate(model, init, m)) for (init, m) in zip(initials, messages)]
+        self.assertEqual(recite_many(model, initials, weights), messages)
+
+        # Short initial sequences and models without context
+        recite_many(model, [list("1"), list("2")], [[0, 1], [2]])
+        self.assertEqual(model.model.last_sequence.shape[1], 2)
+        model = mock_model()
+        recite_many(model, [list("012")], [[0, 1, 2]])
+        self.assertEqual(model.model.last_sequence.shape[1], 0)
+
+    def test_cached_predictions(self):
+        cfg = config()
+        cfg['model']['sequence_length'] = 3
+        model = CountingModel(Config(cfg))
+        cached = CachedPredictions(model)
+
+        self.assertEqual(cached.predict("012").tolist(), model.predict("012").tolist())
+        self.assertEqual(cached.predict("012", 2.0).tolist(), model.predict("012", 2.0).tolist())
+        self.assertEqual(model.calls, 3)
+
+        # Tabulating a sequence that has already been recited is free.
+        weights = list(tabulate(model, list("012"), list("1201")))
+        values = list(recite(cached, list("012"), weights, 1.5))
+        calls = model.calls
+        self.assertEqual(list(recite(cached, list("012"), tabulate(cached, list("012"), values))), values)
+        self.assertEqual(model.calls, calls)
+
+        # Batches share the cache, and only predict what's missing once.
+        calls = model.calls
+        batch = cached.predict_batch_raw([list("012"), list("201"), list("201"), list("1201")[-3:]])
+        self.assertEqual(model.calls, calls + 1)
+        self.assertEqual([list(p) for p in batch[:2]], [list(cached.predict_raw("012")), list(model.predict_raw("201"))])
@@ -1,5 +1,5 @@
 import unittest
-from util.packing import pack_ints, unpack_ints
+from util.packing import pack_ints, unpack_ints, unpack_ints_stream, align
 
 class TestPacking(unittest.TestCase):
 
@@ -8,3 +8,24 @@ class TestPacking(unittest.TestCase):
         self.assertEqual(unpack_ints(pack_ints([1])), (1,))
         self.assertEqual(unpack_ints(pack_ints([1, 2])), (1, 2))
         self.assertEqual(unpack_ints(pack_ints([1, 2, 3])), (1, 2, 3))
+
+    def test_packing_sizes(self):
+        for size in range(1, 5):
+            values = [0, 1, 2 ** (8 * size) - 1]
+            packed = pack_ints(values, size)
+            self.assertEqual(len(packed), len(values) * size)
+            self.assertEqual(unpack_ints(packed, size), tuple(values))
+            self.assertEqual(list(unpack_ints_stream([packed[:1], packed[1:]], size)), values)
+
+        with self.assertRaises(Exception):
+            pack_ints([2 ** 24], 3)
+
+    def test_unpack_ints_stream(self):
+        data = pack_ints([1, 2, 3])
+        self.assertEqual(list(unpack_ints_stream([])), [])
+        self.assertEqual(list(unpack_ints_stream([data])), [1, 2, 3])
+        self.assertEqual(list(unpack_ints_stream([data[:1], data[1:7], data[7:]])), [1, 2, 3])
+        self.assertEqual(list(unpack_ints_stream([data[i:i+1] for i in range(len(data))])), [1, 2, 3])
+
+    def test_align(self):
+        self.assertEqual([align(size) for size in [0, 1, 64, 65]], [0, 64, 64, 128])
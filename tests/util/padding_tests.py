@@ -1,9 +1,14 @@
 import unittest
+import numpy as np
 from random import choice
+from threading import Thread
+from os.path import join
+from tempfile import TemporaryDirectory
 from util.packing import BYTES_IN_INT
-from util.padding import pad, unpad
+from util.padding import pad, unpad, tabulate_padded, tabulate_padded_with_report, PaddingStatistics, _first_long_token
+from util.modeling import recite
 from model import Model
-from mock_model import mock_model
+from mock_model import mock_model, config
 
 class TestPadding(unittest.TestCase):
 
@@ -52,3 +57,102 @@ class TestPadding(unittest.TestCase):
         self.assertEqual(unpad(model, "110"), "11")
         self.assertEqual(unpad(model, "0110"), "0")
 
+    def test_unpad_tokens(self):
+        cfg = config()
+        cfg['model']['alphabet'] = ['0', '1', '2', '10', '220']
+        model = mock_model(cfg)
+
+        # Tokens ending in the boundary are boundaries too.
+        self.assertEqual(unpad(model, ['1', '10', '2', '220']), ['1', '10'])
+        self.assertEqual(unpad(model, ['1', '10', '2']), ['1', '10'])
+        self.assertEqual(unpad(model, ['2', '0', '1']), ['2', '0'])
+        self.assertEqual(unpad(model, ['2', '1']), ['2', '1'])
+
+    def test_tabulate_padded(self):
+        """ Test that fused padding / tabulation round-trips.
+
+        Note: This is a non-deterministic test, but should always pass.
+        """
+        cfg = config()
+        cfg['model']['sequence_length'] = 4
+        model = mock_model(cfg)
+        initial = list("0120")
+
+        for message_length in range(0, 10):
+            for blocksize in [BYTES_IN_INT, 4 * BYTES_IN_INT]:
+                message = [choice("012") for _ in range(message_length)] + ['0']
+                weights = tabulate_padded(model, initial, message, blocksize)
+                self.assertEqual((len(weights) * BYTES_IN_INT) % blocksize, 0)
+
+                padded = list(recite(model, initial, weights))
+                self.assertEqual(message, unpad(model, padded))
+
+        (weights, report) = tabulate_padded_with_report(model, initial, list("120"), 4 * BYTES_IN_INT)
+        self.assertEqual(len(weights), 3 + report.length)
+        self.assertGreaterEqual(report.candidates, report.trials)
+        self.assertGreaterEqual(report.predictions, 1)
+        self.assertAlmostEqual(report.novelty, 0.5 * 1.01 ** (report.trials - 1))
+
+    def test_statistics(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        statistics = PaddingStatistics(quantile=0.75)
+        self.assertEqual(statistics.batch_size(3), 1)
+
+        for trial in [0, 2, 2, 9]:
+            statistics.record(3, trial)
+        self.assertEqual(statistics.counts.shape, (4, 10))
+        self.assertEqual(statistics.batch_size(3), 3)
+        self.assertEqual(statistics.batch_size(2), 1)
+
+        # Batches of candidates still pad correctly, and record the trial
+        # that succeeded.
+        model = mock_model()
+        statistics = PaddingStatistics()
+        statistics.record(4, 50)
+        for message_length in range(0, 10):
+            message = [choice("012") for _ in range(message_length)] + ['0']
+            padded = pad(model, [], message, 4 * BYTES_IN_INT, statistics)
+            self.assertEqual((len(padded) * BYTES_IN_INT) % (4 * BYTES_IN_INT), 0)
+            self.assertEqual(message, list(unpad(model, padded)))
+        self.assertEqual(np.sum(statistics.counts), 11)
+
+        # Recording from several threads doesn't lose counts, even while the
+        # counts are resized.
+        statistics = PaddingStatistics()
+        threads = [Thread(target=lambda i=i: [statistics.record(j % 7, i) for j in range(200)]) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(np.sum(statistics.counts), 8 * 200)
+
+    def test_save_statistics(self):
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'weights.padding')
+            statistics = PaddingStatistics(path, b'a')
+            statistics.save() # Nothing to save
+            self.assertEqual(PaddingStatistics(path, b'a').counts.size, 0)
+
+            statistics.record(2, 1)
+            statistics.save()
+            self.assertEqual(PaddingStatistics(path, b'a').counts.tolist(), [[0, 0], [0, 0], [0, 1]])
+            self.assertEqual(PaddingStatistics(path, b'b').counts.size, 0)
+
+    def test_first_long_token(self):
+        """ Note: This is a non-deterministic test, but should always pass. """
+        cfg = config()
+        cfg['model']['sequence_length'] = 2
+        model = mock_model(cfg)
+
+        for _ in range(20):
+            found = _first_long_token(model, list("12"), [1.0] * 8, 3)
+            if found == None:
+                continue
+            (index, token) = found
+            self.assertGreaterEqual(len(token), 3)
+            self.assertEqual(token[-1], '0')
+            self.assertNotIn('0', token[:-1])
+
+        # Every token is long enough.
+        self.assertEqual(_first_long_token(model, [], [1.0, 1.0], 1)[0], 0)
+        self.assertEqual(_first_long_token(model, [], [], 1), None)
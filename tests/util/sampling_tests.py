@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 from util.sampling import choose_choice, choose_weight
 
 class TestSampling(unittest.TestCase):
@@ -13,6 +14,22 @@ class TestSampling(unittest.TestCase):
                 chosen = choose_choice(weight, choices, weights)
                 self.assertEqual(choice, chosen)
 
+    def test_numpy_weights(self):
+        """ This is a non-deterministic round-trip test. """
+        choices = "ABCDE"
+        weights = np.array([1, 2, 0, 4, 5])
+        for choice in "ABDE":
+            for _ in range(10):
+                weight = choose_weight(choice, choices, weights)
+                self.assertEqual(choose_choice(weight, choices, weights), choice)
+                self.assertEqual(choose_choice(weight, choices, list(weights)), choice)
+
+        self.assertEqual(choose_weight("C", choices, weights), None)
+        with self.assertRaises(ValueError):
+            choose_choice(12, choices, weights)
+        with self.assertRaises(ValueError):
+            choose_weight("F", choices, weights)
+
     def test_choose_choice(self):
         # No negative weights
         with self.assertRaises(ValueError):
@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+from util.shared import SharedArrays, attach_arrays
+
+class TestShared(unittest.TestCase):
+
+    def test_attach(self):
+        table = np.zeros(3, dtype=[('key', '<i8'), ('counts', '<f4', (2,))])
+        table['key'] = [1, 2, 3]
+        arrays = [np.arange(5, dtype=np.float32), np.zeros((0, 2)), table, np.eye(3)[:, 1]]
+
+        shared = SharedArrays(arrays)
+        try:
+            (memory, attached) = attach_arrays(shared.handle)
+            self.assertEqual(len(attached), len(arrays))
+            for (expected, actual) in zip(arrays, attached):
+                self.assertEqual(actual.dtype, expected.dtype)
+                self.assertTrue(np.array_equal(actual, expected))
+                self.assertFalse(actual.flags.writeable)
+
+            # Every process sees the same memory.
+            (other, views) = attach_arrays(shared.handle)
+            self.assertEqual(views[0].__array_interface__['data'][0] % 64, 0)
+            del attached, views
+            memory.close()
+            other.close()
+        finally:
+            shared.close()
+
+    def test_empty(self):
+        shared = SharedArrays([])
+        (memory, attached) = attach_arrays(shared.handle)
+        self.assertEqual(attached, [])
+        memory.close()
+        shared.close()
+        shared.close()
@@ -0,0 +1,25 @@
+import unittest
+from util.tokenization import Tokenizer, ends_token, learn_tokens
+
+class TestTokenization(unittest.TestCase):
+
+    def test_tokenize(self):
+        tokenizer = Tokenizer(["A", "B", " ", "AB", "ABA "])
+        self.assertEqual(tokenizer.tokenize(""), [])
+        self.assertEqual(tokenizer.tokenize("ABA AB B"), ["ABA ", "AB", " ", "B"])
+        self.assertEqual(tokenizer.tokenize("ABAB"), ["AB", "AB"])
+
+        with self.assertRaises(ValueError):
+            tokenizer.tokenize("ABC")
+
+    def test_ends_token(self):
+        self.assertTrue(ends_token(" ", " "))
+        self.assertTrue(ends_token("THE ", " "))
+        self.assertFalse(ends_token("TH", " "))
+
+    def test_learn_tokens(self):
+        self.assertEqual(learn_tokens("THE CAT THE HAT ", 2, 4, " "), ["THE ", "AT "])
+
+        # The boundary is only ever the last character of a token.
+        tokens = learn_tokens("A B A B A B ", 10, 4, " ")
+        self.assertTrue(all(" " not in token[:-1] for token in tokens))